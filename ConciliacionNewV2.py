@@ -1,163 +1,215 @@
 import streamlit as st
 import pandas as pd
-import io
+import os
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-# =================================================
-# CREP BCP (.txt)
-# =================================================
-@st.cache_data
-def cargar_txt_crep(archivo_txt):
-    lineas = archivo_txt.read().decode('utf-8').splitlines()
-    registros = []
-
-    for linea in lineas:
-        if linea.startswith('DD'):
-            try:
-                psp_tin = linea[205:217].strip().lstrip("0")
-                monto_raw = linea[73:88].strip()
-                monto = int(monto_raw) / 100 if monto_raw.isdigit() else None
-
-                anio = linea[57:61]
-                mes = linea[61:63]
-                dia = linea[63:65]
-                hora = linea[168:170]
-                minuto = linea[170:172]
-                segundo = linea[172:174]
-
-                fecha_pago = f"{dia}/{mes}/{anio}"
-                hora_pago = f"{hora}:{minuto}:{segundo}"
-                fecha_hora_pago = datetime.strptime(
-                    f"{fecha_pago} {hora_pago}", "%d/%m/%Y %H:%M:%S"
-                )
-
-                nro_operacion = linea[124:130].strip()
-
-                registros.append({
-                    "PSP_TIN": psp_tin,
-                    "Monto": monto,
-                    "Fecha": fecha_pago,
-                    "Hora": hora_pago,
-                    "FechaHora": fecha_hora_pago,
-                    "Nº operación": nro_operacion
-                })
-            except:
-                continue
-
-    df = pd.DataFrame(registros)
-    df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
-    return df.drop_duplicates(subset="PSP_TIN"), True
+from pathlib import Path
+
+from conciliacion import cargadores, trazas
+from conciliacion.almacen import DIR_SNAPSHOTS, hay_snapshot, importar_snapshot, leer_snapshot, version_snapshot
+from conciliacion.cache_disco import Huella, cache, cache_en_disco
+from conciliacion.cargadores import cargar_banco, ventana_banco
+from conciliacion.corridas import EN_CURSO, Corridas
+from conciliacion.cruce import conciliar_pandas
+from conciliacion.exportar import EXTENSION_LISTA, FORMATOS_LISTA, MIME, exportar, lista_psptin
+from conciliacion.grilla import columnas_filtro, filtrar, pagina
+from conciliacion.registro_snapshots import RegistroSnapshots
+from conciliacion.reporte import (
+    diferencias_monto,
+    exportar_paquete,
+    exportar_reporte,
+    hojas_reporte,
+    resumen_conciliacion,
+)
 
 
 # =================================================
-# EECC BCP (.xlsx)
+# HUELLA DE ARCHIVOS SUBIDOS
 # =================================================
-@st.cache_data
-def cargar_excel_bcp(archivo):
-    df = pd.read_excel(archivo, skiprows=7)
-
-    df["Descripción operación"] = df["Descripción operación"].astype(str).str.strip()
-    df["Nº operación"] = df["Nº operación"].astype(str).str.strip()
-    df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce")
-    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
-
-    df["PSP_TIN"] = df["Descripción operación"].str.extract(r"(2\d{11})(?!\d)")
+def huella_subida(archivo):
+    """Huella calculada una vez por subida y guardada en la sesión: los reruns no releen el archivo."""
+    file_id = getattr(archivo, "file_id", None)
+    if file_id is None:
+        return Huella.de_contenido(archivo)
 
-    duplicados = df[df.duplicated(subset=["Nº operación"], keep=False)]
-    extornos = duplicados["Descripción operación"].str.contains("Extorno", case=False, na=False)
-    numeros_extorno = duplicados[extornos]["Nº operación"].unique()
-
-    df = df[~df["Nº operación"].isin(numeros_extorno)]
-    df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
-    df = df.drop_duplicates(subset="PSP_TIN")
-
-    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False
+    huellas = st.session_state.setdefault("huellas", {})
+    if file_id not in huellas:
+        huellas[file_id] = Huella.de_subida(archivo, file_id)
+    return huellas[file_id]
 
 
 # =================================================
-# EECC BBVA DIARIO (.xlsx)  (ya existente)
+# CARGADORES CON CACHE EN DISCO
 # =================================================
-@st.cache_data
-def cargar_excel_bbva(archivo):
-    df = pd.read_excel(archivo, skiprows=10)
-    df.columns = df.columns.str.strip()
-
-    df["Monto"] = pd.to_numeric(df["Importe"], errors="coerce")
-    df["Fecha"] = pd.to_datetime(df["F.Operación"], format="%d-%m-%Y", errors="coerce")
+# La lógica vive en conciliacion.cargadores; version se sube al cambiarla allí
+cargar_txt_crep = cache_en_disco(version=4, disposicion="crep:DD", huella=huella_subida)(
+    cargadores.cargar_txt_crep
+)
+cargar_excel_bcp = cache_en_disco(version=3, disposicion="bcp:skiprows=7", huella=huella_subida)(
+    cargadores.cargar_excel_bcp
+)
+cargar_excel_bbva = cache_en_disco(version=3, disposicion="bbva:skiprows=10", huella=huella_subida)(
+    cargadores.cargar_excel_bbva
+)
+cargar_excel_bbva_historico = cache_en_disco(version=3, disposicion="bbva_historico:skiprows=10", huella=huella_subida)(
+    cargadores.cargar_excel_bbva_historico
+)
+# Se cachea el parseo completo, sin ventana: cambiar el margen solo vuelve a podar, no a leer el Excel.
+# Solo en disco: en memoria lo retiene el registro de snapshots mientras alguna sesión lo use
+cargar_metabase_completo = cache_en_disco(version=3, disposicion="metabase", huella=huella_subida, memoria=False)(
+    cargadores.cargar_metabase
+)
+
+
+def cargar_metabase(archivo, desde=None, hasta=None):
+    return cargadores.podar_metabase(cargar_metabase_completo(archivo), desde, hasta)
+
+
+CARGADORES = {
+    "crep": cargar_txt_crep,
+    "bcp": cargar_excel_bcp,
+    "bbva": cargar_excel_bbva,
+    "bbva_historico": cargar_excel_bbva_historico,
+}
 
-    df["Concepto"] = df["Concepto"].astype(str).str.strip()
-    df["PSP_TIN"] = df["Concepto"].str.extract(r"(2\d{11})(?!\d)")
-
-    df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+# =================================================
+# METABASE COMPARTIDO ENTRE SESIONES
+# =================================================
+@st.cache_resource
+def registro_metabase():
+    return RegistroSnapshots()
 
-    duplicados = df[df.duplicated(subset=["Núm.Movimiento"], keep=False)]
-    extornos = duplicados["Concepto"].str.contains("Extorno", case=False, na=False)
-    numeros_extorno = duplicados[extornos]["Núm.Movimiento"].unique()
 
-    df = df[~df["Núm.Movimiento"].isin(numeros_extorno)]
-    df = df.drop_duplicates(subset="PSP_TIN")
+def metabase_compartido(clave, cargar):
+    """Metabase de solo lectura compartido por todas las sesiones que piden la misma clave.
 
-    df = df.rename(columns={"Núm.Movimiento": "Nº operación"})
-    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False
+    El préstamo queda en la sesión: al pedir otra clave (o cerrarse la sesión) se suelta.
+    """
+    prestamo = st.session_state.get("metabase_prestado")
+    if prestamo is None or prestamo.clave != clave:
+        st.session_state["metabase_prestado"] = None
+        prestamo = registro_metabase().prestar(clave, cargar)
+        st.session_state["metabase_prestado"] = prestamo
+    return prestamo.frame
 
 
 # =================================================
-# EECC BBVA HISTÓRICO (.xlsx)  (NUEVO)
+# MOTORES OPCIONALES (DuckDB / Polars)
 # =================================================
-@st.cache_data
-def cargar_excel_bbva_historico(archivo):
-    # En el histórico, la tabla inicia con headers en la fila 11 (0-indexed 10)
-    df = pd.read_excel(archivo, skiprows=10)
-    df.columns = df.columns.str.strip()
-
-    # Columnas típicas del histórico (según tu archivo)
-    # F. Operación | F. Valor | Código | Nº. Doc. | Concepto | Importe | Oficina
-    col_fecha = "F. Operación"
-    col_concepto = "Concepto"
-    col_nro_op = "Nº. Doc."
-    col_importe = "Importe"
-
-    # Asegurar strings
-    df[col_concepto] = df[col_concepto].astype(str).str.strip()
-    df[col_nro_op] = df[col_nro_op].astype(str).str.strip()
-
-    # Quitar filas de saldo (al inicio y al final de cada día)
-    # Ej: "Saldo Inicial: 05-12-2025" / "Saldo Final: 14-12-2025"
-    es_saldo = df[col_concepto].str.contains(r"^Saldo (Inicial|Final)\:", case=False, na=False)
-    df = df[~es_saldo].copy()
+MOTOR_PANDAS = "pandas (en memoria)"
+MOTOR_DUCKDB = "DuckDB (fuera de memoria)"
+MOTOR_POLARS = "Polars (lazy)"
+MEMORIA_DUCKDB = os.environ.get("CONCILIACION_MEMORIA", "2GB")
+
+
+def guardar_subida(archivo, carpeta):
+    ruta = Path(carpeta) / Path(archivo.name).name
+    ruta.write_bytes(archivo.getbuffer())
+    return ruta
+
+
+def medir_pandas(archivo_banco, archivo_metabase, formato, margen_dias, usar_almacen):
+    """Corre el motor pandas sin cache sobre los mismos archivos y devuelve (segundos, dsn, psd)."""
+    start = time.perf_counter()
+    archivo_banco.seek(0)
+    df_banco, _, sin, _ = cargadores.CARGADORES[formato](archivo_banco)
+    desde, hasta = ventana_banco(df_banco, sin, margen_dias)
+    if usar_almacen:
+        df_meta = leer_snapshot(desde, hasta)
+    else:
+        archivo_metabase.seek(0)
+        df_meta = cargadores.cargar_metabase(archivo_metabase, desde, hasta)
+    banco_archivo = "BBVA" if formato.startswith("bbva") else "BCP"
+    _, dsn, psd, _ = conciliar_pandas(df_banco, sin, df_meta, banco_archivo)
+    return time.perf_counter() - start, dsn, psd
 
-    # Fecha y monto
-    df["Monto"] = pd.to_numeric(df[col_importe], errors="coerce")
-    df["Fecha"] = pd.to_datetime(df[col_fecha], errors="coerce")
 
-    # PSP_TIN desde Concepto (12 dígitos que empiezan en 2)
-    df["PSP_TIN"] = df[col_concepto].str.extract(r"(2\d{11})(?!\d)")
+# =================================================
+# ETAPAS (banco, Metabase, cruce, exportación)
+# =================================================
+def traza_sesion():
+    """Traza de la sesión: cada etapa que se recalcula deja sus mediciones (panel Rendimiento)."""
+    traza = st.session_state.setdefault("traza", trazas.Traza("app"))
+    traza.memoria = st.session_state.get("perfil_memoria", trazas.PERFIL_MEMORIA)
+    return traza
 
-    # Solo PSP_TIN válidos
-    df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
 
-    # Extornos: misma lógica base (por Nº. Doc. + texto "Extorno")
-    duplicados = df[df.duplicated(subset=[col_nro_op], keep=False)]
-    extornos = duplicados[col_concepto].str.contains("Extorno", case=False, na=False)
-    numeros_extorno = duplicados[extornos][col_nro_op].unique()
-    df = df[~df[col_nro_op].isin(numeros_extorno)]
+def etapa(nombre, entradas, calcular):
+    """Resultado de una etapa guardado en la sesión; solo se recalcula si cambian sus entradas.
 
-    # Duplicados por PSP_TIN
-    df = df.drop_duplicates(subset="PSP_TIN")
+    entradas debe ser barata de comparar: ids de subida, huellas, ventanas de fecha.
+    """
+    etapas = st.session_state.setdefault("etapas", {})
+    guardada = etapas.get(nombre)
+    if guardada is None or guardada["entradas"] != entradas:
+        start = time.perf_counter()
+        with trazas.trazar(traza_sesion()), trazas.etapa(nombre):
+            resultado = calcular()
+        guardada = {"entradas": entradas, "resultado": resultado, "segundos": time.perf_counter() - start}
+        etapas[nombre] = guardada
+    return guardada["resultado"]
 
-    # Normalizar nombre de operación
-    df = df.rename(columns={col_nro_op: "Nº operación"})
 
-    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False
+def segundos_etapa(nombre):
+    return st.session_state["etapas"][nombre]["segundos"]
 
 
 # =================================================
-# METABASE
+# FORMATO DE PANTALLA
 # =================================================
-@st.cache_data
-def cargar_metabase(archivo):
-    return pd.read_excel(archivo)
+def formato_fechas(df):
+    """column_config de st.dataframe para las fechas: se formatean al mostrar, sin convertir la columna."""
+    return {
+        col: st.column_config.DatetimeColumn(format="DD/MM/YYYY" if col == "Fecha" else "DD/MM/YYYY HH:mm:ss")
+        for col in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[col])
+    }
+
+
+TAMANOS_PAGINA = [50, 100, 500, 1000]
+
+
+@st.fragment
+def grilla(nombre, df):
+    """Vista paginada: filtra, ordena y pagina en el servidor; al navegador va solo la página visible."""
+    columnas = columnas_filtro(df)
+    filtros = {}
+
+    with st.expander("Filtros y orden"):
+        c1, c2, c3 = st.columns(3)
+        if columnas["monto"] is not None:
+            filtros["monto_min"] = c1.number_input("Monto desde", value=None, key=f"{nombre}_monto_min")
+            filtros["monto_max"] = c1.number_input("Monto hasta", value=None, key=f"{nombre}_monto_max")
+        if columnas["fecha"] is not None:
+            rango = c2.date_input("Fechas", value=[], format="DD/MM/YYYY", key=f"{nombre}_fechas")
+            if len(rango):
+                filtros["desde"], filtros["hasta"] = rango[0], rango[-1]
+        if columnas["psptin"] is not None:
+            filtros["prefijo"] = c2.text_input("PSP_TIN empieza con", key=f"{nombre}_prefijo").strip()
+        if columnas["medio"] is not None:
+            filtros["medios"] = c3.multiselect(
+                "Medio de atención", sorted(df[columnas["medio"]].dropna().unique(), key=str), key=f"{nombre}_medios"
+            )
+        orden = c3.selectbox("Ordenar por", [None, *df.columns], key=f"{nombre}_orden")
+        ascendente = c3.toggle("Ascendente", value=True, key=f"{nombre}_ascendente")
+
+    filtrado = filtrar(df, columnas, **filtros)
+
+    c1, c2 = st.columns([1, 3])
+    tamano = c1.selectbox("Filas por página", TAMANOS_PAGINA, index=1, key=f"{nombre}_tamano")
+    paginas = max(-(-len(filtrado) // tamano), 1)
+    # Sin max_value: al filtrar puede haber menos páginas que la elegida, se recorta aquí
+    numero = min(c2.number_input(f"Página (de {paginas})", min_value=1, value=1, key=f"{nombre}_pagina"), paginas)
+
+    vista = pagina(filtrado, numero - 1, tamano, orden, ascendente, columnas)
+    st.dataframe(vista, column_config=formato_fechas(vista), hide_index=True)
+    inicio = (numero - 1) * tamano
+    st.caption(
+        f"Filas {inicio + 1 if len(vista) else 0}–{inicio + len(vista)} de {len(filtrado)}"
+        + (f" (filtradas de {len(df)})" if len(filtrado) != len(df) else "")
+    )
 
 
 # =================================================
@@ -168,103 +220,387 @@ st.divider()
 
 archivo_banco = st.file_uploader("📥 Subir EECC del banco", type=["txt", "xlsx", "xls"])
 archivo_metabase = st.file_uploader("📥 Subir archivo de Metabase", type=["xlsx", "xls"])
+usar_almacen = st.toggle("Usar almacén local de Metabase (particiones diarias)", value=True)
+
+# Cada export subido se importa una sola vez al almacén
+if archivo_metabase and usar_almacen:
+    importados = st.session_state.setdefault("snapshots_importados", set())
+    if archivo_metabase.file_id not in importados:
+        start = time.time()
+        particiones = importar_snapshot(cargar_metabase(archivo_metabase))
+        importados.add(archivo_metabase.file_id)
+        st.caption(f"Metabase importado al almacén local: {particiones} días (en {round(time.time() - start, 2)}s)")
+
+motor = st.radio("Motor de conciliación", [MOTOR_PANDAS, MOTOR_DUCKDB, MOTOR_POLARS], horizontal=True)
+# La corrida sigue aunque se cierre o recargue la página; el id queda en la URL
+segundo_plano = motor == MOTOR_PANDAS and st.toggle("Conciliar en segundo plano")
 
 df_banco = None
-hora_corte = None
 es_crep = False
 banco_archivo = None
+sin_psptin = None
+
+
+# =================================================
+# CRUCE CON MOTORES OPCIONALES
+# =================================================
+# DuckDB: históricos que no entran en RAM. Polars: un solo plan lazy multihilo.
+if archivo_banco and motor != MOTOR_PANDAS:
+    if not (archivo_metabase or (usar_almacen and hay_snapshot())):
+        st.stop()
+
+    margen_dias = st.number_input("Margen de fechas para Metabase (días)", min_value=0, value=1)
+    comparar = motor == MOTOR_POLARS and st.checkbox("Medir contra el motor pandas (mismos archivos)")
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="conciliacion_") as carpeta:
+        ruta_banco = guardar_subida(archivo_banco, carpeta)
+        metabase = DIR_SNAPSHOTS if usar_almacen else guardar_subida(archivo_metabase, carpeta)
+
+        if motor == MOTOR_DUCKDB:
+            from conciliacion import motor_duckdb
+
+            resumen = motor_duckdb.conciliar(ruta_banco, metabase, Path(carpeta) / "salida", margen_dias, MEMORIA_DUCKDB)
+            resultados = {nombre: pd.read_parquet(resumen["rutas"][nombre]) for nombre in ("dsn", "psd")}
+        else:
+            from conciliacion import motor_polars
+
+            resumen = motor_polars.conciliar(ruta_banco, metabase, margen_dias)
+            resultados = {nombre: resumen[nombre] for nombre in ("dsn", "psd")}
+    segundos = time.perf_counter() - start
+
+    st.success(f"Conciliación {resumen['banco']} ({resumen['formato']}) con {motor} en {round(segundos, 2)}s")
+    if comparar:
+        segundos_pandas, dsn_pandas, psd_pandas = medir_pandas(
+            archivo_banco, archivo_metabase, resumen["formato"], margen_dias, usar_almacen
+        )
+        iguales = (
+            dsn_pandas["PSP_TIN"].fillna("").tolist() == resultados["dsn"]["PSP_TIN"].fillna("").tolist()
+            and psd_pandas["Deuda_PspTin"].tolist() == resultados["psd"]["Deuda_PspTin"].tolist()
+        )
+        st.dataframe(pd.DataFrame({
+            "Motor": [MOTOR_PANDAS, motor],
+            "Segundos": [round(segundos_pandas, 3), round(segundos, 3)],
+            "DSN": [len(dsn_pandas), len(resultados["dsn"])],
+            "PSD": [len(psd_pandas), len(resultados["psd"])],
+        }))
+        st.caption("✅ Mismos DSN y PSD que pandas" if iguales else "⚠️ Los resultados difieren de pandas")
+
+    st.subheader("✅ Cruces por nivel")
+    st.write(resumen["niveles"])
+
+    for nombre, titulo in (("dsn", "🟡 DSN encontrados"), ("psd", "🔁 PSD encontrados")):
+        st.subheader(titulo)
+        st.write(len(resultados[nombre]))
+        grilla(f"motor_{nombre}", resultados[nombre])
+        st.download_button(
+            f"⬇️ Descargar {nombre.upper()} (parquet)",
+            lambda df=resultados[nombre]: exportar(df, "parquet").read(),
+            f"{nombre.upper()}_encontrados.parquet",
+            mime=MIME["parquet"]
+        )
+    st.stop()
 
 
 # =================================================
 # CARGA BANCO
 # =================================================
-if archivo_banco:
-    start = time.time()
-
-    if archivo_banco.name.endswith(".txt"):
-        df_banco, es_crep = cargar_txt_crep(archivo_banco)
-        hora_corte = df_banco["FechaHora"].max()
-        banco_archivo = "BCP"
-        st.info(f"Hora de corte: {hora_corte}")
+if archivo_banco and not segundo_plano:
+    entradas_banco = ("banco", archivo_banco.file_id)
+    banco = etapa("banco", entradas_banco, lambda: cargar_banco(archivo_banco, CARGADORES))
+    df_banco, es_crep, sin_psptin, banco_archivo = banco["df"], banco["es_crep"], banco["sin_psptin"], banco["banco"]
+
+    if banco["hora_corte"] is not None:
+        st.info(f"Hora de corte: {banco['hora_corte']}")
     else:
-        # Detectar si es BBVA diario / BBVA histórico / BCP
-        archivo_banco.seek(0)
-        preview = pd.read_excel(archivo_banco, nrows=25, header=None)
-        archivo_banco.seek(0)
-
-        # Unimos todo el preview a texto para detectar título
-        preview_text = " ".join(preview.fillna("").astype(str).values.flatten()).upper()
-
-        if "HISTÓRICO DE MOVIMIENTOS" in preview_text or "HISTORICO DE MOVIMIENTOS" in preview_text:
-            df_banco, es_crep = cargar_excel_bbva_historico(archivo_banco)
-            banco_archivo = "BBVA"
-            st.caption("Formato detectado: BBVA - Movimientos Históricos (.xlsx)")
-        elif "MOVIMIENTOS DEL DÍA" in preview_text or "MOVIMIENTOS DEL DIA" in preview_text:
-            df_banco, es_crep = cargar_excel_bbva(archivo_banco)
-            banco_archivo = "BBVA"
-            st.caption("Formato detectado: BBVA - Movimientos del Día (.xlsx)")
-        else:
-            df_banco, es_crep = cargar_excel_bcp(archivo_banco)
-            banco_archivo = "BCP"
-            st.caption("Formato detectado: EECC BCP (.xlsx)")
+        st.caption(f"Formato detectado: {banco['formato']}")
 
-    st.success(f"EECC cargado con {len(df_banco)} PSP_TIN únicos (en {round(time.time() - start, 2)}s)")
-    st.dataframe(df_banco)
+    st.success(f"EECC cargado con {len(df_banco)} PSP_TIN únicos (en {round(segundos_etapa('banco'), 2)}s)")
+    if len(sin_psptin):
+        st.caption(f"{len(sin_psptin)} depósitos sin PSP_TIN pasan al segundo nivel de cruce")
+    grilla("banco", df_banco)
 
 
 # =================================================
-# CRUCE
+# EXPORTACIONES (bajo demanda, en segundo plano)
 # =================================================
-if archivo_banco and archivo_metabase:
-    df_meta = cargar_metabase(archivo_metabase)
+class Exportacion:
+    """Exportación armándose en un hilo; progreso va de 0 a 1."""
+
+    def __init__(self):
+        self.progreso = 0.0
+        self.futuro = None
+
+    def contenido(self):
+        archivo = self.futuro.result()
+        archivo.seek(0)
+        return archivo.read()
+
+
+@st.cache_resource
+def pool_exportaciones():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="exportacion")
+
+
+def descarga(clave, etiqueta, nombre_archivo, construir):
+    """Botón que arma la exportación solo al pedirla; el resultado queda memorizado por clave.
+
+    construir(progreso) devuelve el archivo (rebobinado). Mientras se arma, el fragmento se
+    refresca solo para mostrar el avance.
+    """
+    tarea = st.session_state.setdefault("exportaciones", {}).get(clave)
+    en_curso = tarea is not None and not tarea.futuro.done()
+    st.fragment(_descarga, run_every=0.5 if en_curso else None)(clave, etiqueta, nombre_archivo, construir, en_curso)
+
+
+def _descarga(clave, etiqueta, nombre_archivo, construir, en_curso):
+    exportaciones = st.session_state["exportaciones"]
+    tarea = exportaciones.get(clave)
+
+    if tarea is None:
+        if st.button(f"Preparar {nombre_archivo}", key=f"preparar_{clave[0]}"):
+            tarea = Exportacion()
+            progreso = lambda fraccion: setattr(tarea, "progreso", fraccion)
+            tarea.futuro = pool_exportaciones().submit(traza_sesion().correr, construir, progreso)
+            exportaciones[clave] = tarea
+            st.rerun()
+        return
 
-    col_psptin = "Deuda_PspTin"
-    col_banco = "Banco"
-    col_moneda = " Moneda"
-    col_fecha = "PC_create_date_GMT_Peru"
+    if not tarea.futuro.done():
+        st.progress(tarea.progreso, text=f"Generando {nombre_archivo}…")
+        return
+    if en_curso:
+        # Terminó: un rerun completo (barato, las etapas están en la sesión) apaga el refresco
+        st.rerun()
 
-    df_meta[col_psptin] = df_meta[col_psptin].astype(str)
-    df_meta = df_meta.drop_duplicates(subset=col_psptin)
-    df_meta[col_fecha] = pd.to_datetime(df_meta[col_fecha], errors="coerce")
+    # Diferida: los bytes se leen del archivo temporal recién al hacer clic
+    extension = nombre_archivo.rsplit(".", 1)[-1]
+    st.download_button(etiqueta, tarea.contenido, nombre_archivo, mime={**MIME, "zip": "application/zip"}[extension])
 
-    df_meta_filtrado = df_meta[
-        (df_meta[col_banco].astype(str).str.upper().str.contains(banco_archivo)) &
-        (df_meta[col_moneda].astype(str).str.upper().str.strip() == "PEN")
-    ]
 
-    st.info(f"PSP_TIN únicos en Metabase: {df_meta_filtrado[col_psptin].nunique()}")
+# =================================================
+# CRUCE
+# =================================================
+@st.fragment
+def seccion_cruce(banco, entradas_banco, archivo_metabase, usar_almacen):
+    """Ingesta de Metabase, cruce y exportación. El margen solo reejecuta este fragmento."""
+    df_banco, sin_psptin = banco["df"], banco["sin_psptin"]
+
+    margen_dias = st.number_input("Margen de fechas para Metabase (días)", min_value=0, value=1)
+    desde, hasta = ventana_banco(df_banco, sin_psptin, margen_dias)
+    if usar_almacen:
+        clave = ("almacen", desde, hasta, version_snapshot())
+        cargar = lambda: leer_snapshot(desde, hasta)
+    else:
+        clave = ("subida", huella_subida(archivo_metabase).esperar_completa(), desde, hasta)
+        cargar = lambda: cargar_metabase(archivo_metabase, desde, hasta)
+    df_meta = etapa("metabase", clave, lambda: metabase_compartido(clave, cargar))
+
+    if usar_almacen and df_meta.empty:
+        st.warning("El almacén local no tiene Metabase para las fechas del EECC.")
+        return
+    if desde is not None:
+        st.caption(
+            f"Metabase podado a la ventana del EECC: {desde:%d/%m/%Y} – "
+            f"{hasta - pd.Timedelta(days=1):%d/%m/%Y} ({len(df_meta)} filas)"
+        )
+
+    entradas_cruce = (entradas_banco, clave)
+    df_meta_filtrado, dsn, psd, cruzados = etapa(
+        "cruce", entradas_cruce, lambda: conciliar_pandas(df_banco, sin_psptin, df_meta, banco["banco"])
+    )
+    resultados_cruce(banco, desde, hasta, df_meta_filtrado, dsn, psd, cruzados, entradas_cruce)
+
+
+def resultados_cruce(banco, desde, hasta, df_meta_filtrado, dsn, psd, cruzados, entradas_cruce):
+    """DSN, PSD y descargas de un cruce hecho en la sesión o en una corrida en segundo plano."""
+    formato_descarga = st.radio("Formato de descarga", list(MIME), horizontal=True)
+    # Las descargas armadas para un cruce anterior ya no sirven
+    exportaciones = st.session_state.setdefault("exportaciones", {})
+    for vieja in [k for k in exportaciones if k[1] != entradas_cruce]:
+        del exportaciones[vieja]
+    st.info(f"PSP_TIN únicos en Metabase: {df_meta_filtrado['Deuda_PspTin'].nunique()}")
+
+    st.subheader("✅ Cruces por nivel")
+    st.dataframe(cruzados["Nivel de cruce"].value_counts())
 
     # DSN
-    dsn = df_banco[~df_banco["PSP_TIN"].isin(df_meta_filtrado[col_psptin])]
     st.subheader("🟡 DSN encontrados")
     st.write(len(dsn))
-    st.dataframe(dsn)
+    grilla("dsn", dsn)
 
-    # XLSX DSN
-    out_dsn = io.BytesIO()
-    with pd.ExcelWriter(out_dsn, engine="openpyxl") as writer:
-        dsn.to_excel(writer, index=False)
-
-    st.download_button(
-        "⬇️ Descargar DSN (Excel)",
-        out_dsn.getvalue(),
-        "DSN_encontrados.xlsx"
+    descarga(
+        ("dsn", entradas_cruce, formato_descarga), "⬇️ Descargar DSN", f"DSN_encontrados.{formato_descarga}",
+        lambda progreso: exportar(dsn, formato_descarga, progreso)
     )
 
-    # TXT DSN (PSP_TIN concatenados por coma)
-    psptin_txt = ",".join(
-        dsn["PSP_TIN"].dropna().astype(str).str.strip().unique()
+    # Lista de PSP_TIN del DSN, en bloques para pegar en SQL
+    columnas_lista = st.columns(2)
+    formato_lista = columnas_lista[0].selectbox(
+        "Formato de la lista de PSP_TIN", list(FORMATOS_LISTA), format_func=FORMATOS_LISTA.get
     )
+    tamano_lista = columnas_lista[1].number_input("PSP_TIN por bloque (0 = todos)", min_value=0, value=1000, step=500)
 
     st.download_button(
-        "⬇️ Descargar DSN (PSP_TIN en .txt)",
-        data=psptin_txt.encode("utf-8"),
-        file_name="DSN_psptin.txt",
+        "⬇️ Descargar DSN (lista de PSP_TIN)",
+        data=lambda: lista_psptin(dsn["PSP_TIN"], formato_lista, tamano_lista).encode("utf-8"),
+        file_name=f"DSN_psptin.{EXTENSION_LISTA[formato_lista]}",
         mime="text/plain"
     )
 
     # PSD
-    psd = df_meta_filtrado[~df_meta_filtrado[col_psptin].isin(df_banco["PSP_TIN"])]
     st.subheader("🔁 PSD encontrados")
     st.write(len(psd))
-    st.dataframe(psd)
+    grilla("psd", psd)
+    descarga(
+        ("psd", entradas_cruce, formato_descarga), "⬇️ Descargar PSD", f"PSD_encontrados.{formato_descarga}",
+        lambda progreso: exportar(psd, formato_descarga, progreso)
+    )
+
+    # Reporte consolidado: un libro con todas las hojas, o el paquete del día en zip
+    st.subheader("📦 Reporte consolidado")
+    descartados = banco["descartados"]
+    st.caption(
+        f"{(descartados['Motivo'] == 'Extorno').sum()} extornos y "
+        f"{(descartados['Motivo'] != 'Extorno').sum()} líneas descartadas del EECC"
+    )
+
+    def hojas():
+        resumen = resumen_conciliacion(banco, desde, hasta, df_meta_filtrado, dsn, psd, cruzados)
+        diferencias = diferencias_monto(cruzados, df_meta_filtrado)
+        return hojas_reporte(resumen, dsn, psd, cruzados, diferencias, descartados)
+
+    nombre_reporte = f"Conciliacion_{banco['banco']}_{datetime.now():%Y%m%d}"
+    descarga(
+        ("reporte", entradas_cruce), "⬇️ Descargar reporte consolidado (Excel)", f"{nombre_reporte}.xlsx",
+        lambda progreso: exportar_reporte(hojas(), progreso)
+    )
+    descarga(
+        ("paquete", entradas_cruce), "⬇️ Descargar paquete del día (zip)", f"{nombre_reporte}.zip",
+        lambda progreso: exportar_paquete(
+            hojas(), f"{nombre_reporte}.xlsx", {"DSN_psptin.txt": lista_psptin(dsn["PSP_TIN"]).encode("utf-8")}, progreso
+        )
+    )
+
+
+# =================================================
+# CORRIDAS EN SEGUNDO PLANO
+# =================================================
+@st.cache_resource
+def registro_corridas():
+    return Corridas()
+
+
+def abrir_corrida(id_corrida):
+    st.query_params["corrida"] = id_corrida
+
+
+def cerrar_corrida():
+    del st.query_params["corrida"]
+
+
+def seccion_corrida(id_corrida):
+    """Avance de una corrida y, al terminar, sus resultados; sirve para volver a una tras recargar."""
+    estado = registro_corridas().estado(id_corrida)
+    st.subheader(f"🕒 Corrida {id_corrida}")
+    st.button("Cerrar corrida", on_click=cerrar_corrida)
+    if estado is None:
+        st.warning("La corrida no existe o ya se borró.")
+        return
+
+    en_curso = estado["estado"] in EN_CURSO
+    st.fragment(_avance_corrida, run_every=1 if en_curso else None)(id_corrida, en_curso)
+    if en_curso:
+        return
+    if estado["estado"] == "interrumpida":
+        st.warning("La corrida quedó cortada por un reinicio del servidor. Hay que lanzarla de nuevo.")
+        return
+    if estado["estado"] == "error":
+        st.error(f"La corrida falló: {estado['error']}")
+        return
+
+    st.success(
+        f"Corrida {estado['banco']} terminada en {estado['segundos']}s "
+        f"(Metabase: {estado['metabase'] or 'almacén local'}, margen {estado['margen_dias']} días)"
+    )
+    resultado = etapa("corrida", ("corrida", id_corrida), lambda: registro_corridas().resultado(id_corrida))
+    resultados_cruce(
+        resultado["banco"], resultado["desde"], resultado["hasta"], resultado["df_meta_filtrado"],
+        resultado["dsn"], resultado["psd"], resultado["cruzados"], ("corrida", id_corrida),
+    )
+
+
+def _avance_corrida(id_corrida, en_curso):
+    estado = registro_corridas().estado(id_corrida)
+    if estado["estado"] in EN_CURSO:
+        st.progress(estado["progreso"], text=f"{estado['banco']}: {estado['etapa']}…")
+    elif en_curso:
+        # Terminó: un rerun completo apaga el refresco y muestra los resultados
+        st.rerun()
+
+
+hay_metabase = archivo_metabase or (usar_almacen and hay_snapshot())
+if segundo_plano and archivo_banco and hay_metabase:
+    margen_corrida = st.number_input("Margen de fechas para Metabase (días)", min_value=0, value=1, key="margen_corrida")
+    if st.button("▶️ Lanzar corrida"):
+        abrir_corrida(registro_corridas().enviar(
+            archivo_banco, None if usar_almacen else archivo_metabase, margen_dias=margen_corrida
+        ))
+        st.rerun()
+
+if "corrida" in st.query_params:
+    seccion_corrida(st.query_params["corrida"])
+elif archivo_banco and not segundo_plano and hay_metabase:
+    seccion_cruce(banco, entradas_banco, archivo_metabase, usar_almacen)
+
+
+# =================================================
+# RENDIMIENTO
+# =================================================
+with st.expander("⏱️ Rendimiento"):
+    st.toggle(
+        "Perfil de memoria", value=trazas.PERFIL_MEMORIA, key="perfil_memoria",
+        help="RSS y pico de asignaciones por etapa y memoria de cada frame intermedio. Hace más lentas las etapas; "
+             "se aplica a las que se recalculen desde ahora.",
+    )
+    traza = traza_sesion()
+    ruta_trazas = traza.escribir()
+    tabla = traza.tabla()
+    if tabla.empty:
+        st.caption("Todavía no se midió ninguna etapa en esta sesión.")
+    else:
+        st.caption(
+            "Pared y CPU (del hilo) en segundos, filas de entrada y salida y bytes procesados por etapa. "
+            f"Solo aparecen las etapas recalculadas; con un acierto del cache, sin sus subetapas. JSON lines en {ruta_trazas}"
+        )
+        st.dataframe(tabla.tail(200), hide_index=True)
+
+    marcos = traza.tabla_marcos()
+    if len(marcos):
+        rss = trazas.rss_actual()
+        st.caption(
+            "Frames intermedios en MB: profundo es memory_usage(deep=True); comparte, lo que usa en común con otros "
+            "frames vivos (copias superficiales del cache, vistas)."
+            + (f" RSS actual del proceso: {rss / trazas.MB:.0f} MB." if rss is not None else "")
+        )
+        st.dataframe(marcos.tail(200), hide_index=True)
+
+
+# =================================================
+# CACHE EN DISCO
+# =================================================
+with st.sidebar.expander("Cache de cargadores"):
+    estadisticas = cache.estadisticas()
+    st.write(f"Aciertos en memoria: {estadisticas['aciertos_memoria']} · En disco: {estadisticas['aciertos']} · Fallos: {estadisticas['fallos']} · Desalojos: {estadisticas['desalojos']}")
+    st.write(f"En disco: {estadisticas['bytes'] / 1024 ** 2:.1f} MB de {estadisticas['limite_bytes'] / 1024 ** 2:.0f} MB")
+
+with st.sidebar.expander("Corridas"):
+    for estado in registro_corridas().recientes():
+        st.button(
+            f"{estado['id']} · {estado['banco']} · {estado['estado']}", key=f"corrida_{estado['id']}",
+            on_click=abrir_corrida, args=(estado["id"],),
+        )
+
+with st.sidebar.expander("Metabase compartido"):
+    estadisticas = registro_metabase().estadisticas()
+    st.write(f"Snapshots: {estadisticas['snapshots']} · Sesiones: {estadisticas['referencias']} · Parseos: {estadisticas['parseos']}")
+    st.write(f"En memoria: {estadisticas['bytes'] / 1024 ** 2:.1f} MB")
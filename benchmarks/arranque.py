@@ -0,0 +1,118 @@
+"""Perfil de importación y presupuesto de arranque en frío de la app y la línea de comandos.
+
+    python benchmarks/arranque.py                  # perfil + chequeo de presupuesto
+    python benchmarks/arranque.py --top 25 --factor 2
+
+Cada punto de entrada se importa en un intérprete nuevo con -X importtime, varias veces, y se
+toma la mejor corrida. Falla (código 1) si alguno pasa su presupuesto o si al arrancar ya cargó
+un módulo que debe importarse recién al usarse (motores de Excel, backends opcionales, escritores).
+Para la app se ejecutan solo los imports de nivel superior del script, sin dibujar la interfaz.
+"""
+import argparse
+import ast
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+APP = RAIZ / "ConciliacionNewV2.py"
+
+# Segundos de arranque en frío (intérprete + imports) por punto de entrada
+PRESUPUESTOS = {
+    "cli --help": 0.3,
+    "cli": 1.0,
+    "app": 1.5,
+}
+
+# Se importan al usarse, nunca al arrancar
+DIFERIDOS = [
+    "openpyxl",
+    "xlsxwriter",
+    "xlrd",
+    "duckdb",
+    "polars",
+    "pyarrow.parquet",
+    "concurrent.futures.process",
+    "multiprocessing.shared_memory",
+    "conciliacion.motor_duckdb",
+    "conciliacion.motor_polars",
+]
+
+
+def imports_app(ruta=APP):
+    """Sentencias import de nivel superior del script de Streamlit."""
+    arbol = ast.parse(ruta.read_text(encoding="utf-8"))
+    nodos = [nodo for nodo in arbol.body if isinstance(nodo, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(nodo) for nodo in nodos)
+
+
+def entradas():
+    # La corrida de la CLI importa el núcleo recién después de leer los argumentos
+    nucleo = (
+        "import conciliacion.cli\n"
+        "from conciliacion import almacen, cargadores, cruce, exportar, reporte"
+    )
+    return {
+        "cli --help": ["-m", "conciliacion", "--help"],
+        "cli": ["-c", nucleo],
+        "app": ["-c", imports_app()],
+    }
+
+
+def perfil(argumentos):
+    """(segundos de pared, {módulo: microsegundos acumulados}) de un intérprete nuevo."""
+    start = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", *argumentos],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    segundos = time.perf_counter() - start
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr[-2000:])
+
+    modulos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        modulos[nombre.strip()] = (int(acumulado), len(nombre) - len(nombre.lstrip()))
+    return segundos, modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corridas", type=int, default=3, help="intérpretes por punto de entrada (se toma el mejor)")
+    parser.add_argument("--top", type=int, default=10, help="módulos de primer nivel a mostrar")
+    parser.add_argument("--factor", type=float, default=1.0, help="multiplica los presupuestos (máquinas lentas)")
+    args = parser.parse_args()
+
+    fallas = []
+    for nombre, argumentos in entradas().items():
+        segundos, modulos = min((perfil(argumentos) for _ in range(args.corridas)), key=lambda r: r[0])
+        presupuesto = PRESUPUESTOS[nombre] * args.factor
+
+        print(f"{nombre}: {segundos:.3f}s (presupuesto {presupuesto:.2f}s), {len(modulos)} módulos")
+        primer_nivel = sorted(
+            ((acumulado, modulo) for modulo, (acumulado, sangria) in modulos.items() if sangria == 1),
+            reverse=True,
+        )
+        for acumulado, modulo in primer_nivel[:args.top]:
+            print(f"  {acumulado / 1e6:7.3f}s  {modulo}")
+
+        if segundos > presupuesto:
+            fallas.append(f"{nombre} tardó {segundos:.3f}s, presupuesto {presupuesto:.2f}s")
+        for modulo in DIFERIDOS:
+            if modulo in modulos:
+                fallas.append(f"{nombre} importa {modulo} al arrancar")
+
+    if fallas:
+        print()
+        print("\n".join(fallas))
+        sys.exit(1)
+    print()
+    print("Arranque dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
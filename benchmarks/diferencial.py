@@ -0,0 +1,476 @@
+"""Arnés diferencial: las versiones históricas del script y los motores actuales sobre los mismos archivos.
+
+    python benchmarks/diferencial.py                                   # CREP y BCP de 10k filas generados
+    python benchmarks/diferencial.py --filas 100000 --versiones v1.1.2 actual duckdb
+    python benchmarks/diferencial.py --banco EECC.xlsx --metabase Metabase.xlsx
+    python benchmarks/diferencial.py --exigir duckdb polars            # código 1 si difieren de la referencia
+
+Cada versión corre en un intérprete nuevo sin interfaz. Los scripts de Streamlit
+(conciliacion_psd_dsn_v1.1.1.py, v1.1.2 y conciliaciononline.py) se ejecutan tal cual con un
+streamlit sin pantalla: sus file_uploader reciben los archivos, st.cache_data no guarda nada y
+el resto de la interfaz se descarta; al terminar se toman sus variables dsn y psd. Se mide la
+carga del banco y de Metabase (sus funciones cargar_*) y el resto del script, que cruza y
+exporta a Excel. "actual" es el núcleo de ConciliacionNewV2.py (conciliacion, con pandas) y
+exporta DSN y PSD a xlsx igual que los scripts; duckdb y polars son sus motores opcionales.
+
+DSN se compara por PSP_TIN (los depósitos sin PSP_TIN que quedan como DSN, por Nº operación) y
+PSD por Deuda_PspTin. Para las claves comunes se comparan además las columnas de ambos lados,
+como fecha o número cuando alguno de los dos lados lo es: ahí aparecen las diferencias de
+Medio de atención, de la hora y de columnas que una versión no trae.
+Los scripts solo entienden CREP y EECC BCP; con BBVA corren únicamente los motores actuales.
+Con archivos generados cada versión recibe el Metabase con las convenciones que lee (VARIANTES:
+los scripts, el export "legado" con "Moneda" y Banco "BCP"); los datos de ambos salen del mismo
+escenario, en una carpeta por semilla y juego de tasas.
+Las claves distintas se guardan en CSV y los tiempos en benchmarks/resultados/diferencial.jsonl.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+RESULTADOS = RAIZ / "benchmarks" / "resultados"
+DATOS = RAIZ / "benchmarks" / "datos" / "diferencial"
+
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / "benchmarks"))
+
+import generador  # noqa: E402
+
+SCRIPTS = {
+    "v1.1.1": "conciliacion_psd_dsn_v1.1.1.py",
+    "v1.1.2": "conciliacion_psd_dsn_v1.1.2.py",
+    "online": "conciliaciononline.py",
+}
+MOTORES = ["actual", "duckdb", "polars"]
+VERSIONES = [*SCRIPTS, *MOTORES]
+FORMATOS_SCRIPTS = ("crep", "bcp")
+# Variante del export de Metabase (generador.VARIANTES_METABASE) que lee cada versión
+VARIANTES = {version: "legado" for version in SCRIPTS}
+
+
+# =================================================
+# SCRIPTS DE STREAMLIT SIN PANTALLA
+# =================================================
+class Detenido(Exception):
+    """st.stop() del script."""
+
+
+def _nada(*args, **kwargs):
+    return _Nada()
+
+
+class _Nada:
+    """Lo que devuelven los elementos de interfaz descartados (columnas, contenedores, spinners)."""
+
+    def __getattr__(self, nombre):
+        return _nada
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *error):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def __bool__(self):
+        return False
+
+
+class SinPantalla(types.ModuleType):
+    """streamlit para correr un script sin servidor: entrega los archivos y anota los mensajes."""
+
+    def __init__(self, archivos):
+        super().__init__("streamlit")
+        self._archivos = list(archivos)
+        self.mensajes = []
+
+    def file_uploader(self, *args, **kwargs):
+        return self._archivos.pop(0) if self._archivos else None
+
+    def cache_data(self, funcion=None, **opciones):
+        # Sin cache: cada versión corre una sola vez y en frío
+        return funcion if funcion is not None else (lambda f: f)
+
+    cache_resource = cache_data
+
+    def stop(self):
+        raise Detenido()
+
+    def error(self, mensaje, *args, **kwargs):
+        self.mensajes.append(f"error: {mensaje}")
+
+    def warning(self, mensaje, *args, **kwargs):
+        self.mensajes.append(f"aviso: {mensaje}")
+
+    def __getattr__(self, nombre):
+        return _nada
+
+
+def _medida(funcion, etapa, segundos):
+    def envoltura(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            segundos[etapa] = segundos.get(etapa, 0.0) + time.perf_counter() - start
+    return envoltura
+
+
+def correr_script(ruta_script, ruta_banco, ruta_metabase):
+    """Ejecuta un script de Streamlit sobre los archivos; devuelve (dsn, psd, segundos, mensajes).
+
+    Primero los imports y las funciones, para medir los cargadores; después la interfaz.
+    """
+    arbol = ast.parse(Path(ruta_script).read_text(encoding="utf-8"), filename=str(ruta_script))
+    definiciones = [n for n in arbol.body if isinstance(n, (ast.Import, ast.ImportFrom, ast.FunctionDef))]
+    interfaz = [n for n in arbol.body if n not in definiciones]
+
+    with open(ruta_banco, "rb") as archivo_banco, open(ruta_metabase, "rb") as archivo_metabase:
+        st = SinPantalla([archivo_banco, archivo_metabase])
+        sys.modules["streamlit"] = st
+        espacio = {"__name__": "__diferencial__", "__file__": str(ruta_script)}
+        exec(compile(ast.Module(definiciones, type_ignores=[]), str(ruta_script), "exec"), espacio)
+
+        segundos = {}
+        for nombre, valor in list(espacio.items()):
+            if nombre.startswith("cargar_") and callable(valor):
+                espacio[nombre] = _medida(valor, "metabase" if "metabase" in nombre else "banco", segundos)
+
+        start = time.perf_counter()
+        try:
+            exec(compile(ast.Module(interfaz, type_ignores=[]), str(ruta_script), "exec"), espacio)
+        except Detenido:
+            pass
+        total = time.perf_counter() - start
+
+    if "dsn" not in espacio or "psd" not in espacio:
+        raise RuntimeError("; ".join(st.mensajes) or "el script terminó sin DSN ni PSD")
+    segundos["cruce_y_exportar"] = total - segundos.get("banco", 0.0) - segundos.get("metabase", 0.0)
+    segundos["total"] = total
+    return espacio["dsn"], espacio["psd"], segundos, st.mensajes
+
+
+# =================================================
+# MOTORES ACTUALES
+# =================================================
+def correr_actual(ruta_banco, ruta_metabase):
+    from conciliacion.cruce import conciliar_archivos
+    from conciliacion.exportar import exportar
+    from conciliacion.trazas import Traza, trazar
+
+    traza = Traza("diferencial")
+    start = time.perf_counter()
+    with trazar(traza):
+        with open(ruta_banco, "rb") as archivo_banco, open(ruta_metabase, "rb") as archivo_metabase:
+            resultado = conciliar_archivos(archivo_banco, archivo_metabase)
+        for nombre in ("dsn", "psd"):
+            exportar(resultado[nombre], "xlsx").close()
+    total = time.perf_counter() - start
+
+    etapas = {}
+    for registro in traza.registros:
+        if "/" not in registro["etapa"]:
+            etapas[registro["etapa"]] = etapas.get(registro["etapa"], 0.0) + registro["segundos"]
+    segundos = {
+        "banco": etapas.get("banco", 0.0),
+        "metabase": etapas.get("metabase", 0.0),
+        "cruce_y_exportar": etapas.get("cruce", 0.0) + etapas.get("exportar", 0.0),
+        "total": total,
+    }
+    return resultado["dsn"], resultado["psd"], segundos, []
+
+
+def correr_duckdb(ruta_banco, ruta_metabase):
+    import pandas as pd
+
+    from conciliacion import motor_duckdb
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="diferencial_") as carpeta:
+        resumen = motor_duckdb.conciliar(ruta_banco, ruta_metabase, Path(carpeta) / "salida")
+        dsn, psd = (pd.read_parquet(resumen["rutas"][nombre]) for nombre in ("dsn", "psd"))
+    return dsn, psd, {"total": time.perf_counter() - start}, []
+
+
+def correr_polars(ruta_banco, ruta_metabase):
+    from conciliacion import motor_polars
+
+    start = time.perf_counter()
+    resumen = motor_polars.conciliar(ruta_banco, ruta_metabase)
+    return resumen["dsn"], resumen["psd"], {"total": time.perf_counter() - start}, []
+
+
+CORREDORES = {"actual": correr_actual, "duckdb": correr_duckdb, "polars": correr_polars}
+
+
+def correr_caso(version, ruta_banco, ruta_metabase, salida):
+    """Corre una versión (en su propio intérprete): DSN y PSD en salida, tiempos en JSON por stdout."""
+    try:
+        if version in SCRIPTS:
+            dsn, psd, segundos, mensajes = correr_script(RAIZ / SCRIPTS[version], ruta_banco, ruta_metabase)
+        else:
+            dsn, psd, segundos, mensajes = CORREDORES[version](ruta_banco, ruta_metabase)
+    except Exception as error:
+        print(json.dumps({"error": f"{type(error).__name__}: {error}"}, ensure_ascii=False))
+        return
+    with open(Path(salida) / f"{version}.pkl", "wb") as f:
+        pickle.dump({"dsn": dsn, "psd": psd}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(json.dumps({"segundos": segundos, "mensajes": mensajes}, ensure_ascii=False))
+
+
+# =================================================
+# COMPARACIÓN
+# =================================================
+def _texto(serie):
+    """Valores como texto sin espacios; los faltantes como cadena vacía."""
+    return serie.astype(str).where(serie.notna(), "").str.strip()
+
+
+def _fecha(serie):
+    """Fechas ISO (las de los motores) o dd/mm/aaaa (las que los scripts formatean)."""
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    iso = pd.to_datetime(serie, errors="coerce", format="ISO8601")
+    return iso.fillna(pd.to_datetime(serie, errors="coerce", format="mixed", dayfirst=True))
+
+
+def _iguales(a, b):
+    """Máscara de valores iguales entre dos columnas que cada versión pudo leer con otro tipo.
+
+    Si un lado es fecha o número se comparan como fecha o número (montos a 2 decimales): los
+    motores actuales leen el Excel como texto y los scripts con los tipos de pandas.
+    """
+    import pandas as pd
+
+    tipos = pd.api.types
+    if tipos.is_datetime64_any_dtype(a) or tipos.is_datetime64_any_dtype(b):
+        a, b = _fecha(a), _fecha(b)
+    elif tipos.is_numeric_dtype(a) or tipos.is_numeric_dtype(b):
+        a, b = (pd.to_numeric(x, errors="coerce").round(2) for x in (a, b))
+    else:
+        a, b = _texto(a), _texto(b)
+    return ((a == b) | (a.isna() & b.isna())).to_numpy()
+
+
+def claves(df, resultado):
+    """Clave de cada fila: PSP_TIN en DSN (o "op:" + Nº operación si no tiene) y Deuda_PspTin en PSD."""
+    import pandas as pd
+
+    if resultado == "psd":
+        columna = next((c for c in df.columns if str(c).strip().lower() == "deuda_psptin"), None)
+        if columna is None:
+            return pd.Series("", index=df.index)
+        return _texto(df[columna]).str.replace(r"\.0$", "", regex=True).str.lstrip("0")
+    psptin = _texto(df["PSP_TIN"]) if "PSP_TIN" in df.columns else pd.Series("", index=df.index)
+    if "Nº operación" in df.columns:
+        operacion = "op:" + _texto(df["Nº operación"]).str.replace(r"\.0$", "", regex=True).str.lstrip("0")
+        psptin = psptin.where(psptin != "", operacion)
+    return psptin
+
+
+def _convencion(df):
+    """Quita lo que solo depende de la variante del export: espacios en los encabezados y el
+    nombre completo del banco ("(BCP) - Banco de Crédito del Perú" frente a "BCP")."""
+    df = df.rename(columns=lambda c: str(c).strip())
+    if "Banco" in df.columns:
+        df = df.assign(Banco=_texto(df["Banco"]).str.upper().str.extract(r"^\(?(\w+)", expand=False))
+    return df
+
+
+def comparar(referencia, otra, resultado):
+    """Claves de un solo lado y, en las comunes, filas distintas por columna."""
+    referencia, otra = _convencion(referencia), _convencion(otra)
+    clave_ref, clave_otra = claves(referencia, resultado), claves(otra, resultado)
+    solo_ref = sorted(set(clave_ref) - set(clave_otra))
+    solo_otra = sorted(set(clave_otra) - set(clave_ref))
+
+    columnas = {}
+    ref = referencia.set_axis(clave_ref.values)
+    ref = ref[~ref.index.duplicated()]
+    otro = otra.set_axis(clave_otra.values)
+    otro = otro[~otro.index.duplicated()]
+    comunes = ref.index.intersection(otro.index)
+    for columna in ref.columns.union(otro.columns, sort=False):
+        if columna not in otro.columns:
+            columnas[columna] = "solo en la referencia"
+        elif columna not in ref.columns:
+            columnas[columna] = "solo en esta versión"
+        elif len(comunes):
+            distintas = int((~_iguales(ref.loc[comunes, columna], otro.loc[comunes, columna])).sum())
+            if distintas:
+                columnas[columna] = f"{distintas} filas distintas"
+    return {"solo_referencia": solo_ref, "solo_version": solo_otra, "columnas": columnas}
+
+
+# =================================================
+# ARNÉS
+# =================================================
+def correr_versiones(versiones, ruta_banco, metabases, carpeta):
+    """{versión: {"segundos", "mensajes", "dsn", "psd"} o {"error"}}, cada una en un proceso nuevo.
+
+    metabases: {variante: ruta del export de Metabase}; cada versión usa el de su variante.
+    """
+    salidas = {}
+    for version in versiones:
+        ruta_metabase = metabases[VARIANTES.get(version, "actual")]
+        proceso = subprocess.run(
+            [sys.executable, __file__, "--caso", version, str(ruta_banco), str(ruta_metabase), str(carpeta)],
+            cwd=RAIZ, capture_output=True, text=True,
+        )
+        lineas = proceso.stdout.strip().splitlines()
+        if proceso.returncode != 0 or not lineas:
+            motivo = "sin memoria" if proceso.returncode == -9 else proceso.stderr.strip()[-500:]
+            salidas[version] = {"error": motivo}
+            continue
+        salida = json.loads(lineas[-1])
+        if "error" not in salida:
+            with open(Path(carpeta) / f"{version}.pkl", "rb") as f:
+                salida.update(pickle.load(f))
+        salidas[version] = salida
+    return salidas
+
+
+def informe(entrada, salidas, referencia):
+    """Filas del resumen por versión y diferencias de claves contra la referencia."""
+    filas, diferencias = [], []
+    base = salidas.get(referencia)
+    for version, salida in salidas.items():
+        fila = {"entrada": entrada, "version": version}
+        if "error" in salida:
+            filas.append({**fila, "estado": salida["error"][:120]})
+            continue
+        segundos = salida["segundos"]
+        fila.update({
+            "segundos": round(segundos["total"], 3),
+            **{etapa: round(segundos[etapa], 3) for etapa in ("banco", "metabase", "cruce_y_exportar") if etapa in segundos},
+            "DSN": len(salida["dsn"]), "PSD": len(salida["psd"]),
+        })
+        if version == referencia or base is None or "error" in base:
+            filas.append({**fila, "estado": "referencia" if version == referencia else "sin referencia"})
+            continue
+        fila["x referencia"] = round(base["segundos"]["total"] / segundos["total"], 2)
+        estados = []
+        for resultado in ("dsn", "psd"):
+            diferencia = comparar(base[resultado], salida[resultado], resultado)
+            fila[f"{resultado.upper()} solo ref"] = len(diferencia["solo_referencia"])
+            fila[f"{resultado.upper()} solo versión"] = len(diferencia["solo_version"])
+            if diferencia["columnas"]:
+                estados.append(f"{resultado.upper()}: " + ", ".join(f"{c} {d}" for c, d in diferencia["columnas"].items()))
+            for lado, clave_lista in (("solo referencia", diferencia["solo_referencia"]),
+                                      ("solo versión", diferencia["solo_version"])):
+                diferencias.extend(
+                    {"entrada": entrada, "version": version, "resultado": resultado.upper(), "lado": lado, "clave": clave}
+                    for clave in clave_lista
+                )
+        # Iguales: mismas claves y, en las comunes, mismas columnas con los mismos valores
+        iguales = not estados and not any(fila[f"{r} solo ref"] or fila[f"{r} solo versión"] for r in ("DSN", "PSD"))
+        fila["estado"] = ("iguales" if iguales else "difiere") + (f" ({'; '.join(estados)})" if estados else "")
+        filas.append(fila)
+    return filas, diferencias
+
+
+def entradas(args, versiones):
+    """[(nombre, formato, ruta_banco, {variante: ruta_metabase})] de los archivos pedidos o generados.
+
+    Un export propio (--metabase) es el mismo para todas las versiones.
+    """
+    if args.banco:
+        from conciliacion.cargadores import detectar_formato
+
+        with open(args.banco, "rb") as archivo:
+            formato = detectar_formato(archivo)
+        metabases = {variante: args.metabase for variante in generador.VARIANTES_METABASE}
+        return [(args.banco.name, formato, args.banco, metabases)]
+
+    tasas = generador.tasas(args)
+    destino = DATOS / hashlib.sha1(json.dumps(tasas, sort_keys=True).encode()).hexdigest()[:8]
+    lista = []
+    for filas in args.filas:
+        for formato in args.formatos:
+            if formato != "crep" and filas > generador.MAX_FILAS_EXCEL:
+                continue
+            variantes = {"actual"} | {
+                VARIANTES[v] for v in versiones if v in VARIANTES and formato in FORMATOS_SCRIPTS
+            }
+            metabases = {}
+            for variante in sorted(variantes):
+                ruta_banco, metabases[variante] = generador.generar(
+                    formato, filas, destino, metabase="xlsx", reutilizar=True, variante=variante, **tasas
+                )
+            lista.append((f"{formato} {filas}", formato, ruta_banco, metabases))
+    return lista
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versiones", nargs="+", choices=VERSIONES, default=VERSIONES)
+    parser.add_argument("--referencia", choices=VERSIONES, default="actual")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--formatos", nargs="+", choices=generador.FORMATOS, default=list(FORMATOS_SCRIPTS))
+    parser.add_argument("--banco", type=Path, help="EECC propio en lugar de los generados")
+    parser.add_argument("--metabase", type=Path, help="export de Metabase (.xlsx) para --banco")
+    parser.add_argument("--exigir", nargs="+", choices=VERSIONES, default=[],
+                        help="versiones que deben dar los mismos DSN y PSD que la referencia (si no, código 1)")
+    parser.add_argument("-o", "--salida", type=Path, help="carpeta para los CSV de diferencias")
+    parser.add_argument("--caso", nargs=4, metavar=("VERSION", "BANCO", "METABASE", "SALIDA"), help=argparse.SUPPRESS)
+    generador.argumentos_tasas(parser)
+    args = parser.parse_args()
+
+    if args.caso:
+        correr_caso(*args.caso)
+        return 0
+    if bool(args.banco) != bool(args.metabase):
+        parser.error("--banco y --metabase van juntos")
+
+    import pandas as pd
+
+    versiones = list(dict.fromkeys([args.referencia, *args.versiones]))
+    salida = args.salida or RESULTADOS / "diferencial" / f"{datetime.now():%Y%m%d-%H%M%S}"
+    filas, diferencias = [], []
+    for nombre, formato, ruta_banco, metabases in entradas(args, versiones):
+        aplicables = [v for v in versiones if v not in SCRIPTS or formato in FORMATOS_SCRIPTS]
+        with tempfile.TemporaryDirectory(prefix="diferencial_") as carpeta:
+            salidas = correr_versiones(aplicables, ruta_banco, metabases, carpeta)
+        filas_entrada, diferencias_entrada = informe(nombre, salidas, args.referencia)
+        filas.extend(filas_entrada)
+        diferencias.extend(diferencias_entrada)
+
+    tabla = pd.DataFrame(filas)
+    with pd.option_context("display.max_columns", None, "display.width", 250, "display.max_colwidth", 120):
+        print(tabla.to_string(index=False))
+
+    RESULTADOS.mkdir(parents=True, exist_ok=True)
+    with open(RESULTADOS / "diferencial.jsonl", "a", encoding="utf-8") as archivo:
+        fecha = datetime.now().isoformat(timespec="seconds")
+        for fila in filas:
+            archivo.write(json.dumps({"fecha": fecha, "referencia": args.referencia, **fila}, ensure_ascii=False) + "\n")
+    if diferencias:
+        salida.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame(diferencias).to_csv(salida / "diferencias.csv", index=False)
+        print(f"\nClaves distintas en {salida / 'diferencias.csv'}")
+
+    fallan = sorted({
+        fila["version"] for fila in filas
+        if fila["version"] in args.exigir and not str(fila.get("estado", "")).startswith("iguales")
+    })
+    if fallan:
+        print(f"\nNo coinciden con {args.referencia}: {', '.join(fallan)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Compara los escritores de exportación sobre resultados DSN/PSD sintéticos.
+
+    python benchmarks/exportar.py                   # 10k, 100k y 1M filas
+    python benchmarks/exportar.py --filas 10000 --sin-openpyxl --memoria
+
+openpyxl es el to_excel a BytesIO que usaba la app; el resto pasa por conciliacion.exportar.
+"""
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from conciliacion.exportar import exportar  # noqa: E402
+
+
+def resultado_sintetico(filas, semilla=0):
+    """DSN/PSD con la forma de la app: PSP_TIN, Monto, Fecha, Nº operación, Banco y Moneda."""
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        "PSP_TIN": (200_000_000_000 + rng.choice(99_999_999_999, filas, replace=False)).astype(str),
+        "Monto": rng.integers(100, 500_000, filas) / 100,
+        "Fecha": pd.Timestamp("2025-12-01") + pd.to_timedelta(rng.integers(0, 7 * 86_400, filas), unit="s"),
+        "Nº operación": rng.integers(1, 999_999, filas).astype(str),
+        "Banco": rng.choice(["BCP", "BBVA"], filas),
+        " Moneda": "PEN",
+    })
+
+
+def _openpyxl(df):
+    salida = io.BytesIO()
+    with pd.ExcelWriter(salida, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False)
+    return salida
+
+
+def medir(escritor, df, memoria=False):
+    """(segundos, bytes del archivo, pico de memoria). tracemalloc frena mucho: el pico se mide aparte."""
+    start = time.perf_counter()
+    salida = escritor(df)
+    segundos = time.perf_counter() - start
+    salida.seek(0, 2)
+    tamano = salida.tell()
+
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        escritor(df)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return segundos, tamano, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sin-openpyxl", action="store_true", help="omite el escritor openpyxl (muy lento con 1M)")
+    parser.add_argument("--memoria", action="store_true", help="mide también el pico de memoria con tracemalloc")
+    args = parser.parse_args()
+
+    escritores = {
+        "xlsx (xlsxwriter streaming)": lambda df: exportar(df, "xlsx"),
+        "csv": lambda df: exportar(df, "csv"),
+        "parquet": lambda df: exportar(df, "parquet"),
+    }
+    if not args.sin_openpyxl:
+        escritores = {"xlsx (openpyxl BytesIO)": _openpyxl, **escritores}
+
+    filas = []
+    for n in args.filas:
+        df = resultado_sintetico(n)
+        for nombre, escritor in escritores.items():
+            segundos, tamano, pico = medir(escritor, df, args.memoria)
+            filas.append({
+                "filas": n, "escritor": nombre, "segundos": round(segundos, 2),
+                "MB archivo": round(tamano / 1024 ** 2, 1),
+                "MB pico": round(pico / 1024 ** 2, 1) if pico is not None else None,
+            })
+            print(filas[-1], flush=True)
+
+    print()
+    print(pd.DataFrame(filas).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
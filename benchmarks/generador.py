@@ -0,0 +1,503 @@
+"""Archivos sintéticos con la forma de los reales: CREP, EECC BCP, BBVA diario e histórico y Metabase.
+
+    python benchmarks/generador.py --formato bcp --filas 100000 -o datos/
+    python benchmarks/generador.py --formato crep --layout anterior --filas 10000000 --metabase almacen
+
+Un escenario arma primero los depósitos del banco y el Metabase que les corresponde, con tasas
+controlables: PSP_TIN duplicados, pares de extorno, depósitos sin PSP_TIN (que cruzan por
+Nº operación o por Monto + Fecha), DSN (depósitos que Metabase no tiene) y PSD (pagos de
+Metabase sin depósito). Después cada escritor lo vuelca en el formato del banco:
+
+    crep            .txt de ancho fijo; layout "actual" (v1.0.6 en adelante) o "anterior" (v5)
+    bcp             .xlsx con 7 filas de título
+    bbva            .xlsx "Movimientos del Día"
+    bbva_historico  .xlsx "Histórico de movimientos" con filas de Saldo Inicial/Final por día
+
+Metabase se escribe como el export completo (27 columnas, Deuda_PspTin en la 26, Banco en la 10,
+Moneda en la 21 y la fecha en la 15: las versiones viejas del script las buscan por posición) en
+.xlsx, o directo al almacén de particiones diarias cuando no entra en una hoja de Excel. La
+variante "legado" usa las convenciones que esperan los scripts v1.1.x y conciliaciononline.py
+(encabezado "Moneda" sin el espacio y Banco "BCP" en vez del nombre completo).
+Todo se arma con numpy por columnas, así 10M de filas se generan en segundos (menos el Excel,
+que se escribe celda por celda). Los nombres de los archivos llevan la semilla y un hash de las
+tasas, así escenarios distintos no se pisan en la misma carpeta.
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Filas de datos que entran en una hoja de Excel (1.048.576 menos encabezados y títulos)
+MAX_FILAS_EXCEL = 1_048_576 - 12
+FORMATOS = ["crep", "bcp", "bbva", "bbva_historico"]
+EXTENSIONES = {"crep": "txt", "bcp": "xlsx", "bbva": "xlsx", "bbva_historico": "xlsx"}
+NOMBRES_BANCO = {
+    "BCP": "(BCP) - Banco de Crédito del Perú",
+    "BBVA": "(BBVA) - BBVA Continental",
+    "IBK": "(IBK) - Interbank",
+}
+MEDIOS = ["VENTANILLA", "AGENTE", "BANCA MOVIL", "BANCA INTERNET", "CAJERO"]
+
+# Export de Metabase: posición -> nombre (las que usan los cruces están en su lugar real)
+COLUMNAS_METABASE = [
+    "Pago_Id", "Empresa", "Empresa_Ruc", "Cliente", "Cliente_Documento", "Deuda_Id", "Deuda_Concepto",
+    "Deuda_Vencimiento", "Estado", "Canal", "Banco", "Cuenta", "Medio_Atencion", "Nro_Operacion",
+    "Pago_Fecha", "PC_create_date_GMT_Peru", "PC_update_date_GMT_Peru", "Comision", "Monto", "Igv",
+    "Total", " Moneda", "Tipo_Cambio", "Lote", "Usuario", "Observacion", "Deuda_PspTin",
+]
+# Convenciones del export: encabezado de la moneda y si Banco trae el nombre completo o la sigla
+VARIANTES_METABASE = {
+    "actual": {"moneda": " Moneda", "nombre_banco": True},
+    "legado": {"moneda": "Moneda", "nombre_banco": False},
+}
+
+
+# =================================================
+# ESCENARIO
+# =================================================
+class Escenario:
+    """Depósitos del banco (una fila por movimiento) y el Metabase que les corresponde."""
+
+    def __init__(self, depositos, metabase, banco):
+        self.depositos = depositos
+        self.metabase = metabase
+        self.banco = banco
+
+
+def escenario(filas, banco="BCP", duplicados=0.01, extornos=0.005, sin_psptin=0.05, dsn=0.02, psd=0.02,
+              otros=0.10, dias=3, desde="2025-12-05", semilla=0):
+    """Arma un escenario de `filas` depósitos; las tasas son fracciones de esa cantidad.
+
+    duplicados: movimientos extra que repiten un PSP_TIN. extornos: depósitos que además traen
+    su extorno (mismo Nº operación, monto negativo). sin_psptin: depósitos sin PSP_TIN en la
+    descripción. dsn: depósitos que no están en Metabase. psd: pagos de Metabase sin depósito.
+    otros: filas de Metabase de otro banco o en USD, que el cruce tiene que filtrar.
+    """
+    rng = np.random.default_rng(semilla)
+    inicio = pd.Timestamp(desde)
+    n = filas
+
+    # PSP_TIN únicos sin sortear sin reemplazo: permutación por un primo, siempre de 12 dígitos
+    psptin = 210_000_000_000 + rng.permutation(n).astype(np.int64) * 7_919
+    fecha = inicio + pd.to_timedelta(rng.integers(0, dias * 86_400, n), unit="s")
+    monto = rng.integers(100, 500_000, n)  # céntimos
+    nro_op = 100_000 + np.arange(n, dtype=np.int64)
+    medio = rng.integers(0, len(MEDIOS), n)
+    tiene_psptin = rng.random(n) >= sin_psptin
+    en_meta = rng.random(n) >= dsn
+
+    depositos = pd.DataFrame({
+        "psptin": np.where(tiene_psptin, psptin, 0), "fecha": fecha, "monto": monto, "nro_op": nro_op,
+        "medio": medio, "tipo": np.where(tiene_psptin, "pago", "sin_psptin"),
+    })
+
+    # Duplicados: el mismo pago informado dos veces por el banco
+    con_psptin = np.flatnonzero(tiene_psptin)
+    repetidos = depositos.iloc[rng.choice(con_psptin, min(int(n * duplicados), len(con_psptin)), replace=False)]
+    repetidos = repetidos.assign(nro_op=nro_op[-1] + 1 + np.arange(len(repetidos)), tipo="duplicado")
+
+    # Extornos: mismo Nº operación, monto negativo, misma fecha
+    con_extorno = depositos.iloc[rng.choice(n, int(n * extornos), replace=False)]
+    extorno = con_extorno.assign(monto=-con_extorno["monto"], tipo="extorno")
+    depositos = pd.concat([depositos, repetidos, extorno], ignore_index=True)
+    depositos = depositos.sort_values("fecha", kind="stable", ignore_index=True)
+
+    # Metabase: cada depósito cruzable, con la hora de registro unos minutos después
+    pagados = np.flatnonzero(en_meta & ~np.isin(nro_op, con_extorno["nro_op"].to_numpy()))
+    registro = fecha[pagados] + pd.to_timedelta(rng.integers(0, 600, len(pagados)), unit="s")
+    # Los sin PSP_TIN llevan uno nuevo; la mitad trae el Nº operación (nivel 2), el resto cruza por Monto + Fecha
+    psptin_meta = np.where(tiene_psptin[pagados], psptin[pagados], 290_000_000_000 + pagados)
+    con_nro_op = tiene_psptin[pagados] | (rng.random(len(pagados)) < 0.5)
+    meta = pd.DataFrame({
+        "psptin": psptin_meta, "fecha": registro, "monto": monto[pagados],
+        "nro_op": np.where(con_nro_op, nro_op[pagados], -1), "medio": medio[pagados],
+        "banco": banco, "moneda": "PEN",
+    })
+
+    # PSD: pagados en Kashio sin depósito, dentro de la misma ventana
+    n_psd = int(n * psd)
+    meta_psd = pd.DataFrame({
+        "psptin": 280_000_000_000 + np.arange(n_psd, dtype=np.int64),
+        "fecha": inicio + pd.to_timedelta(rng.integers(0, dias * 86_400, n_psd), unit="s"),
+        "monto": rng.integers(100, 500_000, n_psd), "nro_op": -1, "medio": rng.integers(0, len(MEDIOS), n_psd),
+        "banco": banco, "moneda": "PEN",
+    })
+
+    # Ruido: otros bancos y pagos en USD
+    n_otros = int(n * otros)
+    otro_banco = [b for b in NOMBRES_BANCO if b != banco]
+    meta_otros = pd.DataFrame({
+        "psptin": 270_000_000_000 + np.arange(n_otros, dtype=np.int64),
+        "fecha": inicio + pd.to_timedelta(rng.integers(0, dias * 86_400, n_otros), unit="s"),
+        "monto": rng.integers(100, 500_000, n_otros), "nro_op": -1,
+        "medio": rng.integers(0, len(MEDIOS), n_otros),
+        "banco": rng.choice(otro_banco + [banco], n_otros),
+        "moneda": np.where(rng.random(n_otros) < 0.5, "USD", "PEN"),
+    })
+    metabase = pd.concat([meta, meta_psd, meta_otros], ignore_index=True)
+    metabase = metabase.iloc[rng.permutation(len(metabase))].reset_index(drop=True)
+    return Escenario(depositos, metabase, banco)
+
+
+def _descripcion(depositos, prefijo):
+    """Texto del movimiento: el PSP_TIN entre otras palabras, o nada para los sin PSP_TIN."""
+    psptin = depositos["psptin"].astype(str)
+    texto = np.where(depositos["psptin"] > 0, prefijo + " " + psptin + " KASHIO", "ABONO " + depositos["nro_op"].astype(str))
+    texto = pd.Series(texto, index=depositos.index)
+    extorno = depositos["tipo"] == "extorno"
+    texto[extorno] = "EXTORNO " + texto[extorno]
+    return texto
+
+
+# =================================================
+# CREP (.txt de ancho fijo)
+# =================================================
+# campo -> (inicio, ancho) en cada layout
+LAYOUTS_CREP = {
+    "actual": {"largo": 240, "fecha": (57, 8), "monto": (73, 15), "nro_op": (124, 6), "medio": (156, 12),
+               "hora": (168, 6), "psptin": (205, 12)},
+    "anterior": {"largo": 150, "fecha": (47, 8), "hora": (55, 6), "monto": (63, 13), "psptin": (111, 12),
+                 "medio": (123, 11)},
+}
+
+
+def _digitos(valores, ancho):
+    """Matriz (n, ancho) de dígitos ASCII con ceros a la izquierda."""
+    potencias = 10 ** np.arange(ancho - 1, -1, -1, dtype=np.int64)
+    return (np.asarray(valores, dtype=np.int64)[:, None] // potencias % 10 + 48).astype(np.uint8)
+
+
+def _texto_fijo(textos, ancho):
+    """Matriz (n, ancho) de textos ASCII rellenos con espacios."""
+    matriz = np.frombuffer(np.array(textos, dtype=f"S{ancho}").tobytes(), dtype=np.uint8).reshape(-1, ancho)
+    # numpy rellena los S{ancho} con NUL
+    return np.where(matriz == 0, ord(" "), matriz).astype(np.uint8)
+
+
+def escribir_crep(escenario, ruta, layout="actual", lote=500_000):
+    """CREP: cabecera CC y una línea DD por pago. Los pagos extornados no llegan al CREP."""
+    campos = LAYOUTS_CREP[layout]
+    depositos = escenario.depositos
+    extornados = depositos.loc[depositos["tipo"] == "extorno", "nro_op"]
+    depositos = depositos[~depositos["nro_op"].isin(extornados)]
+    medios = np.array(MEDIOS)
+
+    with open(ruta, "wb") as archivo:
+        archivo.write(b"CC" + b" " * (campos["largo"] - 2) + b"\n")
+        for inicio in range(0, len(depositos), lote):
+            bloque = depositos.iloc[inicio:inicio + lote]
+            lineas = np.full((len(bloque), campos["largo"] + 1), ord(" "), dtype=np.uint8)
+            lineas[:, :2] = np.frombuffer(b"DD", dtype=np.uint8)
+            lineas[:, -1] = ord("\n")
+
+            fecha = bloque["fecha"].dt
+            valores = {
+                "fecha": fecha.year * 10_000 + fecha.month * 100 + fecha.day,
+                "hora": fecha.hour * 10_000 + fecha.minute * 100 + fecha.second,
+                "monto": bloque["monto"],
+                "nro_op": bloque["nro_op"] % 1_000_000,
+                "psptin": bloque["psptin"],
+            }
+            for campo, valor in valores.items():
+                if campo in campos:
+                    posicion, ancho = campos[campo]
+                    lineas[:, posicion:posicion + ancho] = _digitos(valor, ancho)
+            posicion, ancho = campos["medio"]
+            lineas[:, posicion:posicion + ancho] = _texto_fijo(medios[bloque["medio"]], ancho)
+            archivo.write(lineas.tobytes())
+    return ruta
+
+
+# =================================================
+# EECC EN EXCEL
+# =================================================
+def _escribir_libro(ruta, titulos, df, fechas=()):
+    """Libro de una hoja: filas de título, encabezado y datos; las columnas de fechas como fecha de Excel."""
+    import xlsxwriter
+
+    if len(df) > MAX_FILAS_EXCEL:
+        raise ValueError(f"{len(df)} filas no entran en una hoja de Excel (máximo {MAX_FILAS_EXCEL})")
+
+    libro = xlsxwriter.Workbook(ruta, {"constant_memory": True})
+    hoja = libro.add_worksheet()
+    formato_fecha = libro.add_format({"num_format": "dd/mm/yyyy hh:mm:ss"})
+    for i, titulo in enumerate(titulos):
+        if titulo is not None:
+            hoja.write_string(i, 0, titulo)
+    fila = len(titulos)
+    hoja.write_row(fila, 0, list(df.columns))
+
+    columnas = [
+        (j, df[col].dt.to_pydatetime().tolist() if col in fechas else df[col].astype(object).where(df[col].notna(), None).tolist())
+        for j, col in enumerate(df.columns)
+    ]
+    es_fecha = [col in fechas for col in df.columns]
+    for i, valores in enumerate(zip(*(v for _, v in columnas)), start=fila + 1):
+        for j, valor in enumerate(valores):
+            if valor is None:
+                continue
+            if es_fecha[j]:
+                hoja.write_datetime(i, j, valor, formato_fecha)
+            else:
+                hoja.write(i, j, valor)
+    libro.close()
+    return ruta
+
+
+def escribir_bcp(escenario, ruta):
+    depositos = escenario.depositos
+    df = pd.DataFrame({
+        "Fecha": depositos["fecha"].dt.normalize(),
+        "Fecha valuta": depositos["fecha"].dt.normalize(),
+        "Descripción operación": _descripcion(depositos, "PAGO"),
+        "Monto": depositos["monto"] / 100,
+        "Sucursal": "193",
+        "Nº operación": depositos["nro_op"].astype(str),
+    })
+    titulos = ["Estado de cuenta", "Cuenta corriente", None, None, None, None, None]
+    return _escribir_libro(ruta, titulos, df, fechas=("Fecha", "Fecha valuta"))
+
+
+def escribir_bbva(escenario, ruta):
+    depositos = escenario.depositos
+    dia = depositos["fecha"].dt.strftime("%d-%m-%Y")
+    df = pd.DataFrame({
+        "F.Operación": dia,
+        "F.Valor": dia,
+        "Concepto": _descripcion(depositos, "ABONO"),
+        "Importe": depositos["monto"] / 100,
+        "Núm.Movimiento": depositos["nro_op"],
+    })
+    titulos = ["Movimientos del Día"] + [None] * 9
+    return _escribir_libro(ruta, titulos, df)
+
+
+def escribir_bbva_historico(escenario, ruta):
+    """Histórico: cada día abre con "Saldo Inicial: dd-mm-aaaa" y cierra con "Saldo Final: …"."""
+    depositos = escenario.depositos
+    dia = depositos["fecha"].dt.strftime("%d-%m-%Y")
+    df = pd.DataFrame({
+        "F. Operación": dia,
+        "F. Valor": dia,
+        "Código": "C01",
+        "Nº. Doc.": depositos["nro_op"].astype(str),
+        "Concepto": _descripcion(depositos, "ABONO"),
+        "Importe": depositos["monto"] / 100,
+        "Oficina": "0486",
+    })
+    partes = []
+    for texto, grupo in df.groupby(dia, sort=False):
+        saldo = {"F. Operación": texto, "F. Valor": texto, "Importe": grupo["Importe"].sum()}
+        partes += [
+            pd.DataFrame([{**saldo, "Concepto": f"Saldo Inicial: {texto}"}]),
+            grupo,
+            pd.DataFrame([{**saldo, "Concepto": f"Saldo Final: {texto}"}]),
+        ]
+    titulos = ["Histórico de movimientos"] + [None] * 9
+    return _escribir_libro(ruta, titulos, pd.concat(partes, ignore_index=True)[df.columns])
+
+
+ESCRITORES = {
+    "crep": escribir_crep,
+    "bcp": escribir_bcp,
+    "bbva": escribir_bbva,
+    "bbva_historico": escribir_bbva_historico,
+}
+
+
+# =================================================
+# METABASE
+# =================================================
+def export_metabase(escenario, filas=slice(None), variante="actual"):
+    """DataFrame con las 27 columnas del export de Metabase (filas: un tramo del escenario).
+
+    variante: una de VARIANTES_METABASE.
+    """
+    convencion = VARIANTES_METABASE[variante]
+    meta = escenario.metabase.iloc[filas]
+    ids = meta.index.to_numpy() + 1
+    bancos = pd.Categorical(meta["banco"])
+    nombres_banco = np.array([NOMBRES_BANCO[b] if convencion["nombre_banco"] else b for b in bancos.categories])
+    monto = meta["monto"] / 100
+    valores = {
+        "Pago_Id": ids,
+        "Empresa": "EMPRESA DEMO SAC",
+        "Empresa_Ruc": "20123456789",
+        "Cliente": "CLIENTE",
+        "Cliente_Documento": "00000000",
+        "Deuda_Id": ids,
+        "Deuda_Concepto": "CUOTA",
+        "Deuda_Vencimiento": meta["fecha"].dt.normalize(),
+        "Estado": "PAGADO",
+        "Canal": "BANCO",
+        "Banco": nombres_banco[bancos.codes],
+        "Cuenta": "193-0000000-0-00",
+        "Medio_Atencion": np.array(MEDIOS)[meta["medio"]],
+        "Nro_Operacion": meta["nro_op"].where(meta["nro_op"] >= 0).astype("Int64").astype("string"),
+        "Pago_Fecha": meta["fecha"],
+        "PC_create_date_GMT_Peru": meta["fecha"],
+        "PC_update_date_GMT_Peru": meta["fecha"],
+        "Comision": 0.0,
+        "Monto": monto,
+        "Igv": 0.0,
+        "Total": monto,
+        " Moneda": meta["moneda"],
+        "Tipo_Cambio": 1.0,
+        "Lote": 1,
+        "Usuario": "sistema",
+        "Observacion": None,
+        "Deuda_PspTin": meta["psptin"],
+    }
+    df = pd.DataFrame(valores, columns=COLUMNAS_METABASE).reset_index(drop=True)
+    return df.rename(columns={" Moneda": convencion["moneda"]})
+
+
+def escribir_metabase(escenario, ruta, variante="actual"):
+    df = export_metabase(escenario, variante=variante)
+    fechas = ("Deuda_Vencimiento", "Pago_Fecha", "PC_create_date_GMT_Peru", "PC_update_date_GMT_Peru")
+    return _escribir_libro(ruta, [], df, fechas=fechas)
+
+
+def escribir_almacen(escenario, carpeta, lote=1_000_000):
+    """Metabase directo al almacén de particiones diarias (para volúmenes que Excel no admite).
+
+    Mismo layout que almacen.importar_snapshot (fecha=AAAA-MM-DD/datos.parquet, PSP_TIN como
+    texto), pero por lotes y con un ParquetWriter por día: el export completo nunca está
+    entero en memoria.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    escritores = {}
+    try:
+        for inicio in range(0, len(escenario.metabase), lote):
+            df = export_metabase(escenario, slice(inicio, inicio + lote))
+            df["Deuda_PspTin"] = df["Deuda_PspTin"].astype(str)
+            dias = df["PC_create_date_GMT_Peru"].dt.strftime("%Y-%m-%d")
+            for dia, parte in df.groupby(dias, sort=False):
+                tabla = pa.Table.from_pandas(parte, preserve_index=False)
+                if dia not in escritores:
+                    ruta = Path(carpeta) / f"fecha={dia}" / "datos.parquet"
+                    ruta.parent.mkdir(parents=True, exist_ok=True)
+                    escritores[dia] = pq.ParquetWriter(ruta, tabla.schema)
+                escritores[dia].write_table(tabla.cast(escritores[dia].schema))
+    finally:
+        for escritor in escritores.values():
+            escritor.close()
+    return Path(carpeta)
+
+
+# =================================================
+# LÍNEA DE COMANDOS
+# =================================================
+def _tasas_completas(tasas):
+    """Tasas del escenario con los valores por defecto de escenario() para las que faltan."""
+    completas = {
+        nombre: parametro.default for nombre, parametro in inspect.signature(escenario).parameters.items()
+        if parametro.default is not parametro.empty and nombre != "banco"
+    }
+    completas.update(tasas)
+    return completas
+
+
+def rutas(formato, filas, destino, metabase="auto", layout="actual", variante="actual", **tasas):
+    """(ruta_banco, ruta_metabase) que escribe generar con esos parámetros.
+
+    metabase "auto" elige xlsx si el export entra en una hoja (cota: filas × (1 + psd + otros)).
+    Los nombres llevan la semilla y un hash de las tasas (las que faltan, con su valor por defecto).
+    """
+    destino = Path(destino)
+    tasas = _tasas_completas(tasas)
+    escenario_id = f"s{tasas['semilla']}_{hashlib.sha1(json.dumps(tasas, sort_keys=True).encode()).hexdigest()[:8]}"
+    banco = "BBVA" if formato.startswith("bbva") else "BCP"
+    nombre = f"{formato}_{layout}" if formato == "crep" else formato
+    if metabase == "auto":
+        metabase = "xlsx" if filas * (1 + tasas["psd"] + tasas["otros"]) <= MAX_FILAS_EXCEL else "almacen"
+    sufijo = f"_{variante}" if variante != "actual" else ""
+    ruta_metabase = (
+        destino / f"metabase_{banco}_{filas}_{escenario_id}{sufijo}.xlsx" if metabase == "xlsx"
+        else destino / f"almacen_{banco}_{filas}_{escenario_id}"
+    )
+    return destino / f"{nombre}_{filas}_{escenario_id}.{EXTENSIONES[formato]}", ruta_metabase
+
+
+def generar(formato, filas, destino, metabase="auto", layout="actual", reutilizar=False, variante="actual",
+            **tasas):
+    """Escribe el EECC y su Metabase en destino; devuelve (ruta_banco, ruta_metabase).
+
+    Con reutilizar no se reescriben los que ya existen (el CREP y el EECC BCP comparten Metabase).
+    variante: convenciones del export de Metabase (VARIANTES_METABASE); el almacén solo admite
+    la actual, que es la que importa la app.
+    """
+    ruta_banco, ruta_metabase = rutas(formato, filas, destino, metabase, layout, variante, **tasas)
+    if variante != "actual" and ruta_metabase.suffix != ".xlsx":
+        raise ValueError(f"La variante {variante!r} de Metabase solo se escribe en .xlsx")
+    pendientes = [ruta for ruta in (ruta_banco, ruta_metabase) if not (reutilizar and ruta.exists())]
+    if not pendientes:
+        return ruta_banco, ruta_metabase
+
+    Path(destino).mkdir(parents=True, exist_ok=True)
+    datos = escenario(filas, "BBVA" if formato.startswith("bbva") else "BCP", **tasas)
+    if ruta_banco in pendientes:
+        if formato == "crep":
+            escribir_crep(datos, ruta_banco, layout)
+        else:
+            ESCRITORES[formato](datos, ruta_banco)
+    if ruta_metabase in pendientes:
+        if ruta_metabase.suffix == ".xlsx":
+            escribir_metabase(datos, ruta_metabase, variante)
+        else:
+            escribir_almacen(datos, ruta_metabase)
+    return ruta_banco, ruta_metabase
+
+
+def argumentos_tasas(parser):
+    """Opciones de las tasas del escenario (las comparte la suite de benchmarks)."""
+    parser.add_argument("--duplicados", type=float, default=0.01, help="PSP_TIN repetidos (fracción de filas)")
+    parser.add_argument("--extornos", type=float, default=0.005, help="depósitos con su extorno")
+    parser.add_argument("--sin-psptin", type=float, default=0.05, help="depósitos sin PSP_TIN")
+    parser.add_argument("--dsn", type=float, default=0.02, help="depósitos que Metabase no tiene")
+    parser.add_argument("--psd", type=float, default=0.02, help="pagos de Metabase sin depósito")
+    parser.add_argument("--otros", type=float, default=0.10, help="filas de Metabase de otro banco o en USD")
+    parser.add_argument("--dias", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+
+
+def tasas(args):
+    return {
+        "duplicados": args.duplicados, "extornos": args.extornos, "sin_psptin": args.sin_psptin,
+        "dsn": args.dsn, "psd": args.psd, "otros": args.otros, "dias": args.dias, "semilla": args.semilla,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formato", choices=FORMATOS, default="crep")
+    parser.add_argument("--layout", choices=list(LAYOUTS_CREP), default="actual", help="solo para crep")
+    parser.add_argument("--filas", type=int, default=10_000, help="depósitos del banco")
+    parser.add_argument("--metabase", choices=["auto", "xlsx", "almacen"], default="auto",
+                        help="auto: xlsx si entra en una hoja, si no el almacén de particiones")
+    parser.add_argument("--variante", choices=list(VARIANTES_METABASE), default="actual",
+                        help="legado: Metabase como lo leen los scripts v1.1.x y conciliaciononline.py")
+    parser.add_argument("-o", "--salida", type=Path, default=Path("datos"))
+    parser.add_argument("--reutilizar", action="store_true", help="no reescribir los archivos que ya existen")
+    argumentos_tasas(parser)
+    args = parser.parse_args()
+
+    ruta_banco, ruta_metabase = generar(
+        args.formato, args.filas, args.salida, args.metabase, args.layout, args.reutilizar, args.variante,
+        **tasas(args)
+    )
+    print(f"EECC: {ruta_banco}")
+    print(f"Metabase: {ruta_metabase}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Prueba de carga del servicio HTTP de conciliación, todo en localhost.
+
+    python benchmarks/servicio.py --banco CREP.txt --metabase Metabase.xlsx
+    python benchmarks/servicio.py --banco CREP.txt --metabase Metabase.xlsx --clientes 16 --pedidos 64 --trabajos
+
+Levanta python -m conciliacion.servicio en un puerto libre, lanza pedidos concurrentes y reporta
+latencias, pedidos por segundo y cuántos recibieron 503 (cola llena). Con --trabajos usa
+POST /trabajos y consulta el estado hasta que termina, como haría un cliente con archivos grandes;
+con --reintentar los clientes vuelven a mandar los pedidos rechazados.
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def multipart(campos, archivos):
+    """(cuerpo, content-type) de un formulario multipart; archivos es nombre_campo -> ruta."""
+    limite = uuid.uuid4().hex
+    partes = []
+    for nombre, valor in campos.items():
+        partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"\r\n\r\n{valor}\r\n'.encode())
+    for nombre, ruta in archivos.items():
+        ruta = Path(ruta)
+        partes.append(
+            f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"; filename="{ruta.name}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + ruta.read_bytes() + b"\r\n"
+        )
+    partes.append(f"--{limite}--\r\n".encode())
+    return b"".join(partes), f"multipart/form-data; boundary={limite}"
+
+
+def pedir(url, cuerpo=None, tipo=None):
+    """(código HTTP, JSON de respuesta)."""
+    pedido = urllib.request.Request(url, data=cuerpo, headers={"Content-Type": tipo} if tipo else {})
+    try:
+        with urllib.request.urlopen(pedido, timeout=600) as respuesta:
+            return respuesta.status, json.loads(respuesta.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read() or b"{}")
+
+
+def cliente(base, cuerpo, tipo, trabajos, reintentar=False):
+    """Un pedido completo; devuelve (código, segundos). Con reintentar, los 503 se vuelven a mandar."""
+    start = time.perf_counter()
+    destino = f"{base}/trabajos" if trabajos else f"{base}/conciliar"
+    while True:
+        codigo, datos = pedir(destino, cuerpo, tipo)
+        if codigo != 503 or not reintentar:
+            break
+        time.sleep(0.5)
+    if not trabajos or codigo != 202:
+        return codigo, time.perf_counter() - start
+    url = f"{base}{datos['url']}"
+    while True:
+        time.sleep(0.1)
+        codigo, datos = pedir(url)
+        if datos.get("estado") in ("listo", "error"):
+            return (200 if datos["estado"] == "listo" else 422), time.perf_counter() - start
+
+
+def esperar_servicio(base, proceso, limite=60):
+    start = time.time()
+    while time.time() - start < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servicio terminó al arrancar")
+        try:
+            return pedir(f"{base}/salud")[1]
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servicio no respondió a tiempo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--banco", type=Path, required=True)
+    parser.add_argument("--metabase", type=Path, help="sin él, el servicio usa su almacén local")
+    parser.add_argument("--clientes", type=int, default=8, help="pedidos en vuelo a la vez")
+    parser.add_argument("--pedidos", type=int, default=32)
+    parser.add_argument("--trabajadores", type=int, default=2)
+    parser.add_argument("--cola", type=int, default=4)
+    parser.add_argument("--trabajos", action="store_true", help="POST /trabajos y consulta de estado")
+    parser.add_argument("--reintentar", action="store_true", help="los clientes reintentan los 503 cada 0,5s")
+    args = parser.parse_args()
+
+    puerto = _puerto_libre()
+    base = f"http://127.0.0.1:{puerto}"
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "conciliacion.servicio", "--puerto", str(puerto),
+         "--trabajadores", str(args.trabajadores), "--cola", str(args.cola)],
+        cwd=RAIZ,
+    )
+    try:
+        esperar_servicio(base, proceso)
+        archivos = {"banco": args.banco, **({"metabase": args.metabase} if args.metabase else {})}
+        cuerpo, tipo = multipart({"margen": 1}, archivos)
+
+        # Un pedido de calentamiento: los procesos del pool ya tienen pandas importado
+        print("calentamiento:", cliente(base, cuerpo, tipo, False))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clientes) as pool:
+            resultados = list(pool.map(lambda _: cliente(base, cuerpo, tipo, args.trabajos, args.reintentar), range(args.pedidos)))
+        segundos = time.perf_counter() - start
+        salud = pedir(f"{base}/salud")[1]
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+    codigos = {}
+    for codigo, _ in resultados:
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+    latencias = sorted(s for codigo, s in resultados if codigo == 200)
+
+    print(f"{args.pedidos} pedidos, {args.clientes} clientes, {args.trabajadores} trabajadores, cola {args.cola}")
+    print(f"códigos: {codigos}  ·  503 respondidos por el servicio: {salud['rechazados']}")
+    print(f"{len(latencias) / segundos:.2f} conciliaciones/s en {segundos:.2f}s")
+    if latencias:
+        print(
+            f"latencia p50 {latencias[len(latencias) // 2]:.2f}s · "
+            f"p95 {latencias[min(int(len(latencias) * 0.95), len(latencias) - 1)]:.2f}s · "
+            f"máx {latencias[-1]:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Suite de benchmarks por etapa (carga, limpieza, cruce y exportación) de 10k a 10M filas.
+
+    python benchmarks/suite.py                                    # 10k, 100k y 1M, los cuatro formatos
+    python benchmarks/suite.py --filas 10000000 --formatos crep   # 10M: CREP + almacén de Metabase
+    python benchmarks/suite.py --comparar 62d6b0b a242984          # etapa por etapa entre dos versiones
+
+Los archivos salen de benchmarks/generador.py y se guardan en benchmarks/datos/ (una carpeta
+por juego de tasas), así se generan una sola vez. Los EECC en Excel no pasan de una hoja
+(1.048.576 filas): por encima se omiten, y Metabase va al almacén de particiones.
+
+Cada caso corre en un intérprete nuevo, en frío y bajo una traza de conciliacion.trazas: las
+etapas son las mismas del panel Rendimiento, más la exportación de DSN y PSD a xlsx. Si el
+sistema mata el caso por memoria, queda registrado como falla y la suite sigue. Los resultados
+se agregan a benchmarks/resultados/suite.jsonl con la versión (commit de git, "+cambios" si
+hay archivos modificados, o --version) para compararlas después.
+"""
+import argparse
+import hashlib
+import json
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+DATOS = RAIZ / "benchmarks" / "datos"
+RESULTADOS = RAIZ / "benchmarks" / "resultados" / "suite.jsonl"
+
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / "benchmarks"))
+
+import generador  # noqa: E402
+
+
+def version_git():
+    """Commit corto de HEAD, con "+cambios" si hay archivos versionados modificados."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        cambios = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+    return f"{commit}+cambios" if cambios else commit
+
+
+# =================================================
+# UN CASO (corre en su propio intérprete)
+# =================================================
+def correr_caso(ruta_banco, metabase):
+    """Concilia y exporta DSN/PSD bajo una traza; imprime el resultado en JSON por stdout."""
+    from conciliacion.cruce import conciliar_archivos
+    from conciliacion.exportar import exportar
+    from conciliacion.trazas import Traza, trazar
+
+    traza = Traza("suite")
+    metabase = Path(metabase)
+    start = time.perf_counter()
+    with trazar(traza):
+        with open(ruta_banco, "rb") as archivo:
+            if metabase.is_dir():
+                resultado = conciliar_archivos(archivo, metabase)
+            else:
+                with open(metabase, "rb") as archivo_metabase:
+                    resultado = conciliar_archivos(archivo, archivo_metabase)
+        for nombre in ("dsn", "psd"):
+            exportar(resultado[nombre], "xlsx").close()
+    print(json.dumps({
+        "segundos": round(time.perf_counter() - start, 6),
+        "pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "dsn": len(resultado["dsn"]),
+        "psd": len(resultado["psd"]),
+        "registros": traza.registros,
+    }))
+
+
+def filas_banco(formato, filas, tasas):
+    """Filas que tendría la hoja del EECC (para saber si entra en Excel)."""
+    extra = tasas["duplicados"] + tasas["extornos"]
+    return int(filas * (1 + extra)) + (2 * tasas["dias"] if formato == "bbva_historico" else 0)
+
+
+def _motivo(proceso):
+    if proceso.returncode == -9:
+        return "sin memoria (proceso terminado por el sistema)"
+    return proceso.stderr.strip()[-500:]
+
+
+def caso(formato, filas, tasas, limite=None):
+    """Genera (o reutiliza) los archivos y corre el caso en un proceso aparte; devuelve un dict."""
+    if formato != "crep" and filas_banco(formato, filas, tasas) > generador.MAX_FILAS_EXCEL:
+        return {"estado": "omitido", "motivo": "el EECC no entra en una hoja de Excel"}
+
+    clave = hashlib.sha1(json.dumps(tasas, sort_keys=True).encode()).hexdigest()[:8]
+    destino = DATOS / clave
+    ruta_banco, ruta_metabase = generador.rutas(formato, filas, destino, **tasas)
+    # También en otro proceso: la memoria del generador no debe pesar en la medición
+    opciones = [f"--{nombre.replace('_', '-')}={valor}" for nombre, valor in tasas.items()]
+    start = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, generador.__file__, "--formato", formato, "--filas", str(filas), "-o", str(destino),
+         "--reutilizar", *opciones],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    generacion = time.perf_counter() - start
+    if proceso.returncode != 0:
+        return {"estado": "falla", "motivo": "generación: " + _motivo(proceso)}
+
+    try:
+        proceso = subprocess.run(
+            [sys.executable, __file__, "--caso", str(ruta_banco), str(ruta_metabase)],
+            cwd=RAIZ, capture_output=True, text=True, timeout=limite,
+        )
+    except subprocess.TimeoutExpired:
+        return {"estado": "falla", "motivo": f"pasó el límite de {limite}s"}
+    if proceso.returncode != 0:
+        return {"estado": "falla", "motivo": _motivo(proceso)}
+
+    datos = json.loads(proceso.stdout.splitlines()[-1])
+    return {
+        "estado": "ok", "metabase": "almacen" if ruta_metabase.is_dir() else "xlsx",
+        "generacion": round(generacion, 2), **datos,
+    }
+
+
+# =================================================
+# RESULTADOS
+# =================================================
+def registros_suite(version, formato, filas, resultado):
+    """Líneas del JSON lines: una por etapa (las repetidas se suman) y una "total"."""
+    base = {
+        "version": version, "fecha": datetime.now().isoformat(timespec="seconds"),
+        "formato": formato, "filas": filas, "estado": resultado["estado"],
+    }
+    if resultado["estado"] != "ok":
+        return [{**base, "etapa": "total", "motivo": resultado["motivo"]}]
+
+    base["metabase"] = resultado["metabase"]
+    etapas = {}
+    for registro in resultado["registros"]:
+        suma = etapas.setdefault(registro["etapa"], {"segundos": 0.0, "cpu": 0.0, "filas_entrada": None,
+                                                     "filas_salida": None, "bytes": None})
+        suma["segundos"] += registro["segundos"]
+        suma["cpu"] += registro["cpu"]
+        for campo in ("filas_entrada", "filas_salida", "bytes"):
+            if registro[campo] is not None:
+                suma[campo] = (suma[campo] or 0) + registro[campo]
+    lineas = [{**base, "etapa": nombre, **suma} for nombre, suma in etapas.items()]
+    lineas.append({
+        **base, "etapa": "total", "segundos": resultado["segundos"], "pico_mb": resultado["pico_mb"],
+        "dsn": resultado["dsn"], "psd": resultado["psd"], "generacion": resultado["generacion"],
+    })
+    return lineas
+
+
+def guardar(lineas, ruta=RESULTADOS):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, "a", encoding="utf-8") as archivo:
+        for linea in lineas:
+            archivo.write(json.dumps(linea, ensure_ascii=False) + "\n")
+
+
+def leer(ruta=RESULTADOS):
+    import pandas as pd
+
+    with open(ruta, encoding="utf-8") as archivo:
+        return pd.DataFrame([json.loads(linea) for linea in archivo if linea.strip()])
+
+
+def comparar(antes, despues, ruta=RESULTADOS):
+    """Mejor tiempo de cada etapa en las dos versiones y cuántas veces más rápida es la segunda."""
+    import pandas as pd
+
+    df = leer(ruta)
+    df = df[(df["estado"] == "ok") & df["version"].isin([antes, despues])]
+    mejores = df.groupby(["formato", "filas", "etapa", "version"])["segundos"].min().unstack("version")
+    faltan = [v for v in (antes, despues) if v not in mejores.columns]
+    if faltan:
+        raise SystemExit(f"Sin resultados para {', '.join(faltan)} en {ruta}")
+    mejores = mejores.dropna()
+    mejores["aceleración"] = (mejores[antes] / mejores[despues]).round(2)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(mejores.round(4).to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--formatos", nargs="+", choices=generador.FORMATOS, default=generador.FORMATOS)
+    parser.add_argument("--repeticiones", type=int, default=1, help="corridas por caso; se guardan todas")
+    parser.add_argument("--limite", type=float, help="segundos máximos por caso")
+    parser.add_argument("--version", help="etiqueta de la versión (por defecto el commit de git)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"), help="compara dos versiones guardadas")
+    parser.add_argument("--caso", nargs=2, metavar=("BANCO", "METABASE"), help=argparse.SUPPRESS)
+    generador.argumentos_tasas(parser)
+    args = parser.parse_args()
+
+    if args.caso:
+        correr_caso(*args.caso)
+        return
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    version = args.version or version_git()
+    tasas = generador.tasas(args)
+    resumen = []
+    for filas in args.filas:
+        for formato in args.formatos:
+            for _ in range(args.repeticiones):
+                resultado = caso(formato, filas, tasas, args.limite)
+                lineas = registros_suite(version, formato, filas, resultado)
+                guardar(lineas)
+                total = lineas[-1]
+                resumen.extend(linea for linea in lineas if linea["estado"] == "ok")
+                if resultado["estado"] == "ok":
+                    print(f"{formato} {filas}: {total['segundos']:.2f}s, pico {total['pico_mb']} MB, "
+                          f"DSN {total['dsn']}, PSD {total['psd']}", flush=True)
+                else:
+                    print(f"{formato} {filas}: {resultado['estado']} ({resultado['motivo']})", flush=True)
+
+    if resumen:
+        import pandas as pd
+
+        tabla = pd.DataFrame(resumen).groupby(["etapa", "formato", "filas"], sort=False)["segundos"].min()
+        print()
+        print(f"Segundos por etapa (versión {version}, mejor de {args.repeticiones}):")
+        print(tabla.unstack(["formato", "filas"]).round(3).to_string())
+    print(f"\nResultados en {RESULTADOS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Núcleo de la conciliación DSN/PSD compartido por la app de Streamlit y la línea de comandos.
+
+cargadores, cruce y reporte no dependen de Streamlit (python -m conciliacion --help).
+Los motores opcionales (DuckDB, ...) viven en submódulos y se importan solo cuando se usan.
+"""
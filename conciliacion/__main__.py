@@ -0,0 +1,5 @@
+import sys
+
+from conciliacion.cli import main
+
+sys.exit(main())
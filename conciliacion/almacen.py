@@ -0,0 +1,106 @@
+"""Almacén local de Metabase: cada export se reparte en particiones diarias (parquet).
+
+Leer una ventana de fechas abre solo las particiones de esos días, sin volver a parsear Excel.
+Importar reescribe cada partición con un bloqueo por partición (entre hilos y, donde hay fcntl,
+entre procesos) y un temporal propio: dos imports del mismo día no se pisan las filas.
+"""
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from conciliacion.trazas import etapa, marco
+
+DIR_SNAPSHOTS = Path(os.environ.get("CONCILIACION_SNAPSHOTS", "snapshots_metabase"))
+SIN_FECHA = "sin_fecha"
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_candados = {}
+_candado_candados = threading.Lock()
+
+
+def _ruta_particion(dia, carpeta=DIR_SNAPSHOTS):
+    return Path(carpeta) / f"fecha={dia}" / "datos.parquet"
+
+
+@contextmanager
+def _bloqueo(ruta):
+    """Exclusión para leer, combinar y reescribir una partición."""
+    with _candado_candados:
+        candado = _candados.setdefault(ruta.resolve(), threading.Lock())
+    with candado:
+        if fcntl is None:
+            yield
+            return
+        with open(ruta.with_name(".bloqueo"), "a") as archivo:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def importar_snapshot(df_meta, col_psptin="Deuda_PspTin", col_fecha="PC_create_date_GMT_Peru",
+                      carpeta=DIR_SNAPSHOTS):
+    """Reparte un export de Metabase en particiones diarias (parquet) por col_fecha.
+
+    Las filas ya guardadas se reemplazan por PSP_TIN (gana el export más reciente).
+    PC_create_date_GMT_Peru no cambia entre exports, así que un PSP_TIN siempre cae en
+    la misma partición. Devuelve la cantidad de particiones tocadas.
+    """
+    df_meta = df_meta.copy(deep=False)
+    df_meta[col_psptin] = df_meta[col_psptin].astype(str)
+    texto = df_meta.select_dtypes(include="object").columns
+    df_meta[texto] = df_meta[texto].astype("string")
+
+    dias = df_meta[col_fecha].dt.strftime("%Y-%m-%d").fillna(SIN_FECHA)
+    for dia, nuevo in df_meta.groupby(dias, sort=False):
+        ruta = _ruta_particion(dia, carpeta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        with _bloqueo(ruta):
+            if ruta.exists():
+                nuevo = pd.concat([pd.read_parquet(ruta), nuevo], ignore_index=True)
+            nuevo = nuevo.drop_duplicates(subset=col_psptin, keep="last")
+
+            temporal = ruta.with_name(f"datos.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                nuevo.to_parquet(temporal, index=False)
+                temporal.replace(ruta)
+            finally:
+                temporal.unlink(missing_ok=True)
+
+    return dias.nunique()
+
+
+def hay_snapshot(carpeta=DIR_SNAPSHOTS):
+    return any(Path(carpeta).glob("fecha=*/datos.parquet"))
+
+
+def version_snapshot(carpeta=DIR_SNAPSHOTS):
+    """Cambia cada vez que se importa un export al almacén."""
+    return max((ruta.stat().st_mtime_ns for ruta in Path(carpeta).glob("fecha=*/datos.parquet")), default=0)
+
+
+def leer_snapshot(desde=None, hasta=None, carpeta=DIR_SNAPSHOTS):
+    """Lee solo las particiones dentro de [desde, hasta) más las filas sin fecha."""
+    rutas = []
+    for ruta in sorted(Path(carpeta).glob("fecha=*/datos.parquet")):
+        dia = ruta.parent.name.removeprefix("fecha=")
+        if dia == SIN_FECHA or desde is None or desde <= pd.Timestamp(dia) < hasta:
+            rutas.append(ruta)
+
+    if not rutas:
+        return pd.DataFrame()
+    with etapa("leer") as medicion:
+        df = pd.concat([pd.read_parquet(ruta) for ruta in rutas], ignore_index=True)
+        medicion.bytes = sum(ruta.stat().st_size for ruta in rutas)
+        medicion.salida(df)
+    marco("df_meta", df)
+    return df
@@ -0,0 +1,85 @@
+"""Lectura de archivos de banco y Metabase común a los motores fuera de pandas."""
+from datetime import date, datetime
+from pathlib import Path
+
+
+# =================================================
+# EXCEL → PARQUET (streaming)
+# =================================================
+def _texto(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=" ")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _nombres_columnas(encabezado, limpiar):
+    # Igual que pandas: "Unnamed: i" para vacíos y ".n" para repetidos
+    nombres, vistos = [], {}
+    for i, valor in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if valor is None else str(valor)
+        if limpiar:
+            nombre = nombre.strip()
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+def excel_a_parquet(ruta, destino, skiprows=0, limpiar_encabezados=False, lote=50_000):
+    """Vuelca la primera hoja a parquet (todo como texto) sin cargarla entera en memoria."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(min_row=skiprows + 1, values_only=True)
+        nombres = _nombres_columnas(next(filas, ()), limpiar_encabezados)
+        esquema = pa.schema([(nombre, pa.string()) for nombre in nombres])
+
+        def escribir(pendientes):
+            columnas = [[_texto(fila[i]) if i < len(fila) else None for fila in pendientes]
+                        for i in range(len(nombres))]
+            writer.write_table(pa.Table.from_arrays(columnas, schema=esquema))
+
+        with pq.ParquetWriter(destino, esquema) as writer:
+            pendientes = []
+            for fila in filas:
+                pendientes.append(fila)
+                if len(pendientes) == lote:
+                    escribir(pendientes)
+                    pendientes = []
+            if pendientes or not nombres:
+                escribir(pendientes)
+    finally:
+        libro.close()
+    return destino
+
+
+def detectar_formato(ruta):
+    """Mismo criterio que cargadores.detectar_formato: CREP por extensión y BBVA por el título del preview."""
+    ruta = Path(ruta)
+    if ruta.suffix.lower() == ".txt":
+        return "crep"
+
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        preview = libro.worksheets[0].iter_rows(max_row=25, values_only=True)
+        texto = " ".join(str(v) for fila in preview for v in fila if v is not None).upper()
+    finally:
+        libro.close()
+
+    if "HISTÓRICO DE MOVIMIENTOS" in texto or "HISTORICO DE MOVIMIENTOS" in texto:
+        return "bbva_historico"
+    if "MOVIMIENTOS DEL DÍA" in texto or "MOVIMIENTOS DEL DIA" in texto:
+        return "bbva"
+    return "bcp"
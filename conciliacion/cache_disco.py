@@ -0,0 +1,269 @@
+"""Cache persistente en disco para los cargadores, con presupuesto de bytes y desalojo LRU.
+
+Reemplaza a st.cache_data: sobrevive a reinicios y redeploys, lo comparten todos los procesos
+del servidor y no caduca a los diez minutos. La clave junta el hash del contenido subido, la
+versión del cargador y su disposición (filas saltadas, columnas esperadas), así un cambio de
+lógica invalida solo lo que corresponde. El contenido se identifica con una Huella: barata al
+subir el archivo y con el SHA-256 completo calculado en segundo plano.
+
+Las últimas entradas usadas quedan además en memoria: un rerun no vuelve a deserializar ni a
+copiar los frames, recibe copias superficiales que comparten las columnas (copy-on-write). Con
+memoria=False el cargador solo usa el disco, para resultados cuya vida en memoria decide otro
+(el registro de snapshots compartidos).
+"""
+import functools
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from conciliacion.trazas import marco
+
+DIR_CACHE = Path(os.environ.get("CONCILIACION_CACHE", "cache_conciliacion"))
+LIMITE_BYTES = int(os.environ.get("CONCILIACION_CACHE_BYTES", 2 * 1024 ** 3))
+RECIENTES = int(os.environ.get("CONCILIACION_CACHE_RECIENTES", 8))
+
+
+def _superficial(valor):
+    """Copia que comparte los datos: el llamador puede asignar columnas sin tocar el cache."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    if isinstance(valor, tuple):
+        return tuple(_superficial(v) for v in valor)
+    return valor
+
+
+def _marcar(nombre, valor):
+    # Perfil de memoria: los frames que entrega el cache (copias superficiales del guardado)
+    for i, parte in enumerate(valor if isinstance(valor, tuple) else (valor,)):
+        if isinstance(parte, pd.DataFrame):
+            marco(f"cache {nombre}[{i}]", parte)
+
+
+class CacheDisco:
+    """Entradas pickle en una carpeta; el mtime de cada archivo hace de marca LRU."""
+
+    def __init__(self, carpeta=DIR_CACHE, limite_bytes=LIMITE_BYTES, recientes=RECIENTES):
+        self.carpeta = Path(carpeta)
+        self.limite_bytes = limite_bytes
+        self.recientes = recientes
+        self._memoria = OrderedDict()
+        self.aciertos_memoria = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._lock = threading.Lock()
+
+    def _ruta(self, clave):
+        return self.carpeta / f"{clave}.pkl"
+
+    def _recordar(self, clave, valor):
+        self._memoria[clave] = valor
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.recientes:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, clave, *alternativas, contar_fallo=True, recordar=True):
+        """Devuelve (encontrado, valor).
+
+        Si la entrada aparece bajo una clave alternativa, se renombra a la principal, en memoria
+        y en disco: después de un reinicio solo queda la clave principal para encontrarla.
+        Con recordar=False lo leído del disco no se guarda en la memoria.
+        """
+        with self._lock:
+            for actual in (clave, *alternativas):
+                if actual in self._memoria:
+                    valor = self._memoria.pop(actual)
+                    self._recordar(clave, valor)
+                    if actual != clave:
+                        self._mover_a(clave, actual, valor)
+                    self.aciertos_memoria += 1
+                    return True, _superficial(valor)
+
+            for actual in (clave, *alternativas):
+                ruta = self._ruta(actual)
+                try:
+                    with open(ruta, "rb") as f:
+                        valor = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    continue
+                try:
+                    if actual != clave:
+                        ruta = ruta.replace(self._ruta(clave))
+                    os.utime(ruta)
+                except OSError:
+                    # Otro proceso la movió o desalojó entre la lectura y aquí
+                    pass
+                if recordar:
+                    self._recordar(clave, valor)
+                self.aciertos += 1
+                return True, _superficial(valor)
+            if contar_fallo:
+                self.fallos += 1
+            return False, None
+
+    def _mover_a(self, clave, actual, valor):
+        # Con el lock tomado: la entrada en disco pasa de la clave alternativa a la principal
+        try:
+            self._ruta(actual).replace(self._ruta(clave))
+        except OSError:
+            if not self._ruta(clave).exists():
+                # Desalojada del disco (o de otro proceso): se vuelve a escribir
+                self._escribir(clave, valor)
+
+    def _escribir(self, clave, valor):
+        ruta = self._ruta(clave)
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporal, "wb") as f:
+            pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temporal.replace(ruta)
+
+    def guardar(self, clave, valor, recordar=True):
+        with self._lock:
+            self._escribir(clave, valor)
+            if recordar:
+                self._recordar(clave, valor)
+            self._desalojar()
+
+    def _desalojar(self):
+        entradas = []
+        for ruta in self.carpeta.glob("*.pkl"):
+            try:
+                estado = ruta.stat()
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+
+        total = sum(tamano for _, tamano, _ in entradas)
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            ruta.unlink(missing_ok=True)
+            total -= tamano
+            self.desalojos += 1
+
+    def bytes_usados(self):
+        return sum(ruta.stat().st_size for ruta in self.carpeta.glob("*.pkl"))
+
+    def estadisticas(self):
+        return {
+            "aciertos_memoria": self.aciertos_memoria,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "bytes": self.bytes_usados() if self.carpeta.exists() else 0,
+            "limite_bytes": self.limite_bytes,
+        }
+
+
+cache = CacheDisco()
+
+
+def hash_contenido(archivo):
+    archivo.seek(0)
+    resumen = hashlib.sha256()
+    for bloque in iter(lambda: archivo.read(1 << 20), b""):
+        resumen.update(bloque)
+    archivo.seek(0)
+    return resumen.hexdigest()
+
+
+BLOQUE_MUESTRA = 64 * 1024
+MUESTRAS = 16
+
+
+def huella_rapida(archivo, identificador=""):
+    """Tamaño + id de subida + hash de bloques muestreados: costo constante sin importar el tamaño."""
+    archivo.seek(0, os.SEEK_END)
+    tamano = archivo.tell()
+    resumen = hashlib.blake2b(f"{tamano}|{identificador}".encode(), digest_size=16)
+
+    inicios = list(range(0, tamano, max(tamano // MUESTRAS, 1)))[:MUESTRAS]
+    for inicio in inicios + [max(tamano - BLOQUE_MUESTRA, 0)]:
+        archivo.seek(inicio)
+        resumen.update(archivo.read(BLOQUE_MUESTRA))
+    archivo.seek(0)
+    return resumen.hexdigest()
+
+
+class Huella:
+    """Identidad de un archivo subido para la clave del cache.
+
+    rapida incluye el id de la subida, así que es única por subida y sirve de inmediato.
+    completa es el SHA-256 del contenido, que se calcula en segundo plano; cuando está lista
+    permite reutilizar el cache entre subidas (y sesiones) del mismo archivo.
+    """
+
+    def __init__(self, rapida=None, completa=None):
+        self.rapida = rapida
+        self.completa = completa
+        self._hilo = None
+
+    @classmethod
+    def de_subida(cls, archivo, identificador):
+        huella = cls(rapida=huella_rapida(archivo, identificador))
+        # getbuffer no mueve la posición del archivo ni copia los bytes
+        datos = archivo.getbuffer()
+        huella._hilo = threading.Thread(target=huella._calcular_completa, args=(datos,), daemon=True)
+        huella._hilo.start()
+        return huella
+
+    @classmethod
+    def de_contenido(cls, archivo):
+        return cls(completa=hash_contenido(archivo))
+
+    def _calcular_completa(self, datos):
+        self.completa = hashlib.sha256(datos).hexdigest()
+        datos.release()
+
+    def esperar_completa(self):
+        """SHA-256 del contenido, esperando al cálculo en segundo plano si aún no termina."""
+        if self._hilo is not None:
+            self._hilo.join()
+        return self.completa
+
+    def claves(self):
+        return [valor for valor in (self.completa, self.rapida) if valor]
+
+
+def cache_en_disco(version, disposicion="", huella=Huella.de_contenido, memoria=True):
+    """Decorador para cargadores cuyo primer argumento es el archivo subido.
+
+    version se sube al cambiar la lógica del cargador; disposicion describe el layout leído.
+    huella(archivo) devuelve la Huella del archivo; la app la memoriza por subida en
+    session_state para no recorrer el archivo en cada rerun. memoria=False: los resultados no
+    quedan en la memoria del cache, solo en disco.
+    El resto de argumentos (ventanas de fecha, etc.) también entra en la clave.
+    """
+    def decorador(funcion):
+        prefijo = [funcion.__name__, str(version), disposicion]
+
+        @functools.wraps(funcion)
+        def envoltura(archivo, *args, **kwargs):
+            sufijo = [repr(args), repr(sorted(kwargs.items()))]
+            identidad = huella(archivo)
+            claves = lambda: [
+                hashlib.sha256("|".join(prefijo + [parte] + sufijo).encode()).hexdigest()
+                for parte in identidad.claves()
+            ]
+
+            completa = identidad.completa is not None
+            encontrado, valor = cache.obtener(*claves(), contar_fallo=completa, recordar=memoria)
+            if not encontrado and not completa:
+                # Hashear cuesta mucho menos que parsear: con el SHA-256 se busca entre subidas
+                # anteriores y lo parseado se guarda bajo el contenido, no bajo esta subida
+                identidad.esperar_completa()
+                encontrado, valor = cache.obtener(*claves(), recordar=memoria)
+            if not encontrado:
+                valor = funcion(archivo, *args, **kwargs)
+                cache.guardar(claves()[0], valor, recordar=memoria)
+                valor = _superficial(valor)
+            _marcar(funcion.__name__, valor)
+            return valor
+        return envoltura
+    return decorador
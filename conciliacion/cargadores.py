@@ -0,0 +1,392 @@
+"""Carga de los EECC (CREP, BCP, BBVA diario e histórico) y de Metabase con pandas.
+
+Cada cargador recibe un archivo abierto en binario (una subida de Streamlit o un open(ruta, "rb"))
+y devuelve (df, es_crep, sin_psptin, descartados). No dependen de Streamlit: la app los envuelve
+con el cache en disco y la línea de comandos los llama directo. Cada paso abre una etapa de
+conciliacion.trazas (leer, limpiar, psptin, extornos, sin_psptin, duplicados, filtrar).
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from conciliacion.trazas import etapa, marco
+
+
+# =================================================
+# DEPÓSITOS SIN PSP_TIN
+# =================================================
+COLUMNAS_DESCARTE = ["Motivo", "Nº operación", "Monto", "Fecha", "Detalle"]
+
+
+def descartes(filas, motivo, col_nro_op="Nº operación", col_desc=None):
+    """Filas del EECC que no entran al cruce, con el motivo (para el reporte consolidado)."""
+    return pd.DataFrame({
+        "Motivo": motivo,
+        "Nº operación": filas[col_nro_op],
+        "Monto": filas["Monto"],
+        "Fecha": filas["Fecha"],
+        "Detalle": filas[col_desc] if col_desc is not None else "",
+    }, columns=COLUMNAS_DESCARTE)
+
+
+def filas_sin_psptin(df, col_nro_op="Nº operación", col_desc=None):
+    """Abonos del banco sin PSP_TIN válido, sin pares de extorno.
+
+    Devuelve (abonos, descartados): los extornos y los cargos sin PSP_TIN van a descartados.
+    """
+    sin = df[~df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+    descartados = []
+
+    if col_desc is not None:
+        duplicados = sin[sin.duplicated(subset=[col_nro_op], keep=False)]
+        extornos = duplicados[col_desc].str.contains("Extorno", case=False, na=False)
+        es_extorno = sin[col_nro_op].isin(duplicados[extornos][col_nro_op].unique())
+        descartados.append(descartes(sin[es_extorno], "Extorno", col_nro_op, col_desc))
+        sin = sin[~es_extorno]
+
+    abono = pd.to_numeric(sin["Monto"], errors="coerce") > 0
+    descartados.append(descartes(sin[~abono], "Sin PSP_TIN ni abono", col_nro_op, col_desc))
+    sin = sin[abono]
+    sin = sin.rename(columns={col_nro_op: "Nº operación"})
+    return sin[["Monto", "Fecha", "Nº operación"]], pd.concat(descartados, ignore_index=True)
+
+
+# =================================================
+# CREP BCP (.txt)
+# =================================================
+def cargar_txt_crep(archivo_txt):
+    with etapa("leer", archivo_txt) as medicion:
+        lineas = archivo_txt.read().decode('utf-8').splitlines()
+        medicion.salida(lineas)
+
+    # El parseo de ancho fijo limpia y extrae el PSP_TIN en la misma pasada
+    with etapa("psptin", lineas) as medicion:
+        registros, ilegibles = _parsear_crep(lineas)
+        df = pd.DataFrame(registros)
+        medicion.salida(df)
+
+    with etapa("sin_psptin", df) as medicion:
+        sin_psptin, descartados = filas_sin_psptin(df)
+        df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+        medicion.salida(df)
+    with etapa("duplicados", df) as medicion:
+        duplicado = df.duplicated(subset="PSP_TIN")
+        descartados = pd.concat([
+            descartados,
+            descartes(df[duplicado], "PSP_TIN duplicado"),
+            pd.DataFrame(ilegibles, columns=COLUMNAS_DESCARTE),
+        ], ignore_index=True)
+        df = df[~duplicado]
+        medicion.salida(df)
+    return df, True, sin_psptin, descartados
+
+
+def _parsear_crep(lineas):
+    """(registros, ilegibles) de las líneas DD del CREP."""
+    registros = []
+    ilegibles = []
+
+    for numero, linea in enumerate(lineas, start=1):
+        if linea.startswith('DD'):
+            try:
+                psp_tin = linea[205:217].strip().lstrip("0")
+                monto_raw = linea[73:88].strip()
+                monto = int(monto_raw) / 100 if monto_raw.isdigit() else None
+                medio_atencion = linea[156:168].strip()
+
+                anio = linea[57:61]
+                mes = linea[61:63]
+                dia = linea[63:65]
+                hora = linea[168:170]
+                minuto = linea[170:172]
+                segundo = linea[172:174]
+
+                fecha_pago = f"{dia}/{mes}/{anio}"
+                hora_pago = f"{hora}:{minuto}:{segundo}"
+                fecha_hora_pago = datetime.strptime(
+                    f"{fecha_pago} {hora_pago}", "%d/%m/%Y %H:%M:%S"
+                )
+
+                nro_operacion = linea[124:130].strip()
+
+                registros.append({
+                    "PSP_TIN": psp_tin,
+                    "Monto": monto,
+                    "Medio de atención": medio_atencion,
+                    "Fecha": fecha_pago,
+                    "Hora": hora_pago,
+                    "FechaHora": fecha_hora_pago,
+                    "Nº operación": nro_operacion
+                })
+            except:
+                ilegibles.append({"Motivo": "Línea ilegible", "Detalle": f"Línea {numero}: {linea.rstrip()}"})
+                continue
+
+    return registros, ilegibles
+
+
+# =================================================
+# EECC BCP (.xlsx)
+# =================================================
+def cargar_excel_bcp(archivo):
+    with etapa("leer", archivo) as medicion:
+        df = pd.read_excel(archivo, skiprows=7, dtype={"Nº operación": str})
+        medicion.salida(df)
+
+    with etapa("limpiar", df) as medicion:
+        df["Descripción operación"] = df["Descripción operación"].astype(str).str.strip()
+        df["Nº operación"] = df["Nº operación"].astype(str).str.strip()
+        df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce")
+        df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+        medicion.salida(df)
+
+    with etapa("psptin", df) as medicion:
+        df["PSP_TIN"] = df["Descripción operación"].str.extract(r"(2\d{11})(?!\d)")
+        medicion.salida(df["PSP_TIN"].count())
+
+    with etapa("extornos", df) as medicion:
+        duplicados = df[df.duplicated(subset=["Nº operación"], keep=False)]
+        marco("duplicados", duplicados)
+        extornos = duplicados["Descripción operación"].str.contains("Extorno", case=False, na=False)
+        numeros_extorno = duplicados[extornos]["Nº operación"].unique()
+
+        es_extorno = df["Nº operación"].isin(numeros_extorno)
+        extornos = descartes(df[es_extorno], "Extorno", "Nº operación", "Descripción operación")
+        df = df[~es_extorno]
+        medicion.salida(df)
+    with etapa("sin_psptin", df) as medicion:
+        sin_psptin, descartados = filas_sin_psptin(df, "Nº operación", "Descripción operación")
+        df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+        medicion.salida(df)
+    with etapa("duplicados", df) as medicion:
+        duplicado = df.duplicated(subset="PSP_TIN")
+        descartados = pd.concat([
+            extornos, descartados, descartes(df[duplicado], "PSP_TIN duplicado", "Nº operación", "Descripción operación"),
+        ], ignore_index=True)
+        df = df[~duplicado]
+        medicion.salida(df)
+
+    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False, sin_psptin, descartados
+
+
+# =================================================
+# EECC BBVA DIARIO (.xlsx)  (ya existente)
+# =================================================
+def cargar_excel_bbva(archivo):
+    with etapa("leer", archivo) as medicion:
+        df = pd.read_excel(archivo, skiprows=10)
+        medicion.salida(df)
+
+    with etapa("limpiar", df) as medicion:
+        df.columns = df.columns.str.strip()
+        df["Monto"] = pd.to_numeric(df["Importe"], errors="coerce")
+        df["Fecha"] = pd.to_datetime(df["F.Operación"], format="%d-%m-%Y", errors="coerce")
+        df["Concepto"] = df["Concepto"].astype(str).str.strip()
+        medicion.salida(df)
+
+    with etapa("psptin", df) as medicion:
+        df["PSP_TIN"] = df["Concepto"].str.extract(r"(2\d{11})(?!\d)")
+        medicion.salida(df["PSP_TIN"].count())
+
+    with etapa("sin_psptin", df) as medicion:
+        sin_psptin, descartados = filas_sin_psptin(df, "Núm.Movimiento", "Concepto")
+        df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+        medicion.salida(df)
+
+    with etapa("extornos", df) as medicion:
+        duplicados = df[df.duplicated(subset=["Núm.Movimiento"], keep=False)]
+        marco("duplicados", duplicados)
+        extornos = duplicados["Concepto"].str.contains("Extorno", case=False, na=False)
+        numeros_extorno = duplicados[extornos]["Núm.Movimiento"].unique()
+
+        es_extorno = df["Núm.Movimiento"].isin(numeros_extorno)
+        extornos = descartes(df[es_extorno], "Extorno", "Núm.Movimiento", "Concepto")
+        df = df[~es_extorno]
+        medicion.salida(df)
+    with etapa("duplicados", df) as medicion:
+        duplicado = df.duplicated(subset="PSP_TIN")
+        descartados = pd.concat([
+            descartados, extornos, descartes(df[duplicado], "PSP_TIN duplicado", "Núm.Movimiento", "Concepto"),
+        ], ignore_index=True)
+        df = df[~duplicado]
+        medicion.salida(df)
+
+    df = df.rename(columns={"Núm.Movimiento": "Nº operación"})
+    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False, sin_psptin, descartados
+
+
+# =================================================
+# EECC BBVA HISTÓRICO (.xlsx)  (NUEVO)
+# =================================================
+def cargar_excel_bbva_historico(archivo):
+    # En el histórico, la tabla inicia con headers en la fila 11 (0-indexed 10)
+    with etapa("leer", archivo) as medicion:
+        df = pd.read_excel(archivo, skiprows=10, dtype={"Nº. Doc.": str})
+        medicion.salida(df)
+    df.columns = df.columns.str.strip()
+
+    # Columnas típicas del histórico (según tu archivo)
+    # F. Operación | F. Valor | Código | Nº. Doc. | Concepto | Importe | Oficina
+    col_fecha = "F. Operación"
+    col_concepto = "Concepto"
+    col_nro_op = "Nº. Doc."
+    col_importe = "Importe"
+
+    with etapa("limpiar", df) as medicion:
+        # Asegurar strings
+        df[col_concepto] = df[col_concepto].astype(str).str.strip()
+        df[col_nro_op] = df[col_nro_op].astype(str).str.strip()
+
+        # Quitar filas de saldo (al inicio y al final de cada día)
+        # Ej: "Saldo Inicial: 05-12-2025" / "Saldo Final: 14-12-2025"
+        es_saldo = df[col_concepto].str.contains(r"^Saldo (Inicial|Final)\:", case=False, na=False)
+        saldos = df[es_saldo]
+        df = df[~es_saldo].copy()
+
+        # Fecha y monto
+        df["Monto"] = pd.to_numeric(df[col_importe], errors="coerce")
+        df["Fecha"] = pd.to_datetime(df[col_fecha], dayfirst=True, errors="coerce")
+        saldos = pd.DataFrame({
+            "Motivo": "Fila de saldo", "Nº operación": saldos[col_nro_op], "Detalle": saldos[col_concepto],
+        }, columns=COLUMNAS_DESCARTE)
+        medicion.salida(df)
+
+    # PSP_TIN desde Concepto (12 dígitos que empiezan en 2)
+    with etapa("psptin", df) as medicion:
+        df["PSP_TIN"] = df[col_concepto].str.extract(r"(2\d{11})(?!\d)")
+        medicion.salida(df["PSP_TIN"].count())
+
+    # Depósitos sin PSP_TIN: van al segundo nivel de cruce
+    with etapa("sin_psptin", df) as medicion:
+        sin_psptin, descartados = filas_sin_psptin(df, col_nro_op, col_concepto)
+
+        # Solo PSP_TIN válidos
+        df = df[df["PSP_TIN"].str.match(r"^2\d{11}$", na=False)]
+        medicion.salida(df)
+
+    # Extornos: misma lógica base (por Nº. Doc. + texto "Extorno")
+    with etapa("extornos", df) as medicion:
+        duplicados = df[df.duplicated(subset=[col_nro_op], keep=False)]
+        marco("duplicados", duplicados)
+        extornos = duplicados[col_concepto].str.contains("Extorno", case=False, na=False)
+        numeros_extorno = duplicados[extornos][col_nro_op].unique()
+        es_extorno = df[col_nro_op].isin(numeros_extorno)
+        extornos = descartes(df[es_extorno], "Extorno", col_nro_op, col_concepto)
+        df = df[~es_extorno]
+        medicion.salida(df)
+
+    # Duplicados por PSP_TIN
+    with etapa("duplicados", df) as medicion:
+        duplicado = df.duplicated(subset="PSP_TIN")
+        descartados = pd.concat([
+            saldos, descartados, extornos, descartes(df[duplicado], "PSP_TIN duplicado", col_nro_op, col_concepto),
+        ], ignore_index=True)
+        df = df[~duplicado]
+        medicion.salida(df)
+
+    # Normalizar nombre de operación
+    df = df.rename(columns={col_nro_op: "Nº operación"})
+
+    return df[["PSP_TIN", "Monto", "Fecha", "Nº operación"]], False, sin_psptin, descartados
+
+
+# =================================================
+# METABASE
+# =================================================
+def cargar_metabase(archivo, desde=None, hasta=None, col_fecha="PC_create_date_GMT_Peru"):
+    with etapa("leer", archivo) as medicion:
+        df = pd.read_excel(archivo)
+        medicion.salida(df)
+        marco("df_meta (leído)", df)
+    with etapa("limpiar", df) as medicion:
+        df[col_fecha] = pd.to_datetime(df[col_fecha], errors="coerce")
+        medicion.salida(df)
+
+    return podar_metabase(df, desde, hasta, col_fecha)
+
+
+def podar_metabase(df, desde=None, hasta=None, col_fecha="PC_create_date_GMT_Peru"):
+    """Filas de Metabase dentro de la ventana [desde, hasta) del EECC.
+
+    Las filas sin fecha se conservan porque no se pueden descartar con certeza.
+    """
+    if desde is not None and hasta is not None:
+        with etapa("filtrar", df) as medicion:
+            fuera = (df[col_fecha] < desde) | (df[col_fecha] >= hasta)
+            df = df[~fuera]
+            medicion.salida(df)
+
+    marco("df_meta", df)
+    return df
+
+
+def ventana_banco(df_banco, sin_psptin, margen_dias):
+    """[desde, hasta) de fechas del EECC ampliado en margen_dias a cada lado."""
+    if "FechaHora" in df_banco:
+        fechas = df_banco["FechaHora"]
+    else:
+        fechas = pd.to_datetime(df_banco["Fecha"], dayfirst=True, errors="coerce")
+    if sin_psptin is not None and len(sin_psptin):
+        fechas = pd.concat([fechas, pd.to_datetime(sin_psptin["Fecha"], dayfirst=True, errors="coerce")])
+
+    fechas = fechas.dropna()
+    if fechas.empty:
+        return None, None
+
+    margen = pd.Timedelta(days=margen_dias)
+    desde = fechas.min().normalize() - margen
+    hasta = fechas.max().normalize() + pd.Timedelta(days=1) + margen
+    return desde, hasta
+
+
+# =================================================
+# DETECCIÓN DEL FORMATO
+# =================================================
+CARGADORES = {
+    "crep": cargar_txt_crep,
+    "bcp": cargar_excel_bcp,
+    "bbva": cargar_excel_bbva,
+    "bbva_historico": cargar_excel_bbva_historico,
+}
+
+# formato -> (banco, descripción)
+FORMATOS = {
+    "crep": ("BCP", "CREP BCP (.txt)"),
+    "bcp": ("BCP", "EECC BCP (.xlsx)"),
+    "bbva": ("BBVA", "BBVA - Movimientos del Día (.xlsx)"),
+    "bbva_historico": ("BBVA", "BBVA - Movimientos Históricos (.xlsx)"),
+}
+
+
+def detectar_formato(archivo):
+    """CREP por extensión; entre los Excel, BBVA diario o histórico por el título y si no BCP."""
+    if archivo.name.endswith(".txt"):
+        return "crep"
+
+    archivo.seek(0)
+    preview = pd.read_excel(archivo, nrows=25, header=None)
+    archivo.seek(0)
+
+    # Unimos todo el preview a texto para detectar título
+    preview_text = " ".join(preview.fillna("").astype(str).values.flatten()).upper()
+
+    if "HISTÓRICO DE MOVIMIENTOS" in preview_text or "HISTORICO DE MOVIMIENTOS" in preview_text:
+        return "bbva_historico"
+    if "MOVIMIENTOS DEL DÍA" in preview_text or "MOVIMIENTOS DEL DIA" in preview_text:
+        return "bbva"
+    return "bcp"
+
+
+def cargar_banco(archivo, cargadores=CARGADORES):
+    """Detecta el formato del EECC y lo carga. Devuelve un dict con el banco y sus metadatos.
+
+    cargadores permite pasar versiones envueltas (la app usa las del cache en disco).
+    """
+    with etapa("detectar"):
+        formato = detectar_formato(archivo)
+    df_banco, es_crep, sin_psptin, descartados = cargadores[formato](archivo)
+    banco, descripcion = FORMATOS[formato]
+    return {
+        "df": df_banco, "es_crep": es_crep, "sin_psptin": sin_psptin, "descartados": descartados, "banco": banco,
+        "formato": descripcion, "hora_corte": df_banco["FechaHora"].max() if es_crep else None,
+    }
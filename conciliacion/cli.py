@@ -0,0 +1,115 @@
+"""Conciliación DSN/PSD sin Streamlit, para correr desde cron o a mano.
+
+    python -m conciliacion EECC.xlsx Metabase.xlsx -o salida/
+    python -m conciliacion CREP.txt                 # Metabase desde el almacén local
+
+Escribe en la carpeta de salida el reporte consolidado, DSN y PSD en el formato pedido y la lista
+de PSP_TIN del DSN. pandas y el resto del núcleo se importan recién después de leer los
+argumentos, así --help y los errores de uso responden al instante.
+"""
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+
+FORMATOS_SALIDA = ["xlsx", "csv", "parquet"]
+FORMATOS_LISTA = ["txt", "sql", "json", "values"]
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m conciliacion", description="Conciliación DSN/PSD de un EECC contra Metabase."
+    )
+    parser.add_argument("banco", type=Path, help="EECC del banco: CREP .txt, BCP, BBVA diario o histórico (.xlsx)")
+    parser.add_argument(
+        "metabase", type=Path, nargs="?",
+        help="export de Metabase (.xlsx) o carpeta del almacén local (por defecto CONCILIACION_SNAPSHOTS)",
+    )
+    parser.add_argument("-o", "--salida", type=Path, default=Path("."), help="carpeta de salida (por defecto la actual)")
+    parser.add_argument("--margen", type=int, default=1, help="margen de fechas para Metabase en días (por defecto 1)")
+    parser.add_argument("--formato", choices=FORMATOS_SALIDA, default="xlsx", help="formato de DSN y PSD")
+    parser.add_argument("--lista", choices=FORMATOS_LISTA, default="txt", help="formato de la lista de PSP_TIN del DSN")
+    parser.add_argument("--bloque", type=int, default=0, help="PSP_TIN por bloque de la lista (0 = todos)")
+    parser.add_argument("--sin-reporte", action="store_true", help="no escribir el reporte consolidado")
+    parser.add_argument(
+        "--trazas", action="store_true",
+        help="medir cada etapa, imprimirlas y agregarlas en JSON lines a CONCILIACION_TRAZAS (por defecto trazas/)",
+    )
+    parser.add_argument(
+        "--memoria", action="store_true",
+        help="implica --trazas; además RSS y pico de asignaciones por etapa y memoria de los frames intermedios (más lento)",
+    )
+
+    args = parser.parse_args(argv)
+    if not args.banco.is_file():
+        parser.error(f"no existe el EECC {args.banco}")
+    if args.metabase is not None and not args.metabase.exists():
+        parser.error(f"no existe Metabase en {args.metabase}")
+    if args.margen < 0 or args.bloque < 0:
+        parser.error("--margen y --bloque no pueden ser negativos")
+    if args.memoria:
+        args.trazas = True
+    return args
+
+
+def conciliar(args):
+    """Corre carga, cruce y escritura; devuelve el resumen del reporte."""
+    from conciliacion.cruce import conciliar_archivos
+    from conciliacion.exportar import ESCRITORES, EXTENSION_LISTA, lista_psptin
+    from conciliacion.reporte import diferencias_monto, escribir_reporte, hojas_reporte, resumen_conciliacion
+    from conciliacion.trazas import etapa, tamano
+
+    with open(args.banco, "rb") as archivo:
+        try:
+            if args.metabase is None or args.metabase.is_dir():
+                resultado = conciliar_archivos(archivo, args.metabase, args.margen)
+            else:
+                with open(args.metabase, "rb") as metabase:
+                    resultado = conciliar_archivos(archivo, metabase, args.margen)
+        except ValueError as error:
+            raise SystemExit(str(error))
+    banco, dsn, psd, cruzados = resultado["banco"], resultado["dsn"], resultado["psd"], resultado["cruzados"]
+
+    args.salida.mkdir(parents=True, exist_ok=True)
+    for nombre, df in (("DSN", dsn), ("PSD", psd)):
+        with open(args.salida / f"{nombre}_encontrados.{args.formato}", "wb") as destino, \
+                etapa("exportar", df) as medicion:
+            ESCRITORES[args.formato](df, destino)
+            medicion.salida(df)
+            medicion.bytes = tamano(destino)
+    (args.salida / f"DSN_psptin.{EXTENSION_LISTA[args.lista]}").write_text(
+        lista_psptin(dsn["PSP_TIN"], args.lista, args.bloque), encoding="utf-8"
+    )
+
+    resumen = resumen_conciliacion(
+        banco, resultado["desde"], resultado["hasta"], resultado["df_meta_filtrado"], dsn, psd, cruzados
+    )
+    if not args.sin_reporte:
+        diferencias = diferencias_monto(cruzados, resultado["df_meta_filtrado"])
+        hojas = hojas_reporte(resumen, dsn, psd, cruzados, diferencias, banco["descartados"])
+        escribir_reporte(hojas, str(args.salida / f"Conciliacion_{banco['banco']}_{datetime.now():%Y%m%d}.xlsx"))
+    return resumen
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    start = time.perf_counter()
+    if args.trazas:
+        from conciliacion.trazas import Traza, trazar
+
+        traza = Traza("cli", memoria=args.memoria)
+        with trazar(traza):
+            resumen = conciliar(args)
+    else:
+        resumen = conciliar(args)
+    for concepto, valor in resumen.items():
+        print(f"{concepto}: {valor}")
+    print(f"Resultados en {args.salida} ({round(time.perf_counter() - start, 2)}s)")
+    if args.trazas:
+        print()
+        print(traza.tabla().drop(columns="inicio").to_string(index=False))
+        if args.memoria:
+            print()
+            print(traza.tabla_marcos().drop(columns="momento").to_string(index=False))
+        print(f"Trazas en {traza.escribir()}")
+    return 0
@@ -0,0 +1,24 @@
+"""Nombres de columnas y patrones compartidos por los motores de conciliación."""
+
+# Candidatos para el segundo nivel de cruce (se usa la primera columna que exista)
+COLUMNAS_META_NRO_OP = ["Nro_Operacion", "Numero_Operacion", "Nº operación", "Pago_NroOperacion"]
+COLUMNAS_META_MONTO = ["Monto", "Deuda_Monto", "Pago_Monto", "Importe"]
+COLUMNAS_MEDIO = ["Medio de atención", "Medio_Atencion", "MedioAtencion", "Medio_Pago", "Canal"]
+
+COL_PSPTIN = "Deuda_PspTin"
+COL_BANCO = "Banco"
+COL_MONEDA = " Moneda"
+COL_FECHA = "PC_create_date_GMT_Peru"
+
+# Los motores (RE2 / regex de Rust) no soportan lookahead: (2\d{11})(?!\d) se expresa
+# con un grupo seguido de un no-dígito o fin de texto
+EXTRAER_PSPTIN = r"(2[0-9]{11})(?:[^0-9]|$)"
+PSPTIN_VALIDO = r"^2[0-9]{11}$"
+
+
+def buscar_columna(columnas, candidatos):
+    minusculas = [str(c).strip().lower() for c in columnas]
+    for candidato in candidatos:
+        if candidato.lower() in minusculas:
+            return columnas[minusculas.index(candidato.lower())]
+    return None
@@ -0,0 +1,177 @@
+"""Corridas de conciliación en segundo plano, persistidas en disco por id.
+
+Una corrida copia los archivos subidos a su carpeta y se ejecuta en un pool de procesos, fuera
+del hilo del script de Streamlit: si el analista cambia de página o se cae el websocket, sigue
+corriendo. El proceso va escribiendo estado.json (etapa y progreso) y al terminar deja el
+resultado en resultado.pkl. Cualquier sesión que conozca el id, por ejemplo desde
+?corrida=<id> en la URL, puede volver a engancharse. Cada corrida tiene su carpeta y sus
+copias de los archivos, así varias corridas de distintos analistas no se pisan.
+
+    corridas/<id>/entrada/<archivos subidos>
+    corridas/<id>/estado.json
+    corridas/<id>/resultado.pkl
+"""
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+DIR_CORRIDAS = Path(os.environ.get("CONCILIACION_CORRIDAS", "corridas"))
+TRABAJADORES = int(os.environ.get("CONCILIACION_CORRIDAS_TRABAJADORES", 2))
+# Las corridas más viejas que esto se borran al arrancar
+DIAS_CORRIDAS = int(os.environ.get("CONCILIACION_CORRIDAS_DIAS", 7))
+
+ETAPAS = ["en_cola", "banco", "metabase", "cruce", "guardando", "listo"]
+EN_CURSO = ("en_cola", "procesando")
+
+
+def _escribir_estado(carpeta, **cambios):
+    ruta = Path(carpeta) / "estado.json"
+    estado = json.loads(ruta.read_text(encoding="utf-8")) if ruta.exists() else {}
+    estado.update(cambios, actualizado=time.time())
+    temporal = ruta.with_suffix(".tmp")
+    temporal.write_text(json.dumps(estado, ensure_ascii=False, default=str), encoding="utf-8")
+    temporal.replace(ruta)
+    return estado
+
+
+def leer_estado(carpeta):
+    try:
+        return json.loads((Path(carpeta) / "estado.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+# =================================================
+# EJECUCIÓN (corre en los procesos del pool)
+# =================================================
+def _calentar():
+    import conciliacion.cruce  # noqa: F401
+
+
+def ejecutar(carpeta):
+    """Corre la corrida de la carpeta; el avance y el resultado quedan en disco."""
+    from conciliacion.cruce import conciliar_archivos
+    from conciliacion.trazas import Traza, trazar
+
+    carpeta = Path(carpeta)
+    parametros = leer_estado(carpeta)
+    avance = lambda etapa: _escribir_estado(
+        carpeta, estado="procesando", etapa=etapa, progreso=ETAPAS.index(etapa) / (len(ETAPAS) - 1)
+    )
+    start = time.perf_counter()
+    traza = Traza(f"corrida {carpeta.name}")
+    try:
+        with trazar(traza), open(carpeta / "entrada" / parametros["banco"], "rb") as archivo_banco:
+            if parametros["metabase"] is None:
+                resultado = conciliar_archivos(archivo_banco, parametros["almacen"], parametros["margen_dias"], avance)
+            else:
+                with open(carpeta / "entrada" / parametros["metabase"], "rb") as archivo_metabase:
+                    resultado = conciliar_archivos(archivo_banco, archivo_metabase, parametros["margen_dias"], avance)
+
+        avance("guardando")
+        temporal = carpeta / "resultado.pkl.tmp"
+        with open(temporal, "wb") as f:
+            pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temporal.replace(carpeta / "resultado.pkl")
+        _escribir_estado(
+            carpeta, estado="listo", etapa="listo", progreso=1.0, segundos=round(time.perf_counter() - start, 2),
+            dsn=len(resultado["dsn"]), psd=len(resultado["psd"]),
+        )
+    except Exception as error:
+        _escribir_estado(carpeta, estado="error", error=f"{type(error).__name__}: {error}")
+    finally:
+        traza.escribir()
+
+
+# =================================================
+# REGISTRO DE CORRIDAS
+# =================================================
+class Corridas:
+    """Pool de procesos de las corridas de este servidor y acceso a las guardadas en disco."""
+
+    def __init__(self, carpeta=DIR_CORRIDAS, trabajadores=TRABAJADORES, dias=DIAS_CORRIDAS):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.carpeta = Path(carpeta)
+        # spawn: los procesos no heredan los hilos del servidor de Streamlit
+        self.pool = ProcessPoolExecutor(
+            max_workers=trabajadores, mp_context=multiprocessing.get_context("spawn"), initializer=_calentar
+        )
+        self._futuros = {}
+        self.purgar(dias)
+
+    def enviar(self, archivo_banco, archivo_metabase=None, almacen=None, margen_dias=1):
+        """Copia los archivos (subidas o abiertos en binario) a una carpeta nueva, encola la corrida y devuelve su id.
+
+        Sin archivo_metabase se lee el almacén (almacen o CONCILIACION_SNAPSHOTS).
+        """
+        id_corrida = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        carpeta = self.carpeta / id_corrida
+        (carpeta / "entrada").mkdir(parents=True)
+
+        nombres = {}
+        for campo, archivo in (("banco", archivo_banco), ("metabase", archivo_metabase)):
+            nombres[campo] = None
+            if archivo is not None:
+                nombres[campo] = Path(archivo.name).name
+                archivo.seek(0)
+                with open(carpeta / "entrada" / nombres[campo], "wb") as copia:
+                    shutil.copyfileobj(archivo, copia)
+
+        if almacen is None and archivo_metabase is None:
+            from conciliacion.almacen import DIR_SNAPSHOTS
+
+            almacen = DIR_SNAPSHOTS
+        _escribir_estado(
+            carpeta, id=id_corrida, estado="en_cola", etapa="en_cola", progreso=0.0, creado=time.time(),
+            banco=nombres["banco"], metabase=nombres["metabase"],
+            almacen=str(Path(almacen).resolve()) if almacen is not None else None, margen_dias=margen_dias,
+        )
+        self._futuros[id_corrida] = self.pool.submit(ejecutar, str(carpeta))
+        return id_corrida
+
+    def estado(self, id_corrida):
+        """estado.json de la corrida, o None si no existe.
+
+        Una corrida en curso que este servidor no lanzó quedó cortada por un reinicio: se
+        informa como "interrumpida". Si el proceso murió sin escribir su estado, como "error".
+        """
+        estado = leer_estado(self.carpeta / Path(id_corrida).name)
+        if estado is None or estado["estado"] not in EN_CURSO:
+            return estado
+
+        futuro = self._futuros.get(id_corrida)
+        if futuro is None:
+            estado["estado"] = "interrumpida"
+        elif futuro.done() and futuro.exception() is not None:
+            estado.update(estado="error", error=f"{type(futuro.exception()).__name__}: {futuro.exception()}")
+        return estado
+
+    def resultado(self, id_corrida):
+        """Dict de conciliar_archivos guardado por la corrida."""
+        with open(self.carpeta / Path(id_corrida).name / "resultado.pkl", "rb") as f:
+            return pickle.load(f)
+
+    def recientes(self, cantidad=10):
+        if not self.carpeta.exists():
+            return []
+        carpetas = sorted((c for c in self.carpeta.iterdir() if c.is_dir()), reverse=True)[:cantidad]
+        return [estado for estado in (self.estado(c.name) for c in carpetas) if estado is not None]
+
+    def purgar(self, dias):
+        if not self.carpeta.exists():
+            return
+        limite = time.time() - dias * 86_400
+        for carpeta in self.carpeta.iterdir():
+            estado = leer_estado(carpeta)
+            if carpeta.is_dir() and (estado is None or estado.get("creado", 0) < limite):
+                shutil.rmtree(carpeta, ignore_errors=True)
+
+    def cerrar(self):
+        self.pool.shutdown(cancel_futures=True)
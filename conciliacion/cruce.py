@@ -0,0 +1,186 @@
+"""Cruce DSN/PSD en memoria con pandas: PSP_TIN y segundo nivel para los depósitos sin PSP_TIN."""
+import os
+
+import pandas as pd
+
+from conciliacion import almacen
+from conciliacion.cargadores import cargar_banco, cargar_metabase, ventana_banco
+from conciliacion.columnas import (
+    COL_BANCO,
+    COL_FECHA,
+    COL_MONEDA,
+    COL_PSPTIN,
+    COLUMNAS_META_MONTO,
+    COLUMNAS_META_NRO_OP,
+    buscar_columna,
+)
+from conciliacion.cruce_paralelo import cruzar_psptin
+from conciliacion.trazas import etapa, marco
+
+
+# =================================================
+# SEGUNDO NIVEL DE CRUCE (sin PSP_TIN)
+# =================================================
+def _normalizar_nro_op(serie):
+    # Excel lee los números con NaN como float ("42.0"); se comparan como texto sin ceros
+    texto = serie.fillna("").astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    return texto.str.lstrip("0")
+
+
+def cruce_secundario(sin_psptin, meta, col_psptin, col_fecha):
+    """Cruza los depósitos sin PSP_TIN contra las filas de Metabase que no cruzaron por PSP_TIN.
+
+    Nivel "Nº operación" primero y luego "Monto + Fecha". Cada nivel arma un índice hash
+    sobre Metabase una sola vez y resuelve todos los depósitos pendientes con un get_indexer.
+    En "Monto + Fecha" los repetidos se emparejan por orden de aparición (1 a 1).
+
+    Devuelve (cruzados, pendientes, índices de Metabase cruzados).
+    """
+    col_nro_op = buscar_columna(list(meta.columns), COLUMNAS_META_NRO_OP)
+    col_monto = buscar_columna(list(meta.columns), COLUMNAS_META_MONTO)
+
+    pendientes = sin_psptin
+    cruzados = []
+    usados = []
+
+    # Nivel 2: Nº operación
+    if col_nro_op is not None and len(pendientes):
+        claves = _normalizar_nro_op(meta[col_nro_op])
+        claves = claves[(claves != "") & ~claves.duplicated()]
+        posiciones = pd.Index(claves.values).get_indexer(_normalizar_nro_op(pendientes["Nº operación"]))
+        encontrado = posiciones >= 0
+
+        etiquetas = claves.index[posiciones[encontrado]]
+        cruzados.append(pendientes[encontrado].assign(**{
+            col_psptin: meta.loc[etiquetas, col_psptin].values,
+            "Nivel de cruce": "Nº operación",
+        }))
+        usados.extend(etiquetas)
+        pendientes = pendientes[~encontrado]
+
+    # Nivel 3: Monto + Fecha
+    if col_monto is not None and len(pendientes):
+        resto = meta.drop(index=usados)
+        llave_meta = pd.DataFrame({
+            "monto": pd.to_numeric(resto[col_monto], errors="coerce").round(2),
+            "dia": resto[col_fecha].dt.normalize(),
+        }, index=resto.index).dropna()
+        llave_meta["n"] = llave_meta.groupby(["monto", "dia"]).cumcount()
+
+        llave_banco = pd.DataFrame({
+            "monto": pd.to_numeric(pendientes["Monto"], errors="coerce").round(2),
+            "dia": pd.to_datetime(pendientes["Fecha"], dayfirst=True, errors="coerce").dt.normalize(),
+        }, index=pendientes.index)
+        llave_banco["n"] = llave_banco.groupby(["monto", "dia"]).cumcount()
+
+        indice = pd.MultiIndex.from_frame(llave_meta)
+        posiciones = indice.get_indexer(pd.MultiIndex.from_frame(llave_banco))
+        encontrado = posiciones >= 0
+
+        etiquetas = llave_meta.index[posiciones[encontrado]]
+        cruzados.append(pendientes[encontrado].assign(**{
+            col_psptin: meta.loc[etiquetas, col_psptin].values,
+            "Nivel de cruce": "Monto + Fecha",
+        }))
+        usados.extend(etiquetas)
+        pendientes = pendientes[~encontrado]
+
+    cruzados = pd.concat(cruzados, ignore_index=True) if cruzados else pd.DataFrame()
+    return cruzados, pendientes, usados
+
+
+# =================================================
+# CRUCE EN MEMORIA (pandas)
+# =================================================
+def conciliar_pandas(df_banco, sin_psptin, df_meta, banco_archivo):
+    """Cruce por PSP_TIN y segundo nivel para los depósitos sin PSP_TIN.
+
+    Devuelve (df_meta_filtrado, dsn, psd, cruzados).
+    """
+    col_psptin = COL_PSPTIN
+    col_banco = COL_BANCO
+    col_moneda = COL_MONEDA
+    col_fecha = COL_FECHA
+
+    marco("df_meta (cruce)", df_meta)
+    # assign en vez de asignar la columna: df_meta puede ser el snapshot compartido entre sesiones
+    with etapa("duplicados", df_meta) as medicion:
+        df_meta = df_meta.assign(**{col_psptin: df_meta[col_psptin].astype(str)})
+        df_meta = df_meta.drop_duplicates(subset=col_psptin)
+        medicion.salida(df_meta)
+        marco("df_meta sin duplicados", df_meta)
+
+    with etapa("filtrar", df_meta) as medicion:
+        df_meta_filtrado = df_meta[
+            (df_meta[col_banco].astype(str).str.upper().str.contains(banco_archivo)) &
+            (df_meta[col_moneda].astype(str).str.upper().str.strip() == "PEN")
+        ]
+        medicion.salida(df_meta_filtrado)
+        marco("df_meta_filtrado", df_meta_filtrado)
+
+    # Nivel 1: PSP_TIN (particionado en un pool de procesos cuando hay millones de filas)
+    with etapa("psptin", df_banco) as medicion:
+        en_meta, en_banco = cruzar_psptin(df_banco["PSP_TIN"], df_meta_filtrado[col_psptin])
+        dsn = df_banco[~en_meta]
+        psd = df_meta_filtrado[~en_banco]
+        cruzados = df_banco[en_meta].assign(**{col_psptin: df_banco["PSP_TIN"], "Nivel de cruce": "PSP_TIN"})
+        medicion.salida(cruzados)
+
+    # Niveles 2 y 3: depósitos sin PSP_TIN contra los PSD
+    if len(sin_psptin):
+        with etapa("segundo_nivel", sin_psptin) as medicion:
+            cruzados_sec, pendientes, usados = cruce_secundario(sin_psptin, psd, col_psptin, col_fecha)
+            psd = psd.drop(index=usados)
+            cruzados = pd.concat([cruzados, cruzados_sec], ignore_index=True)
+            dsn = pd.concat([dsn, pendientes], ignore_index=True)
+            medicion.salida(cruzados_sec)
+
+    marco("dsn", dsn)
+    marco("psd", psd)
+    return df_meta_filtrado, dsn, psd, cruzados
+
+
+# =================================================
+# CONCILIACIÓN COMPLETA (línea de comandos y servicio)
+# =================================================
+def _sin_avance(etapa):
+    pass
+
+
+def conciliar_archivos(archivo_banco, metabase=None, margen_dias=1, avance=_sin_avance):
+    """Carga el EECC, poda Metabase a la ventana de sus fechas y cruza.
+
+    archivo_banco es un archivo abierto en binario con name. metabase es un export abierto en
+    binario, la carpeta de un almacén o None para el almacén local (CONCILIACION_SNAPSHOTS).
+    avance(etapa) se llama al empezar "banco", "metabase" y "cruce".
+    Devuelve un dict con banco (el de cargar_banco), desde, hasta, df_meta_filtrado, dsn, psd
+    y cruzados.
+    """
+    avance("banco")
+    with etapa("banco", archivo_banco) as medicion:
+        banco = cargar_banco(archivo_banco)
+        medicion.salida(banco["df"])
+    desde, hasta = ventana_banco(banco["df"], banco["sin_psptin"], margen_dias)
+
+    avance("metabase")
+    es_almacen = metabase is None or isinstance(metabase, (str, os.PathLike))
+    with etapa("metabase", None if es_almacen else metabase) as medicion:
+        if es_almacen:
+            carpeta = almacen.DIR_SNAPSHOTS if metabase is None else metabase
+            df_meta = almacen.leer_snapshot(desde, hasta, carpeta)
+            if df_meta.empty:
+                raise ValueError(f"El almacén {carpeta} no tiene Metabase para las fechas del EECC.")
+        else:
+            df_meta = cargar_metabase(metabase, desde, hasta)
+        medicion.salida(df_meta)
+
+    avance("cruce")
+    with etapa("cruce", banco["df"]) as medicion:
+        df_meta_filtrado, dsn, psd, cruzados = conciliar_pandas(
+            banco["df"], banco["sin_psptin"], df_meta, banco["banco"]
+        )
+        medicion.salida(cruzados)
+    return {
+        "banco": banco, "desde": desde, "hasta": hasta,
+        "df_meta_filtrado": df_meta_filtrado, "dsn": dsn, "psd": psd, "cruzados": cruzados,
+    }
@@ -0,0 +1,131 @@
+"""Cruce por PSP_TIN particionado por hash en un pool de procesos.
+
+Para un trimestre completo el isin de pandas sobre millones de PSP_TIN usa un solo núcleo.
+Aquí ambos lados se convierten a int64, se reparten en K particiones por PSP_TIN % K y cada
+proceso cruza sus particiones. Los datos viven en memoria compartida (no se serializan) y cada
+proceso escribe sus resultados directo en las máscaras compartidas; las particiones son
+disjuntas, así que al final solo hay que leerlas.
+
+El pool y la memoria compartida se importan recién al superar MIN_FILAS_PARALELO: el cruce de
+un día no paga multiprocessing al arrancar.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+PSPTIN_VALIDO = r"^2\d{11}$"
+
+# Por debajo de este total de filas el isin de pandas es más rápido que levantar el pool
+MIN_FILAS_PARALELO = int(os.environ.get("CONCILIACION_MIN_FILAS_PARALELO", 2_000_000))
+PROCESOS = int(os.environ.get("CONCILIACION_PROCESOS", os.cpu_count() or 1))
+
+_pool = None
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn: corre dentro del servidor de Streamlit y del servicio, que tienen hilos vivos
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _a_enteros(psptin, invalido):
+    """PSP_TIN válidos como int64; el resto como un valor que no cruza con nada."""
+    texto = psptin.astype(str)
+    valido = texto.str.match(PSPTIN_VALIDO, na=False).to_numpy()
+    valores = np.full(len(texto), invalido, dtype=np.int64)
+    valores[valido] = texto[valido].astype(np.int64).to_numpy()
+    return valores
+
+
+class _Compartido:
+    """Arreglo numpy en memoria compartida; los procesos lo abren por nombre."""
+
+    def __init__(self, arreglo):
+        from multiprocessing import shared_memory
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(arreglo.nbytes, 1))
+        self.forma, self.tipo = arreglo.shape, arreglo.dtype
+        self.arreglo = np.ndarray(self.forma, self.tipo, buffer=self.shm.buf)
+        self.arreglo[:] = arreglo
+
+    @property
+    def ref(self):
+        return self.shm.name, self.forma, self.tipo.str
+
+    def liberar(self):
+        del self.arreglo
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _particionar(valores, k):
+    """Permutación que agrupa las posiciones por partición y los límites de cada una."""
+    particion = valores % k
+    orden = np.argsort(particion, kind="stable")
+    limites = np.searchsorted(particion[orden], np.arange(k + 1))
+    return orden, limites
+
+
+def _cruzar(particiones, banco, orden_b, limites_b, meta, orden_m, limites_m, en_meta, en_banco):
+    for k in particiones:
+        pos_b = orden_b[limites_b[k]:limites_b[k + 1]]
+        pos_m = orden_m[limites_m[k]:limites_m[k + 1]]
+        valores_b, valores_m = banco[pos_b], meta[pos_m]
+        en_meta[pos_b] = np.isin(valores_b, valores_m)
+        en_banco[pos_m] = np.isin(valores_m, valores_b)
+
+
+def _cruzar_particiones(refs, particiones):
+    from multiprocessing import shared_memory
+
+    # El pool comparte el resource_tracker del proceso principal: abrir no duplica registros
+    memorias = [shared_memory.SharedMemory(name=nombre) for nombre, _, _ in refs]
+    try:
+        # Las vistas viven solo durante _cruzar, así close() no encuentra punteros exportados
+        _cruzar(particiones, *[
+            np.ndarray(forma, np.dtype(tipo), buffer=shm.buf)
+            for shm, (_, forma, tipo) in zip(memorias, refs)
+        ])
+    finally:
+        for shm in memorias:
+            shm.close()
+
+
+def cruzar_psptin(psptin_banco, psptin_meta, particiones=None):
+    """Máscaras (en_meta, en_banco): equivale a banco.isin(meta) y meta.isin(banco).
+
+    Con pocas filas usa isin directo; con muchas, K particiones por hash en el pool.
+    """
+    if len(psptin_banco) + len(psptin_meta) < MIN_FILAS_PARALELO or PROCESOS < 2:
+        return psptin_banco.isin(psptin_meta).to_numpy(), psptin_meta.isin(psptin_banco).to_numpy()
+
+    # Inválidos distintos a cada lado para que nunca crucen entre sí
+    banco = _a_enteros(pd.Series(psptin_banco), -1)
+    meta = _a_enteros(pd.Series(psptin_meta), -2)
+
+    k = particiones or PROCESOS * 4
+    orden_b, limites_b = _particionar(banco, k)
+    orden_m, limites_m = _particionar(meta, k)
+
+    compartidos = [
+        _Compartido(a) for a in (
+            banco, orden_b, limites_b, meta, orden_m, limites_m,
+            np.zeros(len(banco), dtype=bool), np.zeros(len(meta), dtype=bool),
+        )
+    ]
+    try:
+        refs = [c.ref for c in compartidos]
+        pool = _obtener_pool()
+        lotes = [list(range(k))[i::PROCESOS] for i in range(PROCESOS)]
+        for futuro in [pool.submit(_cruzar_particiones, refs, lote) for lote in lotes if lote]:
+            futuro.result()
+        return compartidos[6].arreglo.copy(), compartidos[7].arreglo.copy()
+    finally:
+        for compartido in compartidos:
+            compartido.liberar()
@@ -0,0 +1,170 @@
+"""Exportación de resultados (DSN, PSD, cruzados) a xlsx, CSV o Parquet.
+
+El xlsx se escribe con xlsxwriter en modo constant_memory: cada fila se vuelca a disco apenas
+se escribe, así la memoria no crece con el tamaño del resultado. Todas las salidas van a un
+SpooledTemporaryFile, que queda en RAM mientras es chico y pasa a disco al crecer.
+"""
+import tempfile
+
+import pandas as pd
+
+from conciliacion.trazas import etapa
+
+# Por encima de esto el archivo exportado pasa de memoria a disco
+LIMITE_MEMORIA = 32 * 1024 ** 2
+LOTE_PROGRESO = 10_000
+
+MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _sin_progreso(fraccion):
+    pass
+
+
+def _columnas(df):
+    """(valores, tipo) por columna, con None en lugar de NaN/NaT."""
+    columnas = []
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_bool_dtype(serie):
+            tipo = "bool"
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            tipo = "fecha"
+        elif pd.api.types.is_numeric_dtype(serie):
+            tipo = "numero"
+        else:
+            tipo = "texto"
+        valores = serie.astype(object).where(serie.notna(), None).tolist()
+        columnas.append((valores, tipo))
+    return columnas
+
+
+def escribir_hoja(libro, nombre, df, progreso=_sin_progreso, formatos=None):
+    """Vuelca df en una hoja nueva de un xlsxwriter.Workbook, fila por fila."""
+    formatos = formatos or {}
+    hoja = libro.add_worksheet(nombre[:31])
+    encabezado = formatos.get("encabezado")
+    fecha = formatos.get("fecha")
+
+    for j, col in enumerate(df.columns):
+        hoja.write_string(0, j, str(col), encabezado)
+
+    escritores = {
+        "bool": hoja.write_boolean,
+        "numero": hoja.write_number,
+        "texto": lambda i, j, v: hoja.write_string(i, j, str(v)),
+        "fecha": lambda i, j, v: hoja.write_datetime(i, j, v, fecha),
+    }
+    total = max(len(df), 1)
+    # Por bloques: solo un bloque de filas se convierte a objetos Python a la vez.
+    # constant_memory exige escribir fila por fila (al cambiar de fila la anterior se vuelca)
+    for inicio in range(0, len(df), LOTE_PROGRESO):
+        columnas = _columnas(df.iloc[inicio:inicio + LOTE_PROGRESO])
+        por_columna = [escritores[tipo] for _, tipo in columnas]
+        for i, fila in enumerate(zip(*(valores for valores, _ in columnas)), start=inicio + 1):
+            for j, valor in enumerate(fila):
+                if valor is not None:
+                    por_columna[j](i, j, valor)
+        progreso(inicio / total)
+    return hoja
+
+
+def formatos_libro(libro):
+    return {
+        "encabezado": libro.add_format({"bold": True}),
+        "fecha": libro.add_format({"num_format": "dd/mm/yyyy hh:mm:ss"}),
+    }
+
+
+def escribir_xlsx(df, destino, progreso=_sin_progreso, hoja="Datos"):
+    import xlsxwriter
+
+    libro = xlsxwriter.Workbook(destino, {"constant_memory": True})
+    escribir_hoja(libro, hoja, df, progreso, formatos_libro(libro))
+    libro.close()
+
+
+def escribir_csv(df, destino, progreso=_sin_progreso, hoja=None):
+    # utf-8-sig para que Excel abra bien las tildes
+    total = max(len(df), 1)
+    for inicio in range(0, max(len(df), 1), LOTE_PROGRESO * 10):
+        df.iloc[inicio:inicio + LOTE_PROGRESO * 10].to_csv(
+            destino, index=False, header=inicio == 0, encoding="utf-8-sig" if inicio == 0 else "utf-8", mode="wb"
+        )
+        progreso(inicio / total)
+
+
+def escribir_parquet(df, destino, progreso=_sin_progreso, hoja=None):
+    df.to_parquet(destino, index=False)
+
+
+ESCRITORES = {
+    "xlsx": escribir_xlsx,
+    "csv": escribir_csv,
+    "parquet": escribir_parquet,
+}
+
+
+def exportar(df, formato="xlsx", progreso=_sin_progreso, hoja="Datos"):
+    """Escribe df en el formato pedido y devuelve el SpooledTemporaryFile rebobinado."""
+    destino = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA)
+    with etapa("exportar", df) as medicion:
+        ESCRITORES[formato](df, destino, progreso, hoja)
+        medicion.salida(df)
+        medicion.bytes = destino.tell()
+    progreso(1.0)
+    destino.seek(0)
+    return destino
+
+
+# =================================================
+# LISTAS DE PSP_TIN (para pegar en SQL)
+# =================================================
+FORMATOS_LISTA = {
+    "txt": "Separados por coma",
+    "sql": "IN (...) de SQL",
+    "json": "Arreglos JSON",
+    "values": "Tabla VALUES",
+}
+EXTENSION_LISTA = {"txt": "txt", "sql": "sql", "json": "jsonl", "values": "sql"}
+
+
+def lista_psptin(psptin, formato="txt", tamano=None, columna="Deuda_PspTin"):
+    """Lista de PSP_TIN únicos partida en bloques de `tamano` (None: un solo bloque).
+
+    txt: 2...,2...  ·  sql: columna IN ('2...', ...) unidos con OR  ·  json: un arreglo por línea
+    values: SELECT ... FROM (VALUES ('2...'), ...) unidos con UNION ALL.
+    Las comillas se agregan sobre toda la columna a la vez; solo hay un join por bloque.
+    Solo se aceptan PSP_TIN numéricos, así nada de lo que se arma puede romper el SQL.
+    """
+    valores = pd.Series(psptin).dropna().astype(str).str.strip()
+    valores = valores[valores.str.fullmatch(r"\d+")].drop_duplicates()
+
+    if formato == "txt":
+        piezas, separador = valores, ","
+    elif formato == "sql":
+        piezas, separador = "'" + valores + "'", ", "
+    elif formato == "json":
+        piezas, separador = '"' + valores + '"', ","
+    elif formato == "values":
+        piezas, separador = "('" + valores + "')", ", "
+    else:
+        raise ValueError(f"Formato de lista desconocido: {formato}")
+
+    piezas = piezas.to_numpy()
+    tamano = tamano or max(len(piezas), 1)
+    bloques = [separador.join(piezas[i:i + tamano]) for i in range(0, len(piezas), tamano)]
+
+    if formato == "sql":
+        return "\n   OR ".join(f"{columna} IN ({bloque})" for bloque in bloques)
+    if formato == "json":
+        return "\n".join(f"[{bloque}]" for bloque in bloques)
+    if formato == "values":
+        return "\nUNION ALL\n".join(
+            f"SELECT psp_tin FROM (VALUES {bloque}) AS lista(psp_tin)" for bloque in bloques
+        )
+    return "\n".join(bloques)
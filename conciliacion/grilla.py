@@ -0,0 +1,71 @@
+"""Filtrado, orden y paginación de resultados del lado del servidor.
+
+La app muestra DSN, PSD y el EECC con st.dataframe; con cientos de miles de filas mandar el
+frame completo al navegador en cada rerun congela la página. Aquí el frame se queda en el
+servidor: se filtra con máscaras vectorizadas, se ordena solo la columna elegida y se corta
+la página visible, que es lo único que se serializa.
+"""
+import numpy as np
+import pandas as pd
+
+from conciliacion.columnas import COL_FECHA, COL_PSPTIN, COLUMNAS_MEDIO, COLUMNAS_META_MONTO, buscar_columna
+
+
+def columnas_filtro(df):
+    """Columnas de monto, fecha, PSP_TIN y medio de atención del frame (None si no están)."""
+    columnas = list(df.columns)
+    return {
+        "monto": buscar_columna(columnas, ["Monto", *COLUMNAS_META_MONTO]),
+        "fecha": buscar_columna(columnas, ["Fecha", COL_FECHA]),
+        "psptin": buscar_columna(columnas, ["PSP_TIN", COL_PSPTIN]),
+        "medio": buscar_columna(columnas, COLUMNAS_MEDIO),
+    }
+
+
+def _fechas(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    # CREP guarda la fecha como texto dd/mm/aaaa
+    return pd.to_datetime(serie, dayfirst=True, errors="coerce")
+
+
+def filtrar(df, columnas, monto_min=None, monto_max=None, desde=None, hasta=None, medios=None, prefijo=""):
+    """Filas que cumplen todos los filtros dados; hasta es inclusivo (fecha)."""
+    mascara = np.ones(len(df), dtype=bool)
+
+    if columnas["monto"] is not None and (monto_min is not None or monto_max is not None):
+        montos = pd.to_numeric(df[columnas["monto"]], errors="coerce")
+        if monto_min is not None:
+            mascara &= (montos >= monto_min).to_numpy()
+        if monto_max is not None:
+            mascara &= (montos <= monto_max).to_numpy()
+
+    if columnas["fecha"] is not None and (desde is not None or hasta is not None):
+        dias = _fechas(df[columnas["fecha"]]).dt.normalize()
+        if desde is not None:
+            mascara &= (dias >= pd.Timestamp(desde)).to_numpy()
+        if hasta is not None:
+            mascara &= (dias <= pd.Timestamp(hasta)).to_numpy()
+
+    if columnas["medio"] is not None and medios:
+        mascara &= df[columnas["medio"]].isin(medios).to_numpy()
+
+    if columnas["psptin"] is not None and prefijo:
+        mascara &= df[columnas["psptin"]].astype(str).str.startswith(prefijo).fillna(False).to_numpy()
+
+    return df[mascara]
+
+
+def pagina(df, numero, tamano, orden=None, ascendente=True, columnas=None):
+    """Filas de la página `numero` (desde 0). Ordena solo la columna elegida, no el frame."""
+    inicio = numero * tamano
+    if orden is None:
+        return df.iloc[inicio:inicio + tamano]
+
+    clave = df[orden].reset_index(drop=True)
+    if columnas is not None and orden == columnas["fecha"]:
+        clave = _fechas(clave)
+    # Las columnas object de Excel mezclan texto y números: se comparan como texto
+    texto = (lambda s: s.astype(str).where(s.notna())) if clave.dtype == object else None
+    posiciones = clave.sort_values(ascending=ascendente, kind="stable", na_position="last", key=texto).index
+    return df.iloc[posiciones[inicio:inicio + tamano]]
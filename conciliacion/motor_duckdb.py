@@ -0,0 +1,345 @@
+"""Motor fuera de memoria para la conciliación DSN/PSD (DuckDB).
+
+Mismo flujo que el motor pandas de conciliacion.cargadores y conciliacion.cruce (carga, limpieza,
+extornos, cruce por PSP_TIN y segundo nivel por Nº operación / Monto + Fecha), pero sobre archivos locales: los Excel se vuelcan a
+parquet en streaming y DuckDB resuelve todo en una base en disco con un límite de memoria,
+derramando a disco lo que no entra. Los resultados quedan en parquet en la carpeta de salida.
+"""
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+import duckdb
+
+from conciliacion.archivos import detectar_formato, excel_a_parquet
+from conciliacion.columnas import (
+    COL_BANCO,
+    COL_FECHA,
+    COL_MONEDA,
+    COL_PSPTIN,
+    COLUMNAS_META_MONTO,
+    COLUMNAS_META_NRO_OP,
+    EXTRAER_PSPTIN,
+    PSPTIN_VALIDO,
+    buscar_columna,
+)
+
+
+# =================================================
+# CARGA BANCO
+# =================================================
+def _q(nombre):
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+def _sin_extornos(relacion):
+    """Quita los Nº de operación repetidos que tienen alguna fila con "Extorno"."""
+    return f"""
+        SELECT * FROM ({relacion}) r
+        WHERE coalesce(r.nro, chr(0)) NOT IN (
+            SELECT coalesce(nro, chr(0)) FROM (
+                SELECT nro, descripcion, count(*) OVER (PARTITION BY nro) AS n FROM ({relacion})
+            ) WHERE n > 1 AND descripcion ILIKE '%extorno%'
+        )
+    """
+
+
+def _validos(relacion):
+    return f"SELECT * FROM ({relacion}) WHERE regexp_matches(coalesce(psp_tin, ''), '{PSPTIN_VALIDO}')"
+
+
+def _invalidos(relacion):
+    return f"SELECT * FROM ({relacion}) WHERE NOT regexp_matches(coalesce(psp_tin, ''), '{PSPTIN_VALIDO}')"
+
+
+def _sin_psptin(relacion):
+    return f"SELECT * FROM ({relacion}) WHERE monto > 0"
+
+
+def _dedup_psptin(relacion):
+    return f"SELECT * FROM ({relacion}) QUALIFY row_number() OVER (PARTITION BY psp_tin ORDER BY fila) = 1"
+
+
+def _cargar_crep(con, ruta):
+    con.execute(f"""
+        CREATE TABLE movimientos AS
+        SELECT * FROM (
+            SELECT
+                fila,
+                ltrim(trim(substr(linea, 206, 12)), '0') AS psp_tin,
+                trim(substr(linea, 74, 15)) AS monto_raw,
+                CASE WHEN regexp_full_match(monto_raw, '[0-9]+') THEN CAST(monto_raw AS HUGEINT) / 100 END AS monto,
+                trim(substr(linea, 157, 12)) AS medio,
+                substr(linea, 64, 2) || '/' || substr(linea, 62, 2) || '/' || substr(linea, 58, 4) AS fecha,
+                substr(linea, 169, 2) || ':' || substr(linea, 171, 2) || ':' || substr(linea, 173, 2) AS hora,
+                try_strptime(fecha || ' ' || hora, '%d/%m/%Y %H:%M:%S') AS fechahora,
+                trim(substr(linea, 125, 6)) AS nro,
+                CAST(NULL AS VARCHAR) AS descripcion
+            FROM (
+                SELECT row_number() OVER () AS fila, linea
+                FROM read_csv(?, columns = {{'linea': 'VARCHAR'}}, delim = chr(30), quote = '',
+                              escape = '', header = false, auto_detect = false)
+                WHERE starts_with(linea, 'DD')
+            )
+        )
+        WHERE fechahora IS NOT NULL
+    """, [str(ruta)])
+    con.execute(f"CREATE TABLE banco AS {_dedup_psptin(_validos('FROM movimientos'))}")
+    con.execute(f"""
+        CREATE TABLE sin_psptin AS
+        SELECT fila, monto, fecha, nro, CAST(fechahora AS DATE) AS dia
+        FROM ({_sin_psptin(_invalidos('FROM movimientos'))})
+    """)
+
+
+def _cargar_excel(con, ruta, formato, carpeta):
+    skiprows = 7 if formato == "bcp" else 10
+    parquet = excel_a_parquet(ruta, carpeta / "banco.parquet", skiprows, limpiar_encabezados=formato != "bcp")
+    fuente = f"read_parquet('{parquet}')"
+
+    if formato == "bcp":
+        columnas = f"""
+            trim(coalesce("Descripción operación", 'nan')) AS descripcion,
+            trim(coalesce("Nº operación", 'nan')) AS nro,
+            TRY_CAST("Monto" AS DOUBLE) AS monto,
+            coalesce(TRY_CAST("Fecha" AS TIMESTAMP), try_strptime("Fecha", '%d/%m/%Y')) AS fecha
+        """
+        filtro = "TRUE"
+    elif formato == "bbva":
+        columnas = f"""
+            trim(coalesce("Concepto", 'nan')) AS descripcion,
+            "Núm.Movimiento" AS nro,
+            TRY_CAST("Importe" AS DOUBLE) AS monto,
+            coalesce(try_strptime("F.Operación", '%d-%m-%Y'), TRY_CAST("F.Operación" AS TIMESTAMP)) AS fecha
+        """
+        filtro = "TRUE"
+    else:
+        columnas = f"""
+            trim(coalesce("Concepto", 'nan')) AS descripcion,
+            trim(coalesce("Nº. Doc.", 'nan')) AS nro,
+            TRY_CAST("Importe" AS DOUBLE) AS monto,
+            coalesce(TRY_CAST("F. Operación" AS TIMESTAMP), try_strptime("F. Operación", '%d-%m-%Y')) AS fecha
+        """
+        # Filas de saldo al inicio y al final de cada día
+        filtro = r"NOT regexp_matches(descripcion, '^Saldo (Inicial|Final):', 'i')"
+
+    con.execute(f"""
+        CREATE TABLE movimientos AS
+        SELECT *, regexp_extract(descripcion, '{EXTRAER_PSPTIN}', 1) AS psp_tin
+        FROM (SELECT row_number() OVER () AS fila, {columnas} FROM {fuente})
+        WHERE {filtro}
+    """)
+    # regexp_extract devuelve '' cuando no hay match (pandas: NaN)
+    con.execute("UPDATE movimientos SET psp_tin = NULL WHERE psp_tin = ''")
+
+    if formato == "bcp":
+        # Extornos sobre todo el EECC y luego PSP_TIN válidos
+        con.execute(f"CREATE TABLE depurado AS {_sin_extornos('FROM movimientos')}")
+        banco = _dedup_psptin(_validos("FROM depurado"))
+        sin_psptin = _sin_psptin(_sin_extornos(_invalidos("FROM depurado")))
+    else:
+        # BBVA: PSP_TIN válidos primero y luego extornos
+        banco = _dedup_psptin(_sin_extornos(_validos("FROM movimientos")))
+        sin_psptin = _sin_psptin(_sin_extornos(_invalidos("FROM movimientos")))
+
+    con.execute(f"CREATE TABLE banco AS {banco}")
+    con.execute(f"""
+        CREATE TABLE sin_psptin AS
+        SELECT fila, monto, fecha, nro, CAST(fecha AS DATE) AS dia FROM ({sin_psptin})
+    """)
+
+
+# =================================================
+# METABASE
+# =================================================
+def _fuente_metabase(metabase, carpeta, desde, hasta):
+    """Relación SQL de Metabase: almacén local (particiones diarias) o un export .xlsx/.parquet."""
+    metabase = Path(metabase)
+    if metabase.is_dir():
+        # Poda por partición: DuckDB solo abre los días de la ventana
+        filtro = "TRUE"
+        if desde is not None:
+            filtro = f"fecha = 'sin_fecha' OR (fecha >= '{desde:%Y-%m-%d}' AND fecha < '{hasta:%Y-%m-%d}')"
+        return f"""(
+            SELECT * EXCLUDE (fecha)
+            FROM read_parquet('{metabase}/fecha=*/datos.parquet', hive_partitioning = true,
+                              hive_types_autocast = false, union_by_name = true)
+            WHERE {filtro}
+        )"""
+
+    if metabase.suffix.lower() in (".xlsx", ".xls"):
+        metabase = excel_a_parquet(metabase, carpeta / "metabase.parquet")
+    return f"read_parquet('{metabase}')"
+
+
+# =================================================
+# CONCILIACIÓN
+# =================================================
+def conciliar(ruta_banco, metabase, salida, margen_dias=1, memoria="2GB", hilos=None):
+    """Concilia un EECC contra Metabase sin cargar los archivos en memoria.
+
+    metabase puede ser la carpeta del almacén local, un .xlsx o un .parquet. Escribe
+    dsn.parquet, psd.parquet y cruzados.parquet en salida y devuelve un resumen.
+    """
+    salida = Path(salida)
+    salida.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix="conciliacion_") as temporal:
+        carpeta = Path(temporal)
+        con = duckdb.connect(str(carpeta / "conciliacion.duckdb"))
+        try:
+            con.execute(f"SET memory_limit = '{memoria}'")
+            con.execute(f"SET temp_directory = '{carpeta / 'spill'}'")
+            con.execute("SET preserve_insertion_order = true")
+            if hilos:
+                con.execute(f"SET threads = {int(hilos)}")
+
+            formato = detectar_formato(ruta_banco)
+            if formato == "crep":
+                _cargar_crep(con, ruta_banco)
+            else:
+                _cargar_excel(con, ruta_banco, formato, carpeta)
+            banco_archivo = "BBVA" if formato.startswith("bbva") else "BCP"
+
+            return _cruzar(con, metabase, salida, carpeta, formato, banco_archivo, margen_dias)
+        finally:
+            con.close()
+
+
+def _cruzar(con, metabase, salida, carpeta, formato, banco_archivo, margen_dias):
+    es_crep = formato == "crep"
+
+    # Ventana del EECC (FechaHora en CREP) más el margen
+    fecha_banco = "fechahora" if es_crep else "fecha"
+    desde, hasta = con.execute(f"""
+        SELECT min(d), max(d) FROM (
+            SELECT CAST({fecha_banco} AS DATE) AS d FROM banco
+            UNION ALL SELECT dia FROM sin_psptin
+        )
+    """).fetchone()
+    if desde is not None:
+        desde = desde - timedelta(days=margen_dias)
+        hasta = hasta + timedelta(days=margen_dias + 1)
+
+    fuente = _fuente_metabase(metabase, carpeta, desde, hasta)
+    ventana = "TRUE"
+    if desde is not None:
+        ventana = f"f IS NULL OR (f >= DATE '{desde}' AND f < DATE '{hasta}')"
+
+    # Poda por ventana, luego dedup por PSP_TIN y filtro de banco/moneda (mismo orden que la app)
+    psptin = _q(COL_PSPTIN)
+    con.execute(f"""
+        CREATE TABLE meta AS
+        SELECT * EXCLUDE (f) REPLACE (CAST({psptin} AS VARCHAR) AS {psptin}, f AS {_q(COL_FECHA)})
+        FROM (
+            SELECT row_number() OVER () AS _fila, TRY_CAST({_q(COL_FECHA)} AS TIMESTAMP) AS f, *
+            FROM {fuente}
+        )
+        WHERE {ventana}
+        QUALIFY row_number() OVER (PARTITION BY CAST({psptin} AS VARCHAR) ORDER BY _fila) = 1
+    """)
+    con.execute(f"""
+        CREATE TABLE meta_filtrado AS
+        SELECT * FROM meta
+        WHERE upper(CAST({_q(COL_BANCO)} AS VARCHAR)) LIKE '%{banco_archivo}%'
+          AND trim(upper(CAST({_q(COL_MONEDA)} AS VARCHAR))) = 'PEN'
+    """)
+    columnas_meta = [fila[0] for fila in con.execute("DESCRIBE meta").fetchall() if fila[0] != "_fila"]
+
+    # Nivel 1: PSP_TIN
+    con.execute(f"CREATE TABLE psd AS SELECT * FROM meta_filtrado m ANTI JOIN banco b ON m.{psptin} = b.psp_tin")
+    con.execute(f"""
+        CREATE TABLE cruzados AS
+        SELECT b.fila, b.psp_tin AS {psptin}, 'PSP_TIN' AS nivel FROM banco b
+        SEMI JOIN meta_filtrado m ON b.psp_tin = m.{psptin}
+    """)
+    con.execute("CREATE TABLE pendientes AS SELECT * FROM sin_psptin")
+    con.execute("CREATE TABLE cruzados_sec (fila BIGINT, _fila BIGINT, psp VARCHAR, nivel VARCHAR)")
+
+    # Nivel 2: Nº operación
+    col_nro_op = buscar_columna(columnas_meta, COLUMNAS_META_NRO_OP)
+    if col_nro_op is not None:
+        clave_meta = f"ltrim(regexp_replace(trim(coalesce(CAST({_q(col_nro_op)} AS VARCHAR), '')), '\\.0$', ''), '0')"
+        clave_banco = "ltrim(regexp_replace(trim(coalesce(p.nro, '')), '\\.0$', ''), '0')"
+        con.execute(f"""
+            INSERT INTO cruzados_sec
+            SELECT p.fila, c._fila, c.psp, 'Nº operación'
+            FROM pendientes p
+            JOIN (
+                SELECT _fila, {psptin} AS psp, {clave_meta} AS clave FROM psd
+                WHERE clave <> ''
+                QUALIFY row_number() OVER (PARTITION BY clave ORDER BY _fila) = 1
+            ) c ON {clave_banco} = c.clave
+        """)
+        con.execute("DELETE FROM pendientes WHERE fila IN (SELECT fila FROM cruzados_sec)")
+
+    # Nivel 3: Monto + Fecha, repetidos emparejados 1 a 1 por orden de aparición
+    col_monto = buscar_columna(columnas_meta, COLUMNAS_META_MONTO)
+    if col_monto is not None:
+        con.execute(f"""
+            INSERT INTO cruzados_sec
+            SELECT b.fila, m._fila, m.psp, 'Monto + Fecha'
+            FROM (
+                SELECT fila, round(monto, 2) AS monto, dia,
+                       row_number() OVER (PARTITION BY round(monto, 2), dia ORDER BY fila) AS n
+                FROM pendientes WHERE monto IS NOT NULL AND dia IS NOT NULL
+            ) b
+            JOIN (
+                SELECT _fila, psp, monto, dia,
+                       row_number() OVER (PARTITION BY monto, dia ORDER BY _fila) AS n
+                FROM (
+                    SELECT _fila, {psptin} AS psp,
+                           round(TRY_CAST({_q(col_monto)} AS DOUBLE), 2) AS monto,
+                           CAST({_q(COL_FECHA)} AS DATE) AS dia
+                    FROM psd WHERE _fila NOT IN (SELECT _fila FROM cruzados_sec)
+                ) WHERE monto IS NOT NULL AND dia IS NOT NULL
+            ) m USING (monto, dia, n)
+        """)
+        con.execute("DELETE FROM pendientes WHERE fila IN (SELECT fila FROM cruzados_sec)")
+
+    con.execute("DELETE FROM psd WHERE _fila IN (SELECT _fila FROM cruzados_sec)")
+
+    # Salidas con los nombres de columnas de la app
+    medio = ' medio AS "Medio de atención",' if es_crep else ""
+    medio_sin = ' NULL AS "Medio de atención",' if es_crep else ""
+    hora = ', hora AS "Hora", fechahora AS "FechaHora"' if es_crep else ""
+    hora_sin = ', NULL AS "Hora", NULL AS "FechaHora"' if es_crep else ""
+    columnas_banco = f'psp_tin AS "PSP_TIN", monto AS "Monto",{medio} fecha AS "Fecha"{hora}, nro AS "Nº operación"'
+    columnas_sin = f'NULL AS "PSP_TIN", monto AS "Monto",{medio_sin} fecha AS "Fecha"{hora_sin}, nro AS "Nº operación"'
+
+    rutas = {nombre: salida / f"{nombre}.parquet" for nombre in ("dsn", "psd", "cruzados")}
+    con.execute(f"""
+        COPY (
+            SELECT * EXCLUDE (orden, fila) FROM (
+                SELECT 0 AS orden, fila, {columnas_banco} FROM banco ANTI JOIN cruzados USING (fila)
+                UNION ALL BY NAME
+                SELECT 1 AS orden, fila, {columnas_sin} FROM pendientes
+            ) ORDER BY orden, fila
+        ) TO '{rutas["dsn"]}' (FORMAT parquet)
+    """)
+    con.execute(f"""
+        COPY (SELECT * EXCLUDE (_fila) FROM psd ORDER BY _fila) TO '{rutas["psd"]}' (FORMAT parquet)
+    """)
+    con.execute(f"""
+        COPY (
+            SELECT * EXCLUDE (orden, fila) FROM (
+                SELECT 0 AS orden, b.fila, {columnas_banco},
+                       c.{psptin}, c.nivel AS "Nivel de cruce"
+                FROM cruzados c JOIN banco b USING (fila)
+                UNION ALL BY NAME
+                SELECT CASE c.nivel WHEN 'Nº operación' THEN 1 ELSE 2 END AS orden, p.fila,
+                       {columnas_sin}, c.psp AS {psptin}, c.nivel AS "Nivel de cruce"
+                FROM cruzados_sec c JOIN sin_psptin p USING (fila)
+            ) ORDER BY orden, fila
+        ) TO '{rutas["cruzados"]}' (FORMAT parquet)
+    """)
+
+    resumen = {
+        nombre: con.execute(f"SELECT count(*) FROM read_parquet('{ruta}')").fetchone()[0]
+        for nombre, ruta in rutas.items()
+    }
+    resumen["niveles"] = dict(con.execute(f"""
+        SELECT "Nivel de cruce", count(*) FROM read_parquet('{rutas["cruzados"]}') GROUP BY ALL
+    """).fetchall())
+    resumen.update(formato=formato, banco=banco_archivo, desde=desde, hasta=hasta, rutas=rutas)
+    return resumen
@@ -0,0 +1,320 @@
+"""Motor Polars (lazy) para la conciliación DSN/PSD.
+
+Carga del banco, extornos y cruce DSN/PSD (con el segundo nivel) se arman como un solo plan
+lazy que Polars optimiza completo: solo lee las columnas que usa, fusiona las operaciones de
+texto, empuja los filtros de fecha hasta el scan del almacén y ejecuta en todos los núcleos.
+Mismos resultados que el motor pandas (conciliacion.cruce).
+"""
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import polars as pl
+
+from conciliacion.archivos import detectar_formato, excel_a_parquet
+from conciliacion.columnas import (
+    COL_BANCO,
+    COL_FECHA,
+    COL_MONEDA,
+    COL_PSPTIN,
+    COLUMNAS_META_MONTO,
+    COLUMNAS_META_NRO_OP,
+    EXTRAER_PSPTIN,
+    PSPTIN_VALIDO,
+    buscar_columna,
+)
+
+
+# =================================================
+# CARGA BANCO
+# =================================================
+def _sin_extornos(lf):
+    """Quita los Nº de operación repetidos que tienen alguna fila con "Extorno"."""
+    extornos = (
+        lf.filter((pl.len().over("nro") > 1) & pl.col("descripcion").str.contains("(?i)extorno"))
+        .select("nro")
+        .unique()
+    )
+    return lf.join(extornos, on="nro", how="anti", nulls_equal=True, maintain_order="left")
+
+
+def _es_valido():
+    return pl.col("psp_tin").str.contains(PSPTIN_VALIDO).fill_null(False)
+
+
+def _dedup_psptin(lf):
+    return lf.unique(subset="psp_tin", keep="first", maintain_order=True)
+
+
+def _cargar_crep(ruta):
+    lineas = (
+        pl.scan_csv(ruta, has_header=False, separator="\x1e", quote_char=None, new_columns=["linea"],
+                    schema={"linea": pl.String}, row_index_name="fila", empty_string_is_null=False)
+        .filter(pl.col("linea").str.starts_with("DD"))
+    )
+    linea = pl.col("linea")
+    monto_raw = linea.str.slice(73, 15).str.strip_chars()
+    movimientos = (
+        lineas.select(
+            "fila",
+            linea.str.slice(205, 12).str.strip_chars().str.strip_chars_start("0").alias("psp_tin"),
+            pl.when(monto_raw.str.contains(r"^[0-9]+$"))
+            .then(monto_raw.cast(pl.Int64) / 100).alias("monto"),
+            linea.str.slice(156, 12).str.strip_chars().alias("medio"),
+            pl.concat_str([linea.str.slice(63, 2), linea.str.slice(61, 2), linea.str.slice(57, 4)],
+                          separator="/").alias("fecha"),
+            pl.concat_str([linea.str.slice(168, 2), linea.str.slice(170, 2), linea.str.slice(172, 2)],
+                          separator=":").alias("hora"),
+            linea.str.slice(124, 6).str.strip_chars().alias("nro"),
+        )
+        .with_columns(
+            pl.concat_str(["fecha", "hora"], separator=" ")
+            .str.strptime(pl.Datetime("us"), "%d/%m/%Y %H:%M:%S", strict=False).alias("fechahora")
+        )
+        .filter(pl.col("fechahora").is_not_null())
+    )
+    banco = _dedup_psptin(movimientos.filter(_es_valido()))
+    sin_psptin = (
+        movimientos.filter(~_es_valido() & (pl.col("monto") > 0))
+        .with_columns(pl.col("fechahora").dt.date().alias("dia"))
+    )
+    return banco, sin_psptin
+
+
+def _texto(columna):
+    return pl.col(columna).fill_null("nan").str.strip_chars()
+
+
+def _fecha(columna, formato):
+    # Celdas de fecha llegan en ISO desde el volcado a parquet; texto con el formato del banco
+    iso = pl.col(columna).str.to_datetime(strict=False, time_unit="us")
+    return pl.coalesce(iso, pl.col(columna).str.strptime(pl.Datetime("us"), formato, strict=False))
+
+
+def _cargar_excel(ruta, formato, carpeta):
+    skiprows = 7 if formato == "bcp" else 10
+    parquet = excel_a_parquet(ruta, carpeta / "banco.parquet", skiprows, limpiar_encabezados=formato != "bcp")
+    fuente = pl.scan_parquet(parquet).with_row_index("fila")
+
+    if formato == "bcp":
+        movimientos = fuente.select(
+            "fila",
+            _texto("Descripción operación").alias("descripcion"),
+            _texto("Nº operación").alias("nro"),
+            pl.col("Monto").cast(pl.Float64, strict=False).alias("monto"),
+            _fecha("Fecha", "%d/%m/%Y").alias("fecha"),
+        )
+    elif formato == "bbva":
+        movimientos = fuente.select(
+            "fila",
+            _texto("Concepto").alias("descripcion"),
+            pl.col("Núm.Movimiento").alias("nro"),
+            pl.col("Importe").cast(pl.Float64, strict=False).alias("monto"),
+            pl.coalesce(
+                pl.col("F.Operación").str.strptime(pl.Datetime("us"), "%d-%m-%Y", strict=False),
+                pl.col("F.Operación").str.to_datetime(strict=False, time_unit="us"),
+            ).alias("fecha"),
+        )
+    else:
+        movimientos = fuente.select(
+            "fila",
+            _texto("Concepto").alias("descripcion"),
+            _texto("Nº. Doc.").alias("nro"),
+            pl.col("Importe").cast(pl.Float64, strict=False).alias("monto"),
+            _fecha("F. Operación", "%d-%m-%Y").alias("fecha"),
+        ).filter(~pl.col("descripcion").str.contains(r"(?i)^Saldo (Inicial|Final):"))
+
+    movimientos = movimientos.with_columns(
+        pl.col("descripcion").str.extract(EXTRAER_PSPTIN, 1).alias("psp_tin")
+    )
+
+    if formato == "bcp":
+        # Extornos sobre todo el EECC y luego PSP_TIN válidos
+        depurado = _sin_extornos(movimientos)
+        banco = _dedup_psptin(depurado.filter(_es_valido()))
+        sin_psptin = _sin_extornos(depurado.filter(~_es_valido()))
+    else:
+        # BBVA: PSP_TIN válidos primero y luego extornos
+        banco = _dedup_psptin(_sin_extornos(movimientos.filter(_es_valido())))
+        sin_psptin = _sin_extornos(movimientos.filter(~_es_valido()))
+
+    sin_psptin = sin_psptin.filter(pl.col("monto") > 0).with_columns(pl.col("fecha").dt.date().alias("dia"))
+    return banco, sin_psptin
+
+
+# =================================================
+# METABASE
+# =================================================
+def _fuente_metabase(metabase, carpeta, desde, hasta):
+    metabase = Path(metabase)
+    if metabase.is_dir():
+        lf = pl.scan_parquet(metabase / "fecha=*" / "datos.parquet", hive_partitioning=True,
+                             hive_schema={"fecha": pl.String}, missing_columns="insert")
+        if desde is not None:
+            # Filtro sobre la columna de partición: Polars no abre los días fuera de la ventana
+            lf = lf.filter(
+                (pl.col("fecha") == "sin_fecha")
+                | ((pl.col("fecha") >= f"{desde:%Y-%m-%d}") & (pl.col("fecha") < f"{hasta:%Y-%m-%d}"))
+            )
+        return lf.drop("fecha")
+
+    if metabase.suffix.lower() in (".xlsx", ".xls"):
+        metabase = excel_a_parquet(metabase, carpeta / "metabase.parquet")
+    return pl.scan_parquet(metabase)
+
+
+def _a_fecha(lf, columna):
+    if lf.collect_schema()[columna] == pl.String:
+        return pl.col(columna).str.to_datetime(strict=False, time_unit="us")
+    return pl.col(columna).cast(pl.Datetime("us"))
+
+
+# =================================================
+# CONCILIACIÓN
+# =================================================
+def _normalizar_nro_op(expr):
+    return expr.cast(pl.String).fill_null("").str.strip_chars().str.replace(r"\.0$", "").str.strip_chars_start("0")
+
+
+def conciliar(ruta_banco, metabase, margen_dias=1):
+    """Concilia un EECC contra Metabase con un único plan lazy.
+
+    metabase puede ser la carpeta del almacén local, un .xlsx o un .parquet. Devuelve un
+    resumen con dsn, psd y cruzados como DataFrames de pandas.
+    """
+    with tempfile.TemporaryDirectory(prefix="conciliacion_") as temporal:
+        carpeta = Path(temporal)
+        formato = detectar_formato(ruta_banco)
+        if formato == "crep":
+            banco, sin_psptin = _cargar_crep(ruta_banco)
+        else:
+            banco, sin_psptin = _cargar_excel(ruta_banco, formato, carpeta)
+        banco_archivo = "BBVA" if formato.startswith("bbva") else "BCP"
+        es_crep = formato == "crep"
+
+        # La ventana se calcula antes para poder podar Metabase desde el scan
+        fecha_banco = "fechahora" if es_crep else "fecha"
+        banco, sin_psptin = pl.collect_all([banco, sin_psptin])
+        fechas = pl.concat([banco[fecha_banco].dt.date(), sin_psptin["dia"]]).drop_nulls()
+        desde = hasta = None
+        if len(fechas):
+            desde = datetime.combine(fechas.min(), datetime.min.time()) - timedelta(days=margen_dias)
+            hasta = datetime.combine(fechas.max(), datetime.min.time()) + timedelta(days=margen_dias + 1)
+        banco, sin_psptin = banco.lazy(), sin_psptin.lazy()
+
+        fuente = _fuente_metabase(metabase, carpeta, desde, hasta)
+        meta = fuente.with_row_index("_fila").with_columns(
+            _a_fecha(fuente, COL_FECHA).alias(COL_FECHA),
+            pl.col(COL_PSPTIN).cast(pl.String),
+        )
+        if desde is not None:
+            f = pl.col(COL_FECHA)
+            meta = meta.filter(f.is_null() | ((f >= pl.lit(desde)) & (f < pl.lit(hasta))))
+        meta = meta.unique(subset=COL_PSPTIN, keep="first", maintain_order=True)
+        meta_filtrado = meta.filter(
+            pl.col(COL_BANCO).cast(pl.String).str.to_uppercase().str.contains(banco_archivo, literal=True)
+            & (pl.col(COL_MONEDA).cast(pl.String).str.to_uppercase().str.strip_chars() == "PEN")
+        )
+        columnas_meta = fuente.collect_schema().names()
+
+        # Nivel 1: PSP_TIN
+        psd = meta_filtrado.join(banco.select("psp_tin"), left_on=COL_PSPTIN, right_on="psp_tin",
+                                 how="anti", maintain_order="left")
+        cruzados = (
+            banco.join(meta_filtrado.select(COL_PSPTIN), left_on="psp_tin", right_on=COL_PSPTIN,
+                       how="semi", maintain_order="left")
+        )
+        pendientes = sin_psptin
+        secundarios = []
+
+        # Nivel 2: Nº operación
+        col_nro_op = buscar_columna(columnas_meta, COLUMNAS_META_NRO_OP)
+        if col_nro_op is not None:
+            claves = (
+                psd.select("_fila", pl.col(COL_PSPTIN).alias("psp"), _normalizar_nro_op(pl.col(col_nro_op)).alias("clave"))
+                .filter(pl.col("clave") != "")
+                .unique(subset="clave", keep="first", maintain_order=True)
+            )
+            nivel_2 = (
+                pendientes.with_columns(_normalizar_nro_op(pl.col("nro")).alias("clave"))
+                .join(claves, on="clave", how="inner", maintain_order="left")
+                .select("fila", "_fila", "psp", pl.lit("Nº operación").alias("nivel"))
+            )
+            secundarios.append(nivel_2)
+            pendientes = pendientes.join(nivel_2.select("fila"), on="fila", how="anti", maintain_order="left")
+
+        # Nivel 3: Monto + Fecha, repetidos emparejados 1 a 1 por orden de aparición
+        col_monto = buscar_columna(columnas_meta, COLUMNAS_META_MONTO)
+        if col_monto is not None:
+            resto = psd
+            for nivel in secundarios:
+                resto = resto.join(nivel.select("_fila"), on="_fila", how="anti", maintain_order="left")
+            llave_meta = (
+                resto.select(
+                    "_fila",
+                    pl.col(COL_PSPTIN).alias("psp"),
+                    pl.col(col_monto).cast(pl.Float64, strict=False).round(2).alias("monto"),
+                    pl.col(COL_FECHA).dt.date().alias("dia"),
+                )
+                .drop_nulls(["monto", "dia"])
+                .with_columns(pl.int_range(pl.len()).over(["monto", "dia"]).alias("n"))
+            )
+            llave_banco = (
+                pendientes.select("fila", pl.col("monto").round(2), "dia")
+                .drop_nulls(["monto", "dia"])
+                .with_columns(pl.int_range(pl.len()).over(["monto", "dia"]).alias("n"))
+            )
+            nivel_3 = (
+                llave_banco.join(llave_meta, on=["monto", "dia", "n"], how="inner", maintain_order="left")
+                .select("fila", "_fila", "psp", pl.lit("Monto + Fecha").alias("nivel"))
+            )
+            secundarios.append(nivel_3)
+            pendientes = pendientes.join(nivel_3.select("fila"), on="fila", how="anti", maintain_order="left")
+
+        for nivel in secundarios:
+            psd = psd.join(nivel.select("_fila"), on="_fila", how="anti", maintain_order="left")
+
+        # Salidas con los nombres de columnas de la app
+        columnas_banco = {"psp_tin": "PSP_TIN", "monto": "Monto"}
+        if es_crep:
+            columnas_banco["medio"] = "Medio de atención"
+        columnas_banco["fecha"] = "Fecha"
+        if es_crep:
+            columnas_banco.update(hora="Hora", fechahora="FechaHora")
+        columnas_banco["nro"] = "Nº operación"
+
+        def salida(lf, *extra, sin_psptin=False):
+            # Los depósitos sin PSP_TIN solo traen Monto, Fecha y Nº operación
+            presentes = ("monto", "fecha", "nro") if sin_psptin else columnas_banco
+            columnas = [
+                pl.col(c).alias(n) if c in presentes else pl.lit(None, dtype=pl.String).alias(n)
+                for c, n in columnas_banco.items()
+            ]
+            return lf.select(columnas + list(extra))
+
+        dsn = pl.concat([
+            salida(banco.join(cruzados.select("fila"), on="fila", how="anti", maintain_order="left")),
+            salida(pendientes, sin_psptin=True),
+        ], how="vertical_relaxed")
+        nivel = pl.col("nivel").alias("Nivel de cruce")
+        cruzados = pl.concat([
+            salida(cruzados, pl.col("psp_tin").alias(COL_PSPTIN), pl.lit("PSP_TIN").alias("Nivel de cruce")),
+        ] + [
+            salida(sec.join(sin_psptin, on="fila", maintain_order="left"),
+                   pl.col("psp").alias(COL_PSPTIN), nivel, sin_psptin=True)
+            for sec in secundarios
+        ], how="vertical_relaxed")
+        psd = psd.drop("_fila")
+
+        dsn, psd, cruzados = pl.collect_all([dsn, psd, cruzados])
+
+    return {
+        "dsn": dsn.to_pandas(),
+        "psd": psd.to_pandas(),
+        "cruzados": cruzados.to_pandas(),
+        "niveles": dict(cruzados["Nivel de cruce"].value_counts().iter_rows()),
+        "formato": formato,
+        "banco": banco_archivo,
+        "desde": desde,
+        "hasta": hasta,
+    }
@@ -0,0 +1,91 @@
+"""Registro de snapshots de Metabase compartido por todas las sesiones del proceso.
+
+Cuando varios analistas suben el mismo export, el parseo se hace una vez y todas las sesiones
+leen las mismas columnas. Cada sesión recibe un Prestamo; mientras alguno siga vivo el snapshot
+se queda en memoria, y al soltarse el último (archivo nuevo o sesión cerrada) se libera. Por eso
+lo que se carga a través del registro no debe quedar retenido en otra parte (el cargador de
+Metabase de la app no usa la memoria del cache en disco).
+
+Las sesiones reciben una copia superficial: con copy-on-write (pandas >= 3) comparten los datos
+y cualquier asignación sobre su frame copia solo esa columna, sin tocar el snapshot compartido.
+"""
+import threading
+import weakref
+
+from conciliacion.trazas import marco
+
+
+class Prestamo:
+    """Referencia de una sesión a un snapshot; soltarla descuenta la referencia."""
+
+    def __init__(self, clave, frame):
+        self.clave = clave
+        self._frame = frame
+
+    @property
+    def frame(self):
+        return self._frame.copy(deep=False)
+
+
+class RegistroSnapshots:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}
+        self._referencias = {}
+        # clave -> [lock de la carga, sesiones esperándolo o cargando]
+        self._cargas = {}
+        self.parseos = 0
+
+    def prestar(self, clave, cargar):
+        """Prestamo del snapshot `clave`; si nadie lo tiene cargado, lo arma con cargar().
+
+        Dos sesiones pidiendo la misma clave a la vez esperan a un único parseo.
+        """
+        with self._lock:
+            carga = self._cargas.setdefault(clave, [threading.Lock(), 0])
+            carga[1] += 1
+
+        try:
+            with carga[0]:
+                with self._lock:
+                    frame = self._frames.get(clave)
+                if frame is None:
+                    frame = cargar()
+                    with self._lock:
+                        self._frames[clave] = frame
+                        self.parseos += 1
+                    marco("snapshot compartido", frame)
+
+                with self._lock:
+                    self._referencias[clave] = self._referencias.get(clave, 0) + 1
+                    prestamo = Prestamo(clave, frame)
+                    weakref.finalize(prestamo, self._soltar, clave)
+                    return prestamo
+        finally:
+            with self._lock:
+                carga[1] -= 1
+                self._olvidar_carga(clave)
+
+    def _olvidar_carga(self, clave):
+        # Con el lock tomado: el lock de la carga se descarta recién cuando nadie lo espera,
+        # si no una sesión nueva crearía otro y la misma clave se parsearía dos veces
+        carga = self._cargas.get(clave)
+        if carga is not None and carga[1] == 0 and clave not in self._referencias:
+            del self._cargas[clave]
+
+    def _soltar(self, clave):
+        with self._lock:
+            self._referencias[clave] -= 1
+            if self._referencias[clave] == 0:
+                del self._referencias[clave]
+                del self._frames[clave]
+                self._olvidar_carga(clave)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "snapshots": len(self._frames),
+                "referencias": sum(self._referencias.values()),
+                "parseos": self.parseos,
+                "bytes": sum(int(f.memory_usage().sum()) for f in self._frames.values()),
+            }
@@ -0,0 +1,115 @@
+"""Reporte consolidado del día: un solo libro con todas las hojas y un zip con el paquete completo.
+
+El libro se arma en una sola pasada con xlsxwriter en modo constant_memory (ver exportar), en vez
+de serializar por separado DSN, PSD, la lista de PSP_TIN y los extornos.
+"""
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+
+from conciliacion.columnas import COL_PSPTIN, COLUMNAS_META_MONTO, buscar_columna
+from conciliacion.exportar import LIMITE_MEMORIA, escribir_hoja, exportar, formatos_libro
+from conciliacion.trazas import etapa, tamano
+
+# Diferencias menores a medio céntimo son redondeo
+TOLERANCIA_MONTO = 0.005
+
+
+def _sin_progreso(fraccion):
+    pass
+
+
+def diferencias_monto(cruzados, meta, col_psptin=COL_PSPTIN):
+    """Cruces cuyo monto del banco no coincide con el de Metabase."""
+    col_monto = buscar_columna(list(meta.columns), COLUMNAS_META_MONTO)
+    if col_monto is None or cruzados.empty:
+        return pd.DataFrame()
+
+    montos = meta[[col_psptin, col_monto]].rename(columns={col_monto: "Monto Metabase"})
+    montos = montos.assign(**{
+        col_psptin: montos[col_psptin].astype(str),
+        "Monto Metabase": pd.to_numeric(montos["Monto Metabase"], errors="coerce"),
+    }).drop_duplicates(subset=col_psptin)
+
+    unidos = cruzados.merge(montos, on=col_psptin, how="inner")
+    unidos["Diferencia"] = (pd.to_numeric(unidos["Monto"], errors="coerce") - unidos["Monto Metabase"]).round(2)
+    return unidos[unidos["Diferencia"].abs() > TOLERANCIA_MONTO].reset_index(drop=True)
+
+
+def resumen_conciliacion(banco, desde, hasta, df_meta_filtrado, dsn, psd, cruzados):
+    """Hoja Resumen: banco es el dict de cargadores.cargar_banco y [desde, hasta) la ventana de Metabase."""
+    return {
+        "Banco": banco["banco"],
+        "Formato": banco["formato"],
+        "Ventana Metabase": f"{desde:%d/%m/%Y} – {hasta - pd.Timedelta(days=1):%d/%m/%Y}" if desde is not None else "",
+        "PSP_TIN en EECC": len(banco["df"]),
+        "Depósitos sin PSP_TIN": len(banco["sin_psptin"]),
+        "PSP_TIN únicos en Metabase": df_meta_filtrado[COL_PSPTIN].nunique(),
+        "DSN": len(dsn),
+        "PSD": len(psd),
+        **{f"Cruzados por {nivel}": n for nivel, n in cruzados["Nivel de cruce"].value_counts().items()},
+        "Generado": f"{datetime.now():%d/%m/%Y %H:%M:%S}",
+    }
+
+
+def hojas_reporte(resumen, dsn, psd, cruzados, diferencias, descartados):
+    """Hojas del libro en orden. resumen es un dict concepto -> valor."""
+    es_extorno = descartados["Motivo"] == "Extorno" if len(descartados) else pd.Series(dtype=bool)
+    return {
+        "Resumen": pd.DataFrame({"Concepto": list(resumen), "Valor": [str(v) for v in resumen.values()]}),
+        "DSN": dsn,
+        "PSD": psd,
+        "Cruzados": cruzados,
+        "Diferencias de monto": diferencias,
+        "Extornos": descartados[es_extorno] if len(descartados) else descartados,
+        "Líneas descartadas": descartados[~es_extorno] if len(descartados) else descartados,
+    }
+
+
+def escribir_reporte(hojas, destino, progreso=_sin_progreso):
+    """Escribe todas las hojas en un único libro, en una sola pasada."""
+    import xlsxwriter
+
+    libro = xlsxwriter.Workbook(destino, {"constant_memory": True})
+    formatos = formatos_libro(libro)
+
+    total = max(sum(len(df) for df in hojas.values()), 1)
+    escritas = 0
+    with etapa("exportar", total) as medicion:
+        for nombre, df in hojas.items():
+            hecho = escritas
+            escribir_hoja(libro, nombre, df, lambda fraccion: progreso((hecho + fraccion * len(df)) / total), formatos)
+            escritas += len(df)
+        libro.close()
+        medicion.salida(escritas)
+        medicion.bytes = tamano(destino)
+    progreso(1.0)
+
+
+def exportar_reporte(hojas, progreso=_sin_progreso):
+    destino = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA)
+    escribir_reporte(hojas, destino, progreso)
+    destino.seek(0)
+    return destino
+
+
+def exportar_paquete(hojas, nombre_libro, extras, progreso=_sin_progreso):
+    """Zip con el libro consolidado más archivos sueltos (extras: nombre -> bytes)."""
+    libro = exportar_reporte(hojas, lambda fraccion: progreso(fraccion * 0.9))
+
+    destino = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA)
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as paquete:
+        with paquete.open(nombre_libro, "w") as entrada:
+            shutil.copyfileobj(libro, entrada)
+        for nombre, contenido in extras.items():
+            paquete.writestr(nombre, contenido)
+        with paquete.open("Extornos.csv", "w") as entrada:
+            shutil.copyfileobj(exportar(hojas["Extornos"], "csv"), entrada)
+    libro.close()
+
+    progreso(1.0)
+    destino.seek(0)
+    return destino
@@ -0,0 +1,299 @@
+"""Servicio HTTP local: otras herramientas mandan el EECC y Metabase y reciben DSN/PSD en JSON.
+
+    python -m conciliacion.servicio --puerto 8600 --trabajadores 4 --cola 8
+
+    POST /conciliar        multipart: banco, metabase (sin él, el almacén local) y margen.
+                           Responde cuando termina el cruce.
+    POST /trabajos         lo mismo, pero encola y responde 202 con el id (archivos grandes)
+    GET  /trabajos/{id}    estado (en_cola, procesando, listo, error) y, al terminar, el resultado
+    GET  /salud            trabajadores, pendientes y capacidad
+
+Los handlers son async: el event loop solo recibe subidas y responde estados, y el parseo y el
+cruce corren en un pool de procesos acotado. Con más trabajos pendientes que trabajadores + cola
+se responde 503 con Retry-After antes de leer la subida, en vez de acumular archivos en memoria:
+cada subida reserva su lugar en la cola antes de leerse, así las que se reciben a la vez también
+cuentan.
+Escucha en 127.0.0.1 salvo que se pida otra cosa.
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+TRABAJADORES = int(os.environ.get("CONCILIACION_TRABAJADORES", min(4, os.cpu_count() or 1)))
+COLA = int(os.environ.get("CONCILIACION_COLA", 8))
+# Segundos que un resultado terminado sigue disponible en /trabajos/{id}
+TTL_TRABAJOS = int(os.environ.get("CONCILIACION_TRABAJOS_TTL", 3600))
+MAX_SUBIDA = int(os.environ.get("CONCILIACION_MAX_SUBIDA", 512 * 1024 ** 2))
+REINTENTAR_EN = 5
+
+
+# =================================================
+# TRABAJO (corre en los procesos del pool)
+# =================================================
+def _calentar():
+    # pandas y el núcleo quedan importados antes del primer trabajo
+    import conciliacion.cruce  # noqa: F401
+
+
+def _a_json(valor):
+    return valor.item() if hasattr(valor, "item") else str(valor)
+
+
+def _subida(datos, nombre):
+    archivo = io.BytesIO(datos)
+    archivo.name = nombre
+    return archivo
+
+
+def conciliar_subidas(banco, nombre_banco, metabase, nombre_metabase, margen_dias):
+    """Concilia bytes subidos y devuelve el cuerpo JSON ya serializado (se arma en el proceso)."""
+    from conciliacion.cruce import conciliar_archivos
+    from conciliacion.reporte import resumen_conciliacion
+
+    meta = _subida(metabase, nombre_metabase) if metabase is not None else None
+    resultado = conciliar_archivos(_subida(banco, nombre_banco), meta, margen_dias)
+    resumen = resumen_conciliacion(
+        resultado["banco"], resultado["desde"], resultado["hasta"], resultado["df_meta_filtrado"],
+        resultado["dsn"], resultado["psd"], resultado["cruzados"],
+    )
+    return (
+        '{"resumen": ' + json.dumps(resumen, default=_a_json, ensure_ascii=False)
+        + ', "dsn": ' + resultado["dsn"].to_json(orient="records", date_format="iso", force_ascii=False)
+        + ', "psd": ' + resultado["psd"].to_json(orient="records", date_format="iso", force_ascii=False)
+        + "}"
+    )
+
+
+# =================================================
+# COLA DE TRABAJOS
+# =================================================
+class Trabajo:
+    def __init__(self, id_trabajo, futuro):
+        self.id = id_trabajo
+        self.futuro = futuro
+        self.creado = time.time()
+
+    def estado(self):
+        if not self.futuro.done():
+            return "procesando" if self.futuro.running() else "en_cola"
+        return "error" if self.futuro.exception() is not None else "listo"
+
+
+class Cola:
+    """Pool de procesos acotado con registro de trabajos.
+
+    reservar() toma un lugar antes de leer la subida (False si está llena); enviar() convierte
+    esa reserva en un trabajo y liberar() la devuelve si la subida no llega a enviarse.
+    """
+
+    def __init__(self, trabajadores=TRABAJADORES, cola=COLA, ttl=TTL_TRABAJOS):
+        self.trabajadores = trabajadores
+        self.capacidad = trabajadores + cola
+        self.ttl = ttl
+        # spawn: los procesos no heredan los hilos del servidor
+        self.pool = ProcessPoolExecutor(
+            max_workers=trabajadores, mp_context=multiprocessing.get_context("spawn"), initializer=_calentar
+        )
+        self.trabajos = OrderedDict()
+        # Subidas que se están leyendo: ya ocupan memoria aunque todavía no sean trabajos
+        self.recibiendo = 0
+        self.rechazados = 0
+
+    def pendientes(self):
+        return sum(not trabajo.futuro.done() for trabajo in self.trabajos.values())
+
+    def llena(self):
+        return self.pendientes() + self.recibiendo >= self.capacidad
+
+    def reservar(self):
+        # Sin lock: reservar, liberar y enviar corren en el event loop, nunca a la vez
+        if self.llena():
+            return False
+        self.recibiendo += 1
+        return True
+
+    def liberar(self):
+        self.recibiendo -= 1
+
+    def enviar(self, *args):
+        """Encola conciliar_subidas(*args) en el lugar reservado con reservar()."""
+        self.purgar()
+        self.liberar()
+        trabajo = Trabajo(uuid.uuid4().hex, self.pool.submit(conciliar_subidas, *args))
+        self.trabajos[trabajo.id] = trabajo
+        return trabajo
+
+    def purgar(self):
+        limite = time.time() - self.ttl
+        for id_trabajo in [i for i, t in self.trabajos.items() if t.futuro.done() and t.creado < limite]:
+            del self.trabajos[id_trabajo]
+
+    def cerrar(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+# =================================================
+# HTTP
+# =================================================
+def _ocupado(cola):
+    cola.rechazados += 1
+    return JSONResponse(
+        {"error": "Cola llena, reintentar más tarde", "pendientes": cola.pendientes(), "capacidad": cola.capacidad},
+        status_code=503, headers={"Retry-After": str(REINTENTAR_EN)},
+    )
+
+
+def _fallo(excepcion):
+    """(código HTTP, mensaje). ValueError/KeyError: archivo con otro formato o almacén sin la ventana."""
+    codigo = 422 if isinstance(excepcion, (ValueError, KeyError)) else 500
+    return codigo, f"{type(excepcion).__name__}: {excepcion}"
+
+
+async def _recibir(request):
+    """Reserva un lugar en la cola, valida y lee la subida.
+
+    Devuelve (args de conciliar_subidas, None) con el lugar reservado para cola.enviar, o
+    (None, respuesta de error) con el lugar ya liberado.
+    """
+    cola = request.app.state.cola
+    if not cola.reservar():
+        return None, _ocupado(cola)
+    args, respuesta = None, None
+    try:
+        args, respuesta = await _leer(request)
+    finally:
+        if args is None:
+            cola.liberar()
+    return args, respuesta
+
+
+async def _leer(request):
+    # Sin Content-Length (chunked) no se puede aplicar el límite antes de leer el cuerpo
+    largo = request.headers.get("content-length")
+    if largo is None:
+        return None, JSONResponse({"error": "Falta Content-Length"}, status_code=411)
+    if not largo.strip().isdigit():
+        return None, JSONResponse({"error": "Content-Length inválido"}, status_code=400)
+    if int(largo) > MAX_SUBIDA:
+        return None, JSONResponse({"error": "Subida demasiado grande"}, status_code=413)
+
+    async with request.form(max_files=2, max_fields=5) as form:
+        banco, metabase = form.get("banco"), form.get("metabase")
+        if banco is None or isinstance(banco, str):
+            return None, JSONResponse({"error": "Falta el archivo 'banco'"}, status_code=400)
+        try:
+            margen = int(form.get("margen", 1))
+        except ValueError:
+            margen = -1
+        if margen < 0:
+            return None, JSONResponse({"error": "margen debe ser un entero no negativo"}, status_code=400)
+
+        datos_meta = nombre_meta = None
+        if metabase is not None and not isinstance(metabase, str):
+            datos_meta, nombre_meta = await metabase.read(), metabase.filename
+        return (await banco.read(), banco.filename, datos_meta, nombre_meta, margen), None
+
+
+async def conciliar(request):
+    args, respuesta = await _recibir(request)
+    if respuesta is not None:
+        return respuesta
+    cola = request.app.state.cola
+    trabajo = cola.enviar(*args)
+    try:
+        cuerpo = await asyncio.wrap_future(trabajo.futuro)
+    except Exception as excepcion:
+        codigo, mensaje = _fallo(excepcion)
+        return JSONResponse({"error": mensaje}, status_code=codigo)
+    finally:
+        cola.trabajos.pop(trabajo.id, None)
+    return Response(cuerpo, media_type="application/json")
+
+
+async def crear_trabajo(request):
+    args, respuesta = await _recibir(request)
+    if respuesta is not None:
+        return respuesta
+    trabajo = request.app.state.cola.enviar(*args)
+    return JSONResponse(
+        {"id": trabajo.id, "estado": trabajo.estado(), "url": f"/trabajos/{trabajo.id}"},
+        status_code=202, headers={"Location": f"/trabajos/{trabajo.id}"},
+    )
+
+
+async def ver_trabajo(request):
+    cola = request.app.state.cola
+    cola.purgar()
+    trabajo = cola.trabajos.get(request.path_params["id"])
+    if trabajo is None:
+        return JSONResponse({"error": "Trabajo desconocido o vencido"}, status_code=404)
+
+    estado = trabajo.estado()
+    if estado == "listo":
+        cuerpo = f'{{"id": "{trabajo.id}", "estado": "listo", "resultado": {trabajo.futuro.result()}}}'
+        return Response(cuerpo, media_type="application/json")
+    if estado == "error":
+        _, mensaje = _fallo(trabajo.futuro.exception())
+        return JSONResponse({"id": trabajo.id, "estado": estado, "error": mensaje})
+    return JSONResponse({"id": trabajo.id, "estado": estado})
+
+
+async def salud(request):
+    cola = request.app.state.cola
+    return JSONResponse({
+        "trabajadores": cola.trabajadores,
+        "pendientes": cola.pendientes(),
+        "recibiendo": cola.recibiendo,
+        "capacidad": cola.capacidad,
+        "trabajos": len(cola.trabajos),
+        "rechazados": cola.rechazados,
+    })
+
+
+def crear_app(trabajadores=TRABAJADORES, cola=COLA, ttl=TTL_TRABAJOS):
+    @asynccontextmanager
+    async def ciclo(app):
+        app.state.cola = Cola(trabajadores, cola, ttl)
+        try:
+            yield
+        finally:
+            app.state.cola.cerrar()
+
+    return Starlette(
+        routes=[
+            Route("/conciliar", conciliar, methods=["POST"]),
+            Route("/trabajos", crear_trabajo, methods=["POST"]),
+            Route("/trabajos/{id}", ver_trabajo, methods=["GET"]),
+            Route("/salud", salud, methods=["GET"]),
+        ],
+        lifespan=ciclo,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m conciliacion.servicio", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8600)
+    parser.add_argument("--trabajadores", type=int, default=TRABAJADORES, help="procesos para parseo y cruce")
+    parser.add_argument("--cola", type=int, default=COLA, help="trabajos en espera antes de responder 503")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    uvicorn.run(crear_app(args.trabajadores, args.cola), host=args.host, port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
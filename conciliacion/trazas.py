@@ -0,0 +1,386 @@
+"""Trazas por etapa: tiempo de pared, CPU, filas de entrada y salida y bytes procesados.
+
+    traza = Traza("cli")
+    with trazar(traza):
+        resultado = conciliar_archivos(...)
+    traza.escribir()        # una línea JSON por etapa en trazas/AAAA-MM-DD.jsonl
+
+El núcleo abre etapas con `with etapa("leer", archivo) as medicion:` sin saber si alguien está
+midiendo: fuera de trazar() etapa() no mide nada ni calcula tamaños. Las etapas anidadas se
+nombran con la ruta completa ("banco/leer", "cruce/psptin"). La CPU es la del hilo que corre la
+etapa (time.thread_time), así las sesiones que corren a la vez en el servidor no se mezclan.
+Los bytes son los de la entrada (archivo o frame en memoria, sin contar el contenido de los
+objetos Python); en "exportar", los del archivo escrito.
+
+Perfil de memoria (opcional, Traza(..., memoria=True) o CONCILIACION_PERFIL_MEMORIA=1): cada
+etapa agrega el RSS del proceso al cerrar, cuánto subió el pico de RSS mientras corría y el pico
+de asignaciones de Python y numpy (tracemalloc, que se enciende con la primera etapa medida,
+hace todo más lento mientras haya etapas abiertas y se apaga al cerrar la última). Además el
+núcleo registra sus frames intermedios con marco("dsn", dsn): memoria profunda y cuánta comparte
+con otros frames registrados que siguen vivos, para ver qué copias crean el cache y los filtros
+y cuáles siguen retenidas. tracemalloc y el RSS son del proceso: con exportaciones corriendo en
+otros hilos se mezclan.
+"""
+import contextvars
+import json
+import numbers
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+DIR_TRAZAS = Path(os.environ.get("CONCILIACION_TRAZAS", "trazas"))
+PERFIL_MEMORIA = os.environ.get("CONCILIACION_PERFIL_MEMORIA") == "1"
+# Etapas y frames registrados que se conservan por traza (una sesión de la app vive horas)
+MAX_REGISTROS = 2000
+MAX_MARCOS = 500
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_traza = contextvars.ContextVar("traza", default=None)
+_ruta = contextvars.ContextVar("ruta_etapa", default="")
+_medicion = contextvars.ContextVar("medicion", default=None)
+
+
+def tamano(objeto):
+    """Bytes de un archivo abierto, una ruta, bytes o un frame de pandas; None si no se sabe."""
+    if objeto is None:
+        return None
+    if isinstance(objeto, (bytes, bytearray, memoryview)):
+        return len(objeto)
+    if isinstance(objeto, (str, os.PathLike)):
+        return os.path.getsize(objeto)
+    if hasattr(objeto, "memory_usage"):
+        uso = objeto.memory_usage(index=True, deep=False)
+        return int(uso.sum()) if hasattr(uso, "sum") else int(uso)
+    if hasattr(objeto, "seek") and hasattr(objeto, "tell"):
+        posicion = objeto.tell()
+        objeto.seek(0, os.SEEK_END)
+        total = objeto.tell()
+        objeto.seek(posicion)
+        return total
+    return None
+
+
+def _filas(valor):
+    if valor is None or isinstance(valor, numbers.Integral):
+        return None if valor is None else int(valor)
+    if hasattr(valor, "memory_usage") or isinstance(valor, (list, tuple)):
+        return len(valor)
+    return None
+
+
+# =================================================
+# MEMORIA
+# =================================================
+MB = 1024 ** 2
+
+
+def rss_actual():
+    """RSS del proceso en bytes (Linux); None donde no hay /proc."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def rss_pico():
+    """Pico de RSS del proceso desde que arrancó, en bytes; None si no se puede saber."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _buffers(df):
+    """{dirección: bytes} de los buffers de datos de las columnas (numpy o Arrow)."""
+    import numpy as np
+
+    buffers = {}
+    for _, serie in df.items():
+        arreglo = serie.array
+        if hasattr(arreglo, "__arrow_array__"):
+            datos = arreglo.__arrow_array__()
+            for trozo in getattr(datos, "chunks", [datos]):
+                for buffer in trozo.buffers():
+                    if buffer is not None and buffer.size:
+                        buffers[buffer.address] = buffer.size
+        else:
+            valores = np.asarray(arreglo)
+            if valores.nbytes:
+                buffers[valores.__array_interface__["data"][0]] = valores.nbytes
+    return buffers
+
+
+def _mb(valor):
+    return None if valor is None else round(valor / MB, 1)
+
+
+# Etapas con perfil de memoria abiertas en el proceso; tracemalloc se apaga al cerrar la última
+# si lo encendió este módulo (si ya estaba encendido, es de otro y se deja como estaba)
+_perfiladas = 0
+_encendido_aqui = False
+_candado_memoria = threading.Lock()
+
+
+class Medicion:
+    """Lo que la etapa informa mientras corre: filas de salida y, si hace falta, los bytes."""
+
+    def __init__(self, entrada=None):
+        self.filas_entrada = _filas(entrada)
+        self.filas_salida = None
+        self.bytes = tamano(entrada)
+        self._pico_python = 0
+
+    def salida(self, valor):
+        """valor: un frame, una lista o directamente la cantidad de filas."""
+        self.filas_salida = _filas(valor)
+
+    def _abrir_memoria(self, padre):
+        global _perfiladas, _encendido_aqui
+        with _candado_memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _encendido_aqui = True
+            _perfiladas += 1
+        actual, pico = tracemalloc.get_traced_memory()
+        # El pico hasta acá es del padre: se le anota antes de reiniciarlo para esta etapa
+        if padre is not None:
+            padre._pico_python = max(padre._pico_python, pico)
+        tracemalloc.reset_peak()
+        self._python_inicio = self._pico_python = actual
+        self._rss_pico_inicio = rss_pico()
+
+    def _cerrar_memoria(self, padre):
+        global _perfiladas, _encendido_aqui
+        actual, pico = tracemalloc.get_traced_memory()
+        with _candado_memoria:
+            _perfiladas -= 1
+            if _perfiladas == 0 and _encendido_aqui:
+                tracemalloc.stop()
+                _encendido_aqui = False
+        self._pico_python = max(self._pico_python, pico)
+        if padre is not None:
+            padre._pico_python = max(padre._pico_python, self._pico_python)
+        rss_pico_fin = rss_pico()
+        return {
+            "rss_mb": _mb(rss_actual()),
+            "rss_pico_mb": _mb(rss_pico_fin),
+            "rss_pico_subio_mb": _mb(None if rss_pico_fin is None else rss_pico_fin - self._rss_pico_inicio),
+            "python_pico_mb": _mb(self._pico_python - self._python_inicio),
+            "python_neto_mb": _mb(actual - self._python_inicio),
+        }
+
+
+class _SinMedicion:
+    filas_entrada = filas_salida = bytes = None
+
+    def salida(self, valor):
+        pass
+
+    def __setattr__(self, nombre, valor):
+        pass
+
+
+_SIN_MEDICION = _SinMedicion()
+
+
+class Traza:
+    """Registros de etapas de una corrida (o de una sesión de la app)."""
+
+    def __init__(self, origen, memoria=PERFIL_MEMORIA):
+        self.id = uuid.uuid4().hex[:12]
+        self.origen = origen
+        self.memoria = memoria
+        self.registros = []
+        self.marcos = []
+        self._vivos = []
+        # Registros descartados del principio: los índices de _reservar cuentan desde la traza entera
+        self._descartados = 0
+        self._escritos = 0
+        self._marcos_escritos = 0
+        self._candado = threading.Lock()
+
+    def _reservar(self):
+        # Las exportaciones abren etapas desde otros hilos sobre la misma traza
+        with self._candado:
+            self.registros.append(None)
+            return self._descartados + len(self.registros) - 1
+
+    def _completar(self, indice, registro):
+        with self._candado:
+            self.registros[indice - self._descartados] = registro
+            # Se descartan los más viejos ya cerrados; una etapa abierta (None) frena el recorte
+            sobran = 0
+            while len(self.registros) - sobran > MAX_REGISTROS and self.registros[sobran] is not None:
+                sobran += 1
+            if sobran:
+                del self.registros[:sobran]
+                self._descartados += sobran
+                self._escritos = max(0, self._escritos - sobran)
+
+    def correr(self, funcion, *args, **kwargs):
+        """Llama a funcion con esta traza activa (para hilos de un pool, que no heredan el contexto)."""
+        with trazar(self):
+            return funcion(*args, **kwargs)
+
+    def _registrar_marco(self, nombre, df, ruta):
+        propios = _buffers(df)
+        with self._candado:
+            self._vivos = [(r, n, b) for r, n, b in self._vivos if r() is not None]
+            comparte, con = 0, []
+            for _, otro, buffers in self._vivos:
+                comunes = sum(propios[direccion] for direccion in propios.keys() & buffers.keys())
+                if comunes:
+                    comparte += comunes
+                    con.append(otro)
+            self._vivos.append((weakref.ref(df), nombre, propios))
+            self.marcos.append({
+                "traza": self.id,
+                "origen": self.origen,
+                "etapa": ruta,
+                "marco": nombre,
+                "momento": datetime.now().isoformat(timespec="milliseconds"),
+                "filas": len(df),
+                "columnas": df.shape[1],
+                "profundo_mb": _mb(int(df.memory_usage(index=True, deep=True).sum())),
+                # Lo que comparte con frames vivos no es memoria nueva (copias superficiales, vistas)
+                "comparte_mb": _mb(min(comparte, sum(propios.values()))),
+                "comparte_con": ", ".join(dict.fromkeys(con)),
+                "rss_mb": _mb(rss_actual()),
+                "_ref": weakref.ref(df),
+            })
+            sobran = len(self.marcos) - MAX_MARCOS
+            if sobran > 0:
+                del self.marcos[:sobran]
+                self._marcos_escritos = max(0, self._marcos_escritos - sobran)
+
+    def escribir(self, carpeta=DIR_TRAZAS):
+        """Agrega los registros aún no escritos al JSON lines del día; devuelve la ruta.
+
+        Los frames del perfil de memoria van a <fecha>-marcos.jsonl en la misma carpeta.
+        """
+        ruta = Path(carpeta) / f"{datetime.now():%Y-%m-%d}.jsonl"
+        # Solo las etapas ya cerradas: una abierta guarda su lugar con None. Se marcan como
+        # escritas antes de soltar el candado, así un recorte en otro hilo no desplaza la cuenta
+        with self._candado:
+            pendientes = []
+            for registro in self.registros[self._escritos:]:
+                if registro is None:
+                    break
+                pendientes.append(registro)
+            marcos = [
+                {campo: valor for campo, valor in marco.items() if campo != "_ref"}
+                for marco in self.marcos[self._marcos_escritos:]
+            ]
+            self._escritos += len(pendientes)
+            self._marcos_escritos += len(marcos)
+        for destino, lineas in ((ruta, pendientes), (ruta.with_name(f"{ruta.stem}-marcos.jsonl"), marcos)):
+            if lineas:
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                with open(destino, "a", encoding="utf-8") as archivo:
+                    for registro in lineas:
+                        archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        return ruta
+
+    def tabla(self):
+        """Registros como DataFrame, con filas/s y MB/s calculados."""
+        import pandas as pd
+
+        df = pd.DataFrame([r for r in self.registros if r is not None], columns=[
+            "etapa", "inicio", "segundos", "cpu", "filas_entrada", "filas_salida", "bytes",
+        ])
+        df = df.astype({"filas_entrada": "Int64", "filas_salida": "Int64", "bytes": "Int64"})
+        segundos = df["segundos"].where(df["segundos"] > 0)
+        df["filas/s"] = (df["filas_entrada"].fillna(df["filas_salida"]) / segundos).round(0).astype("Int64")
+        df["MB/s"] = (df["bytes"] / 1024 ** 2 / segundos).round(1)
+        memoria = [
+            campo for campo in ("rss_mb", "rss_pico_mb", "rss_pico_subio_mb", "python_pico_mb", "python_neto_mb")
+            if any(r is not None and campo in r for r in self.registros)
+        ]
+        if memoria:
+            df = df.join(pd.DataFrame(
+                [{campo: r.get(campo) for campo in memoria} for r in self.registros if r is not None],
+                columns=memoria,
+            ))
+        return df
+
+    def tabla_marcos(self):
+        """Frames registrados con marco(), con "vivo" si todavía hay referencias a ellos."""
+        import pandas as pd
+
+        columnas = ["etapa", "marco", "momento", "filas", "columnas", "profundo_mb", "comparte_mb", "comparte_con"]
+        with self._candado:
+            filas = [{**{c: m[c] for c in columnas}, "vivo": m["_ref"]() is not None} for m in self.marcos]
+        return pd.DataFrame(filas, columns=columnas + ["vivo"])
+
+
+@contextmanager
+def trazar(traza):
+    """Activa traza para las etapas que se abran dentro del bloque (en este hilo)."""
+    token = _traza.set(traza)
+    token_ruta = _ruta.set("")
+    token_medicion = _medicion.set(None)
+    try:
+        yield traza
+    finally:
+        _medicion.reset(token_medicion)
+        _ruta.reset(token_ruta)
+        _traza.reset(token)
+
+
+@contextmanager
+def etapa(nombre, entrada=None):
+    """Mide el bloque si hay una traza activa. entrada: archivo, ruta o frame que procesa."""
+    traza = _traza.get()
+    if traza is None:
+        yield _SIN_MEDICION
+        return
+
+    ruta = f"{_ruta.get()}{nombre}"
+    token = _ruta.set(f"{ruta}/")
+    medicion = Medicion(entrada)
+    padre = _medicion.get()
+    token_medicion = _medicion.set(medicion)
+    memoria = traza.memoria
+    if memoria:
+        medicion._abrir_memoria(padre)
+    # El lugar se reserva al abrir, así la etapa queda antes que sus subetapas
+    indice = traza._reservar()
+    inicio = time.time()
+    pared, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield medicion
+    finally:
+        segundos, cpu = time.perf_counter() - pared, time.thread_time() - cpu
+        _medicion.reset(token_medicion)
+        _ruta.reset(token)
+        memoria = medicion._cerrar_memoria(padre) if memoria else {}
+        traza._completar(indice, {
+            "traza": traza.id,
+            "origen": traza.origen,
+            "etapa": ruta,
+            "inicio": datetime.fromtimestamp(inicio).isoformat(timespec="milliseconds"),
+            "segundos": round(segundos, 6),
+            "cpu": round(cpu, 6),
+            "filas_entrada": medicion.filas_entrada,
+            "filas_salida": medicion.filas_salida,
+            "bytes": medicion.bytes,
+            **memoria,
+        })
+
+
+def marco(nombre, df):
+    """Registra un frame intermedio en el perfil de memoria; sin perfil activo no hace nada."""
+    traza = _traza.get()
+    if traza is None or not traza.memoria or not hasattr(df, "memory_usage"):
+        return
+    traza._registrar_marco(nombre, df, _ruta.get().rstrip("/"))
@@ -0,0 +1,330 @@
+"""Vigilante de carpeta: concilia los EECC a medida que los bancos los dejan, sin subirlos a mano.
+
+    python -m conciliacion.vigilante entrada/ -o conciliaciones/
+    python -m conciliacion.vigilante entrada/ -o conciliaciones/ --una-vez     # para cron
+
+Cada archivo nuevo (.txt CREP, .xlsx BCP o BBVA) se procesa recién cuando su tamaño y fecha
+de modificación dejan de cambiar por --quieto segundos, así no se lee a medio copiar. Solo se
+miran esas extensiones: las copias en curso (.part, .tmp, .filepart) se ignoran hasta que se
+renombran. El parseo corre en un pool de procesos, varios archivos a la vez.
+
+El estado del día se arma por día de llegada y formato. Guarda las filas acumuladas de todos
+los archivos del día, sin PSP_TIN repetidos. Tras cada archivo, y cada vez que se importa un
+Metabase nuevo al almacén, se vuelve a cruzar contra el último snapshot; un cruce que falla se
+registra en el log y se reintenta en la vuelta siguiente. El resultado queda en
+conciliaciones/<día>/<formato>/: DSN, PSD, cruzados y resumen.json. Los archivos ya
+procesados se recuerdan en procesados.json para no releerlos al reiniciar.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+EXTENSIONES = {".txt", ".xlsx", ".xls"}
+INTERVALO = float(os.environ.get("CONCILIACION_VIGILANTE_INTERVALO", 2))
+QUIETO = float(os.environ.get("CONCILIACION_VIGILANTE_QUIETO", 5))
+
+log = logging.getLogger("conciliacion.vigilante")
+
+
+# =================================================
+# CARGA (corre en los procesos del pool)
+# =================================================
+def _calentar():
+    import conciliacion.cargadores  # noqa: F401
+
+
+def cargar_archivo(ruta):
+    """Detecta el formato y carga el EECC; devuelve (formato, df, sin_psptin, descartados)."""
+    from conciliacion.cargadores import CARGADORES, detectar_formato
+
+    with open(ruta, "rb") as archivo:
+        formato = detectar_formato(archivo)
+        df, _, sin_psptin, descartados = CARGADORES[formato](archivo)
+    return formato, df, sin_psptin, descartados
+
+
+# =================================================
+# ARCHIVOS LISTOS (debounce de escrituras parciales)
+# =================================================
+def _firma(ruta):
+    estado = ruta.stat()
+    return f"{ruta.name}|{estado.st_size}|{estado.st_mtime_ns}"
+
+
+class Llegadas:
+    """Recuerda la firma de cada archivo y lo da por completo cuando queda quieto."""
+
+    def __init__(self, quieto=QUIETO):
+        self.quieto = quieto
+        self._vistos = {}
+
+    def candidatos(self, carpeta):
+        for ruta in sorted(Path(carpeta).iterdir()):
+            nombre = ruta.name.lower()
+            if ruta.suffix.lower() not in EXTENSIONES or nombre.startswith((".", "~$")):
+                continue
+            if ruta.is_file():
+                yield ruta
+
+    def listos(self, carpeta, descartar):
+        """Archivos quietos por self.quieto segundos cuya firma no está en descartar.
+
+        Devuelve (listos, esperando): esperando cuenta los que aún pueden estar copiándose.
+        """
+        ahora = time.monotonic()
+        listos, esperando = [], 0
+        presentes = set()
+        for ruta in self.candidatos(carpeta):
+            presentes.add(ruta)
+            try:
+                firma = _firma(ruta)
+            except OSError:
+                continue
+            if firma in descartar:
+                continue
+            anterior = self._vistos.get(ruta)
+            if anterior is None or anterior[0] != firma:
+                self._vistos[ruta] = (firma, ahora)
+                esperando += 1
+            elif ahora - anterior[1] >= self.quieto:
+                listos.append((ruta, firma))
+            else:
+                esperando += 1
+        # Los que ya no están (movidos o borrados) no se recuerdan más
+        for ruta in self._vistos.keys() - presentes:
+            del self._vistos[ruta]
+        return listos, esperando
+
+
+# =================================================
+# ESTADO DEL DÍA
+# =================================================
+class EstadoDia:
+    """Filas acumuladas de los archivos de un día y formato."""
+
+    def __init__(self, formato):
+        self.formato = formato
+        self.df = None
+        self.sin_psptin = None
+        self.descartados = None
+        self.archivos = []
+
+    def agregar(self, df, sin_psptin, descartados, archivo):
+        import pandas as pd
+
+        if self.df is None:
+            self.df, self.sin_psptin, self.descartados = df, sin_psptin, descartados
+        else:
+            # Un archivo reenviado o solapado no duplica PSP_TIN ni depósitos
+            self.df = pd.concat([self.df, df], ignore_index=True).drop_duplicates(subset="PSP_TIN")
+            self.sin_psptin = pd.concat([self.sin_psptin, sin_psptin], ignore_index=True).drop_duplicates()
+            self.descartados = pd.concat([self.descartados, descartados], ignore_index=True).drop_duplicates()
+        self.archivos.append(archivo)
+
+    def banco(self):
+        """Dict con la forma de cargadores.cargar_banco, para el cruce y el resumen."""
+        from conciliacion.cargadores import FORMATOS
+
+        banco, descripcion = FORMATOS[self.formato]
+        return {
+            "df": self.df, "es_crep": self.formato == "crep", "sin_psptin": self.sin_psptin,
+            "descartados": self.descartados, "banco": banco, "formato": descripcion,
+            "hora_corte": self.df["FechaHora"].max() if self.formato == "crep" else None,
+        }
+
+
+def _escribir_atomico(ruta, escribir):
+    temporal = ruta.with_name(ruta.name + ".tmp")
+    with open(temporal, "wb") as destino:
+        escribir(destino)
+    temporal.replace(ruta)
+
+
+class Vigilante:
+    def __init__(self, entrada, salida, almacen=None, margen_dias=1, formato_salida="parquet",
+                 trabajadores=2, quieto=QUIETO):
+        from conciliacion import almacen as modulo_almacen
+
+        self.entrada = Path(entrada)
+        self.salida = Path(salida)
+        self.almacen = Path(almacen) if almacen is not None else modulo_almacen.DIR_SNAPSHOTS
+        self.margen_dias = margen_dias
+        self.formato_salida = formato_salida
+        self.llegadas = Llegadas(quieto)
+        self.pool = ProcessPoolExecutor(
+            max_workers=trabajadores, mp_context=multiprocessing.get_context("spawn"), initializer=_calentar
+        )
+        self.en_curso = {}
+        self.estados = {}
+        # Claves cuyo último cruce falló: se reintentan en la vuelta siguiente
+        self.sucias = set()
+        self.salida.mkdir(parents=True, exist_ok=True)
+        self._ruta_procesados = self.salida / "procesados.json"
+        self.procesados = json.loads(self._ruta_procesados.read_text()) if self._ruta_procesados.exists() else {}
+        self.version = modulo_almacen.version_snapshot(self.almacen)
+
+    def _carpeta(self, clave):
+        dia, formato = clave
+        return self.salida / dia / formato
+
+    def _estado(self, clave):
+        if clave not in self.estados:
+            estado = EstadoDia(clave[1])
+            ruta = self._carpeta(clave) / "estado.pkl"
+            if ruta.exists():
+                # Se guardan los atributos y no la instancia: el pickle no depende de cómo se lanzó el módulo
+                with open(ruta, "rb") as f:
+                    vars(estado).update(pickle.load(f))
+            self.estados[clave] = estado
+        return self.estados[clave]
+
+    def _guardar_procesados(self):
+        _escribir_atomico(
+            self._ruta_procesados, lambda f: f.write(json.dumps(self.procesados, ensure_ascii=False, indent=1).encode())
+        )
+
+    def enviar_listos(self):
+        """Manda al pool los archivos completos; devuelve cuántos pueden estar copiándose aún."""
+        ocupados = set(self.procesados) | {firma for firma, _ in self.en_curso.values()}
+        listos, esperando = self.llegadas.listos(self.entrada, ocupados)
+        for ruta, firma in listos:
+            dia = date.fromtimestamp(ruta.stat().st_mtime).isoformat()
+            self.en_curso[self.pool.submit(cargar_archivo, ruta)] = (firma, dia)
+            log.info("Procesando %s", ruta.name)
+        return esperando
+
+    def recoger(self):
+        """Suma al estado del día los archivos ya cargados; devuelve las claves a recruzar."""
+        sucias = set()
+        terminados = False
+        for futuro in [f for f in self.en_curso if f.done()]:
+            firma, dia = self.en_curso.pop(futuro)
+            terminados = True
+            nombre = firma.split("|", 1)[0]
+            try:
+                formato, df, sin_psptin, descartados = futuro.result()
+            except Exception as error:
+                # No se reintenta hasta que el archivo cambie (otra firma)
+                log.error("No se pudo cargar %s: %s: %s", nombre, type(error).__name__, error)
+                self.procesados[firma] = {"archivo": nombre, "dia": dia, "error": f"{type(error).__name__}: {error}"}
+                continue
+
+            clave = (dia, formato)
+            estado = self._estado(clave)
+            estado.agregar(df, sin_psptin, descartados, nombre)
+            carpeta = self._carpeta(clave)
+            carpeta.mkdir(parents=True, exist_ok=True)
+            _escribir_atomico(
+                carpeta / "estado.pkl", lambda f: pickle.dump(vars(estado), f, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+            self.procesados[firma] = {"archivo": nombre, "dia": dia, "formato": formato, "filas": len(df)}
+            sucias.add(clave)
+
+        if terminados:
+            self._guardar_procesados()
+        return sucias
+
+    def metabase_nuevo(self):
+        from conciliacion.almacen import version_snapshot
+
+        version = version_snapshot(self.almacen)
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+    def cruzar(self, clave):
+        """Cruza el estado acumulado contra el último snapshot y reescribe las salidas del día."""
+        from conciliacion.almacen import leer_snapshot
+        from conciliacion.cargadores import ventana_banco
+        from conciliacion.cruce import conciliar_pandas
+        from conciliacion.exportar import ESCRITORES
+        from conciliacion.reporte import resumen_conciliacion
+
+        banco = self._estado(clave).banco()
+        desde, hasta = ventana_banco(banco["df"], banco["sin_psptin"], self.margen_dias)
+        df_meta = leer_snapshot(desde, hasta, self.almacen)
+        if df_meta.empty:
+            log.warning("%s %s: el almacén no tiene Metabase para las fechas del EECC", *clave)
+            return
+
+        df_meta_filtrado, dsn, psd, cruzados = conciliar_pandas(banco["df"], banco["sin_psptin"], df_meta, banco["banco"])
+        carpeta = self._carpeta(clave)
+        for nombre, df in (("DSN", dsn), ("PSD", psd), ("Cruzados", cruzados)):
+            _escribir_atomico(
+                carpeta / f"{nombre}.{self.formato_salida}", lambda f, df=df: ESCRITORES[self.formato_salida](df, f)
+            )
+        resumen = resumen_conciliacion(banco, desde, hasta, df_meta_filtrado, dsn, psd, cruzados)
+        resumen["Archivos"] = ", ".join(self._estado(clave).archivos)
+        _escribir_atomico(
+            carpeta / "resumen.json",
+            lambda f: f.write(json.dumps(resumen, default=str, ensure_ascii=False, indent=1).encode()),
+        )
+        log.info("%s %s: DSN %s · PSD %s · cruzados %s", *clave, len(dsn), len(psd), len(cruzados))
+
+    def paso(self):
+        """Una vuelta del ciclo; devuelve True si queda trabajo pendiente."""
+        esperando = self.enviar_listos()
+        sucias = self.recoger()
+        if self.metabase_nuevo():
+            hoy = date.today().isoformat()
+            sucias |= set(self.estados) | {(hoy, ruta.parent.name) for ruta in (self.salida / hoy).glob("*/estado.pkl")}
+            log.info("Metabase nuevo en el almacén: se recruzan %d estados", len(sucias))
+        self.sucias |= sucias
+        for clave in sorted(self.sucias):
+            try:
+                self.cruzar(clave)
+            except Exception:
+                # Un día o banco con problemas no detiene al resto: queda sucio y se reintenta
+                log.exception("%s %s: no se pudo cruzar, se reintenta en la próxima vuelta", *clave)
+                continue
+            self.sucias.discard(clave)
+        return bool(esperando or self.en_curso)
+
+    def vigilar(self, intervalo=INTERVALO, una_vez=False):
+        try:
+            while self.paso() or not una_vez:
+                time.sleep(intervalo)
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m conciliacion.vigilante", description=__doc__.splitlines()[0])
+    parser.add_argument("entrada", type=Path, help="carpeta donde los bancos dejan los EECC")
+    parser.add_argument("-o", "--salida", type=Path, default=Path("conciliaciones"))
+    parser.add_argument("--almacen", type=Path, help="almacén de Metabase (por defecto CONCILIACION_SNAPSHOTS)")
+    parser.add_argument("--margen", type=int, default=1, help="margen de fechas para Metabase en días")
+    parser.add_argument("--formato", choices=["parquet", "csv", "xlsx"], default="parquet", help="formato de DSN y PSD")
+    parser.add_argument("--trabajadores", type=int, default=2, help="archivos cargándose a la vez")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO, help="segundos entre revisiones de la carpeta")
+    parser.add_argument("--quieto", type=float, default=QUIETO, help="segundos sin cambios para dar un archivo por completo")
+    parser.add_argument("--una-vez", action="store_true", help="procesa lo que haya y termina")
+    args = parser.parse_args(argv)
+    if not args.entrada.is_dir():
+        parser.error(f"no existe la carpeta {args.entrada}")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    vigilante = Vigilante(
+        args.entrada, args.salida, args.almacen, args.margen, args.formato, args.trabajadores, args.quieto
+    )
+    log.info("Vigilando %s", args.entrada)
+    # SIGTERM (systemd, docker stop) sale por el finally de vigilar y cierra el pool
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        vigilante.vigilar(args.intervalo, args.una_vez)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()